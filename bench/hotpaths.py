@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+import os, sys, json, time, random, argparse, resource, subprocess, tempfile, shutil, types, logging
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+root = os.path.join(bench_dir, '..')
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'docker/bin/ci'))
+fake_unity = os.path.join(bench_dir, 'fake_unity.py')
+baseline_fp = os.path.join(bench_dir, 'baseline.json')
+
+# Lines like those which make up most of a Unity log.
+log_lines = [
+    'Refreshing native plugins compatible for Editor in {ms:.2f} ms, found {n} plugins.',
+    'UnityEngine.Debug:Log (object)',
+    'UnityEditor.AssetDatabase:Refresh (UnityEditor.ImportAssetOptions)',
+    'Start importing Assets/Art/Textures/tex_{n}.png using Guid({guid}) Importer(-1,00000000000000000000000000000000)',
+    '-> (artifact id: \'{guid}\') in {s:.3f} seconds',
+    'Shader \'Custom/Effect_{n}\' uses {n} keywords; compiling variant {n} of pass \'ForwardBase\'',
+    'Compiling shader "Standard" pass "FORWARD" (fp) - {n} variants',
+    'Refresh completed in {s:.3f} seconds.',
+    'Asset Pipeline Refresh: Total: {s:.3f} seconds - Initiated by RefreshV2(NoUpdateAssetOptions)',
+    '[Build] Building scene Assets/Scenes/Level_{n}.unity',
+    '(Filename: ./Runtime/Export/Debug/Debug.bindings.h Line: {n})',
+    '',
+]
+
+exception_block = ['NullReferenceException: Object reference not set to an instance of an object',
+    '  at Editor.UnityCI.BuildApp.PreProcess (UnityEditor.BuildTarget bt) [0x00012] in BuildApp.cs:104',
+    '  at Editor.UnityCI.BuildApp.Build () [0x00080] in BuildApp.cs:58',
+    '  at Editor.UnityCI.Build.Compile () [0x0000f] in Build.cs:10', '']
+
+# Write a synthetic Unity log of about size bytes, with an exception block part-way (at the fraction exception_at).
+def _write_log(fp, size, exception_at = 0.9):
+    rnd = random.Random(size)
+    block = []
+    for i in range(20000):
+        line = rnd.choice(log_lines)
+        block.append(line.format(ms=rnd.random() * 100, n=rnd.randint(0, 99999), s=rnd.random() * 10,
+            guid='%032x' % rnd.getrandbits(128)))
+    block = '\n'.join(block) + '\n'
+    written = 0
+    thrown = False
+    with open(fp, 'w') as f:
+        while written < size:
+            if not thrown and written >= size * exception_at:
+                f.write('\n'.join(exception_block) + '\n')
+                thrown = True
+            f.write(block)
+            written += len(block)
+
+# Write a fake player: one big (already-compressed) data file, plus many small and medium compressible files.
+def _write_tree(d, size):
+    rnd = random.Random(size)
+    os.makedirs(os.path.join(d, 'Data', 'Managed'), exist_ok=True)
+    os.makedirs(os.path.join(d, 'Data', 'StreamingAssets'), exist_ok=True)
+    with open(os.path.join(d, 'Data', 'data.unity3d'), 'wb') as f:
+        for i in range(int(size * 0.4) >> 20): f.write(os.urandom(1 << 20))
+    text = ''.join(rnd.choice(log_lines) for i in range(2000)).encode()
+    remaining = int(size * 0.6)
+    i = 0
+    while remaining > 0:
+        n = min(remaining, rnd.choice([4 << 10, 64 << 10, 1 << 20]))
+        sub = 'Managed' if i % 3 else 'StreamingAssets'
+        with open(os.path.join(d, 'Data', sub, f'file_{i}.{"dll" if i % 3 else "json"}'), 'wb') as f:
+            f.write((text * (n // len(text) + 1))[:n])
+        remaining -= n
+        i += 1
+
+# Write a releases feed (in the format of the Unity Hub's) with count releases per group.
+def _write_releases(fp, count):
+    releases = {}
+    for (g, group) in enumerate(['official', 'beta']):
+        releases[group] = [{
+            'version': f'{2017 + i // 1000}.{i // 100 % 10}.{i % 100}{"b" if g else "f"}1',
+            'downloadUrl': f'https://download.unity3d.com/download_unity/{i:012x}/LinuxEditorInstaller/Unity.tar.xz',
+            'downloadSize': 1 << 30,
+            'checksum': '%032x' % i,
+            'modules': [{'id': m, 'name': m, 'downloadUrl': f'https://download.unity3d.com/{i:012x}/{m}.tar.xz',
+                'downloadSize': 1 << 28, 'checksum': '%032x' % i} for m in ['android', 'ios', 'webgl', 'windows']]
+        } for i in range(count)]
+    with open(fp, 'w') as f: json.dump(releases, f)
+
+# Create the fixtures in d, unless they were already created with the same parameters.
+def fixtures(d, params):
+    fp = os.path.join(d, 'params.json')
+    if os.path.isfile(fp):
+        with open(fp) as f:
+            if json.load(f) == params: return
+    if os.path.isdir(d): shutil.rmtree(d)
+    os.makedirs(os.path.join(d, 'project', 'bin'))
+    print(f'Writing fixtures to {d}...', flush=True)
+    _write_log(os.path.join(d, 'unity.log'), params['log_mb'] << 20)
+    _write_log(os.path.join(d, 'exception.log'), params['exception_log_mb'] << 20)
+    _write_tree(os.path.join(d, 'player'), params['tree_mb'] << 20)
+    _write_releases(os.path.join(d, 'releases.json'), params['releases'])
+    os.makedirs(os.path.join(d, 'docker'))
+    for fn in os.listdir(os.path.join(root, 'docker')):
+        if fn.endswith('.Dockerfile'): shutil.copy(os.path.join(root, 'docker', fn), os.path.join(d, 'docker'))
+    with open(fp, 'w') as f: json.dump(params, f)
+
+def _unity(unity_exe = ''):
+    from maker.unity import Unity
+    opts = types.SimpleNamespace(unity_exe=unity_exe, unity_func='Editor.UnityCI.Build.Compile')
+    return Unity(make=types.SimpleNamespace(opts=opts))
+
+# Each case exercises one hot path against the fixtures in d.
+def case_unity_exception(d):
+    _unity()._get_unity_exception(os.path.join(d, 'exception.log'), None, None)
+
+def case_log_index(d):
+    from maker.logindex import LogIndex
+    LogIndex.scan(os.path.join(d, 'unity.log'))
+
+def case_log_tail(d):
+    os.environ['BENCH_LOG'] = os.path.join(d, 'unity.log')
+    out = tempfile.mkdtemp(dir=d)
+    try:
+        _unity(f'{sys.executable} {fake_unity}')._unity_exec(os.path.join(d, 'project'), out)
+    finally:
+        shutil.rmtree(out)
+
+def case_releases(d):
+    import build
+    with open(os.path.join(d, 'releases.json')) as f: build.parse_releases(json.load(f))
+
+def case_dockerfile(d):
+    import build
+    os.chdir(d)
+    for i in range(100):
+        for c in build.component_map: build._write_dockerfile(c, 'inzania/unity3d-buildkite:2019.3.0f1-base')
+
+def _package(d, fmt):
+    from maker.packager import Packager
+    dst = os.path.join(d, f'player.{fmt}')
+    try:
+        Packager().package(fmt, d, ['player'], dst, os.path.join(d, 'manifest.json'))
+    finally:
+        if os.path.isfile(dst): os.remove(dst)
+
+def case_package_zip(d):
+    _package(d, 'zip')
+
+def case_package_tar_zst(d):
+    _package(d, 'tar.zst')
+
+cases = dict([(n[5:], f) for (n, f) in sorted(globals().items()) if n.startswith('case_')])
+
+# The peak memory of this process. ru_maxrss carries over the parent's peak across fork & exec on Linux, so the
+# high-water mark of this process' own address space is used where there is one.
+def _peak_mb():
+    if os.path.isfile('/proc/self/status'):
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'): return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1 << 20 if sys.platform == 'darwin' else 1024)
+
+# Run a case in a fresh interpreter, so its peak memory is its own. Returns the seconds & peak MB (or None).
+def _run(name, d, timeout):
+    cmd = [sys.executable, os.path.abspath(__file__), '--run', name, '--fixtures', d]
+    try:
+        res = subprocess.run(cmd, check=False, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return None
+    if res.returncode != 0:
+        print(res.stderr, file=sys.stderr)
+        return None
+    return json.loads(res.stdout.strip().split('\n')[-1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fixtures', default=os.path.join(tempfile.gettempdir(), 'unity3d-buildkite-bench'),
+        help='Where the fixtures are written (and kept, to be reused)')
+    parser.add_argument('--log_mb', type=int, default=256, help='The size of the Unity log to stream')
+    parser.add_argument('--exception_log_mb', type=int, default=8, help='The size of the log to find the exception in')
+    parser.add_argument('--tree_mb', type=int, default=256, help='The size of the player to package')
+    parser.add_argument('--releases', type=int, default=20000, help='How many releases per group in the feed')
+    parser.add_argument('--cases', default=','.join(cases), help='Comma-separated cases to run')
+    parser.add_argument('--runs', '-n', type=int, default=3, help='How many times to run each case (the fastest counts)')
+    parser.add_argument('--timeout', type=float, default=600, help='Seconds before a run counts as a failure')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='The slow-down (or growth) allowed vs. the baseline')
+    parser.add_argument('--baseline', default=baseline_fp, help='The stored results to compare against')
+    parser.add_argument('--update', action='store_true', help='Store these results as the new baseline')
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    opts = parser.parse_args()
+
+    if opts.run:
+        logging.disable(logging.CRITICAL)
+        start = time.time()
+        cases[opts.run](opts.fixtures)
+        secs = time.time() - start
+        peak = _peak_mb()
+        print(json.dumps({'seconds': secs, 'peak_mb': peak}))
+        exit(0)
+
+    params = {'log_mb': opts.log_mb, 'exception_log_mb': opts.exception_log_mb, 'tree_mb': opts.tree_mb,
+        'releases': opts.releases}
+    fixtures(opts.fixtures, params)
+    baseline = {}
+    if os.path.isfile(opts.baseline):
+        with open(opts.baseline) as f: baseline = json.load(f)
+    if baseline and baseline.get('params') != params:
+        print(f'The baseline was recorded with {baseline.get("params")}; not comparing.')
+        baseline = {}
+
+    results = {}
+    failed = []
+    print(f'{"case":<20} {"seconds":>10} {"peak":>10} {"baseline":>20}  status')
+    for name in opts.cases.split(','):
+        runs = [_run(name, opts.fixtures, opts.timeout) for i in range(opts.runs)]
+        if None in runs:
+            failed.append(name)
+            print(f'{name:<20} {"-":>10} {"-":>10} {"":>20}  FAILED (error or timeout)')
+            continue
+        r = {'seconds': min(x['seconds'] for x in runs), 'peak_mb': max(x['peak_mb'] for x in runs)}
+        results[name] = r
+        status = 'ok'
+        base = baseline.get('cases', {}).get(name)
+        if base:
+            # A little absolute slack, so that very fast cases do not fail on noise.
+            slow = r['seconds'] > base['seconds'] * (1 + opts.tolerance) + 0.05
+            big = r['peak_mb'] > base['peak_mb'] * (1 + opts.tolerance) + 5
+            if slow or big:
+                status = 'REGRESSED'
+                failed.append(name)
+        vs = f'{base["seconds"]:.2f}s {base["peak_mb"]:.0f}MB' if base else 'none'
+        print(f'{name:<20} {r["seconds"]:>9.2f}s {r["peak_mb"]:>8.0f}MB {vs:>20}  {status}', flush=True)
+
+    if opts.update:
+        cases_out = dict(baseline.get('cases', {}))
+        cases_out.update(results)
+        with open(opts.baseline, 'w') as f: json.dump({'params': params, 'cases': cases_out}, f, indent=2)
+        print(f'Stored the baseline in {opts.baseline}')
+    elif len(failed) > 0:
+        print(f'Regressions: {", ".join(failed)}')
+        exit(1)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+import os, sys, subprocess, argparse, statistics, tempfile, time
+
+make_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../docker/bin/ci/make.py')
+
+# Each case is a make.py command line which exercises startup, but does (next to) no work.
+def cases(store):
+    return {
+        'syntax': [],
+        'explicit': ['artifacts', 'list', '--store', store, '--commit', 'abc', '--version', '1.0.0'],
+        'git-defaults': ['artifacts', 'list', '--store', store],
+        'unity-syntax': ['unity'],
+    }
+
+# Run a command n times, returning the wall time of each run.
+def _time(cmd, n):
+    ret = []
+    for i in range(n):
+        start = time.time()
+        subprocess.run(cmd, check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        ret.append(time.time() - start)
+    return ret
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', '-n', type=int, default=20, help='How many times to run each case')
+    parser.add_argument('--python', default=sys.executable, help='The interpreter to run make.py with')
+    opts = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as store:
+        print(f'{"case":<16} {"min":>8} {"median":>8} {"max":>8}')
+        for (name, args) in cases(store).items():
+            times = _time([opts.python, make_py] + args, opts.runs)
+            print(f'{name:<16} {min(times) * 1000:>6.1f}ms {statistics.median(times) * 1000:>6.1f}ms '
+                f'{max(times) * 1000:>6.1f}ms')
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
-import os, requests, yaml, subprocess, argparse, json, shutil
+import os, re, requests, yaml, subprocess, argparse, json, shutil, threading, time, hashlib, tempfile, functools
+import http.server
+from concurrent.futures import ThreadPoolExecutor
 
 component_map = {
     None: 'Unity',
@@ -12,26 +14,211 @@ component_map = {
     'facebook': 'Facebook-Games'
 }
 
+releases_url = 'https://public-cdn.cloud.unity3d.com/hub/prod/releases-linux.json'
+manifest_types = ['application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.docker.distribution.manifest.v2+json', 'application/vnd.oci.image.index.v1+json',
+    'application/vnd.oci.image.manifest.v1+json']
+
 # Determine the appropriate docker tag for a version+component
 def get_version_tag(version, component):
     tag = version
     if component and len(component) > 0: tag += '-' + component
     return tag
 
+# The channel tag of a version: latest for the newest official release (else its major version), beta or alpha
+def get_channel(version, groups, versions):
+    group = groups[version]
+    if group == 'official':
+        return 'latest' if version == versions['official'][len(versions['official'])-1] else version.split('.')[0]
+    if group == 'beta' and 'a' in version: return 'alpha'
+    return group
+
+# The version each channel should point at: latest, and each major version, at the newest official release (of
+# that major version); beta & alpha at the newest of each.
+def get_channels(versions):
+    channels = {}
+    for group in versions:
+        for v in versions[group]:
+            if group == 'official':
+                channels['latest'] = v
+                channels[v.split('.')[0]] = v
+            else:
+                channels['alpha' if group == 'beta' and 'a' in v else group] = v
+    return channels
+
+# The components in a comma-separated list, in which an empty entry is the plain (Linux) image; all of them if none
+# are given.
+def parse_components(s):
+    if not s: return list(component_map)
+    return [c if len(c) > 0 else None for c in s.split(',')]
+
 # Print a message wrapped with div-lines
 def _div(msg):
     print('-------------------------------------------')
     print(msg)
     print('-------------------------------------------')
 
-# Build new unity3d versions from scratch
-def build(version, components, registry, push, quiet):
-    re = requests.get('https://public-cdn.cloud.unity3d.com/hub/prod/releases-linux.json').text
-    releases = json.loads(re)
+# Read a URL (or a local file path) as text
+def _fetch(url):
+    if os.path.isfile(url):
+        with open(url) as f: return f.read()
+    res = requests.get(url)
+    res.raise_for_status()
+    return res.text
+
+# Write a file such that readers never see it half-written
+def _write_atomic(fp, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fp), prefix='.tmp-')
+    with os.fdopen(fd, 'wb' if type(data) is bytes else 'w') as f: f.write(data)
+    os.replace(tmp, fp)
+
+# A local cache of Unity installers (keyed by version & SHA1) and of the releases feed.
+# Installers are evicted least-recently-used first once the cache grows beyond max_bytes.
+class InstallerCache():
+    def __init__(self, path, max_bytes, ttl, port = 8765):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.port = port
+        self.installers = os.path.join(path, 'installers')
+        os.makedirs(self.installers, exist_ok=True)
+
+    # The releases JSON, re-fetched only once the cached copy is older than the TTL
+    def releases(self, url):
+        fp = os.path.join(self.path, 'releases.json')
+        if not os.path.isfile(fp) or time.time() - os.path.getmtime(fp) > self.ttl:
+            try:
+                _write_atomic(fp, _fetch(url))
+            except Exception as e:
+                if not os.path.isfile(fp): raise
+                print(f'Could not refresh releases ({e}); using the cached copy.')
+        with open(fp) as f: return json.load(f)
+
+    # The path to the installer for a version, downloaded on a cache miss
+    def installer(self, version, url, sha1 = None):
+        fp = self._find(version, sha1)
+        if fp:
+            print(f'Installer cache hit: {fp}')
+            os.utime(fp)
+            return fp
+        print(f'Installer cache miss: downloading {url}')
+        fd, tmp = tempfile.mkstemp(dir=self.installers, prefix='.tmp-')
+        digest = hashlib.sha1()
+        try:
+            with os.fdopen(fd, 'wb') as f, requests.get(url, stream=True) as res:
+                res.raise_for_status()
+                for chunk in res.iter_content(1 << 20):
+                    digest.update(chunk)
+                    f.write(chunk)
+            if sha1 and digest.hexdigest() != sha1:
+                raise Exception(f'SHA1 mismatch for {url}: expected {sha1}, got {digest.hexdigest()}')
+        except BaseException:
+            os.remove(tmp)
+            raise
+        fp = os.path.join(self.installers, f'UnitySetup-{version}-{digest.hexdigest()}')
+        os.chmod(tmp, 0o755)
+        os.replace(tmp, fp)
+        self._evict(fp)
+        return fp
+
+    # Serve the cache over HTTP on localhost, so that docker builds can download from it. The port is fixed, so that
+    # the installer's URL (a build arg of the base image, and so part of its layers' cache key) is the same every run;
+    # if another build already has it, any free port is used (and the installer's layers are rebuilt).
+    def serve(self):
+        class Handler(http.server.SimpleHTTPRequestHandler):
+            def log_message(self, *args): pass
+        handler = functools.partial(Handler, directory=self.path)
+        try:
+            server = http.server.ThreadingHTTPServer(('127.0.0.1', self.port), handler)
+        except OSError as e:
+            print(f'Could not serve the installer cache on port {self.port} ({e}); the base image cache will miss.')
+            server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    # Find a cached installer for the version (and SHA1, if known)
+    def _find(self, version, sha1):
+        prefix = f'UnitySetup-{version}-'
+        for fn in os.listdir(self.installers):
+            if fn.startswith(prefix) and (not sha1 or fn == prefix + sha1):
+                return os.path.join(self.installers, fn)
+        return None
+
+    # Remove the least-recently-used installers until the cache fits within max_bytes
+    def _evict(self, keep):
+        fps = [os.path.join(self.installers, fn) for fn in os.listdir(self.installers) if not fn.startswith('.')]
+        fps.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(fp) for fp in fps)
+        for fp in fps:
+            if total <= self.max_bytes: break
+            if fp == keep: continue
+            total -= os.path.getsize(fp)
+            print(f'Evicting {fp}')
+            os.remove(fp)
+
+# The tags (and their digests) already in a repository, from its registry's own API (or Docker Hub's)
+class Registry():
+    def __init__(self, repository):
+        host = repository.split('/')[0]
+        self.hub = not ('/' in repository and ('.' in host or ':' in host or host == 'localhost'))
+        if self.hub:
+            self.name = repository if '/' in repository else f'library/{repository}'
+            self.url = 'https://hub.docker.com'
+        else:
+            self.name = repository[len(host) + 1:]
+            self.url = f'{"http" if host.split(":")[0] in ["localhost", "127.0.0.1"] else "https"}://{host}'
+        self.session = requests.Session()
+        self.digests = {}
+
+    def tags(self):
+        tags = set()
+        if self.hub:
+            url = f'{self.url}/v2/repositories/{self.name}/tags?page_size=100'
+            while url:
+                res = self.session.get(url)
+                if res.status_code == 404: break
+                res.raise_for_status()
+                data = res.json()
+                for t in data.get('results', []):
+                    tags.add(t['name'])
+                    self.digests[t['name']] = t.get('digest')
+                url = data.get('next')
+            return tags
+        url = f'{self.url}/v2/{self.name}/tags/list?n=1000'
+        while url:
+            res = self._request('GET', url)
+            # A repository which was never pushed to has no tags yet.
+            if res.status_code == 404: break
+            res.raise_for_status()
+            tags.update(res.json().get('tags') or [])
+            link = re.search(r'<([^>]+)>;\s*rel="next"', res.headers.get('Link', ''))
+            url = (link.group(1) if '://' in link.group(1) else self.url + link.group(1)) if link else None
+        return tags
+
+    # The digest of a tag's manifest (None if unknown), to tell whether two tags are the same image
+    def digest(self, tag):
+        if tag not in self.digests and not self.hub:
+            res = self._request('HEAD', f'{self.url}/v2/{self.name}/manifests/{tag}')
+            self.digests[tag] = res.headers.get('Docker-Content-Digest') if res.ok else None
+        return self.digests.get(tag)
+
+    # A registry request, answering a bearer token challenge (anonymously) if there is one
+    def _request(self, method, url):
+        headers = {'Accept': ', '.join(manifest_types)}
+        res = self.session.request(method, url, headers=headers)
+        challenge = res.headers.get('WWW-Authenticate', '')
+        if res.status_code == 401 and challenge.startswith('Bearer '):
+            params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+            token = self.session.get(params.pop('realm'), params=params).json()
+            headers['Authorization'] = f'Bearer {token.get("token") or token.get("access_token")}'
+            res = self.session.request(method, url, headers=headers)
+        return res
+
+# Index the releases feed: the installer URL & group of each version, and the versions in each group
+def parse_releases(releases):
     choices = {}
     groups = {}
     versions = {}
-
     for group in releases:
         versions[group] = []
         for release in releases[group]:
@@ -40,48 +227,283 @@ def build(version, components, registry, push, quiet):
             versions[group].append(v)
             groups[v] = group
             choices[v] = url.replace('LinuxEditorInstaller/Unity.tar.xz', f'UnitySetup-{v}')
-            if not version:
-                print(f'{len(choices)}: [{group}] {v}')
+    return (choices, groups, versions)
+
+# Build new unity3d versions from scratch
+# With channel=None, the images are also tagged with the version's channel (see get_channel); with '', they are not.
+def build(version, components, registry, push, quiet, jobs = 1, cache = None, releases_url = releases_url,
+        push_jobs = 4, push_retries = 3, tags_file = None, channel = None):
+    releases = cache.releases(releases_url) if cache else json.loads(_fetch(releases_url))
+    (choices, groups, versions) = parse_releases(releases)
     if not version:
+        for (i, v) in enumerate(choices): print(f'{i + 1}: [{groups[v]}] {v}')
         c = int(input(f'Which version (1-{len(choices)})? ')) - 1
         version = list(choices)[c]
     if not version in list(choices):
         raise Exception(f'Version {version} is not currently available for download.')
     download_url = choices[version]
-    group = groups[version]
-    if group == 'official':
-        if version == versions['official'][len(versions['official'])-1]:
-            group = 'latest'
+    group = get_channel(version, groups, versions) if channel is None else channel
+
+    # With a cache, the images download the installer from a local HTTP server instead of the CDN.
+    flags = f'--build-arg DOWNLOAD_URL={download_url}'
+    server = None
+    if cache:
+        fp = cache.installer(version, download_url)
+        server = cache.serve()
+        url = f'http://127.0.0.1:{server.server_port}/installers/{os.path.basename(fp)}'
+        flags = f'--network host --build-arg DOWNLOAD_URL={url} --build-arg SHA1={fp.split("-")[-1]}'
+
+    # Build the OS dependencies and the Unity editor once, then every component image on top of it. Each image
+    # downloads the installer (for its components) and removes it again, so none of them keeps it in a layer.
+    base = f'{registry}:{get_version_tag(version, "base")}'
+    try:
+        base_status, base_secs = _build_base(base, flags, quiet)
+        results = [('base', (base_status, base_secs))]
+
+        # Each component gets its own Dockerfile, so any number of builds may overlap.
+        if base_status == 'ok':
+            jobs = max(1, min(jobs, len(components)))
+            if jobs > 1: _div(f'Building {len(components)} components with {jobs} workers')
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                futures = [(c, pool.submit(_build_component, version, group, c, base, registry, quiet, flags))
+                    for c in components]
+                results += [(c, f.result()) for (c, f) in futures]
+    finally:
+        # Release the port too, so the next version's build (e.g. in a sync) serves on the same one.
+        if server:
+            server.shutdown()
+            server.server_close()
+
+    # Publish the version & channel tags of every image which built, as a unit per image.
+    if push:
+        units = dict([(c, [f'{registry}:{get_version_tag(version, c)}'] +
+            ([f'{registry}:{get_version_tag(group, c)}'] if c != 'base' and group else []))
+            for (c, (status, secs)) in results if status == 'ok'])
+        pushed = publish([t for tags in units.values() for t in tags], push_jobs, push_retries)
+        results = [(c, ('push failed' if c in units and not all(pushed[t]['ok'] for t in units[c]) else status, secs))
+            for (c, (status, secs)) in results]
+        # The agent images which were published, e.g. for the helm chart's pre-pull to keep warm on every node.
+        if tags_file:
+            _write_atomic(tags_file, json.dumps([t for (c, tags) in units.items() if c != 'base'
+                for t in tags if pushed[t]['ok']], indent=2))
+
+    _div('Summary')
+    for (c, (status, secs)) in results:
+        print(f'{get_version_tag(version, c):<32} {status:<12} {secs:>8.1f}s')
+    if base_status == 'ok' and len(components) > 1:
+        # Measure the reuse: the component images which really sit on the base's layers share one copy of them, where
+        # per-component builds would each have built (and stored) their own.
+        layers = _diff_ids(base)
+        built = [c for (c, (status, secs)) in results if c != 'base' and status != 'build failed']
+        sharing = [c for c in built if len(layers) > 0 and
+            _diff_ids(f'{registry}:{get_version_tag(version, c)}')[:len(layers)] == layers]
+        n = max(0, len(sharing) - 1)
+        size = _image_size(base)
+        print(f"{len(sharing)} of {len(built)} images share the base's {len(layers)} layers ({size / 1e9:.2f}GB): "
+            f'{n * size / 1e9:.2f}GB not stored again, and at most ~{n * base_secs:.0f}s of builds saved '
+            f'vs. per-component builds (which might have been cached)')
+    return all(status == 'ok' for (c, (status, secs)) in results)
+
+# Plan a sync of the registry (which has the given tags) with the releases: the images missing for each of the
+# newest versions of each group (or only the given versions), and the channel tags to point at other images.
+# The versions are built newest first, and each version's components share a single base image.
+def plan_sync(releases, tags, digest, registry, components, groups = ['official'], newest = 0, only = None):
+    (choices, release_groups, versions) = parse_releases(releases)
+    selected = []
+    for g in groups:
+        vs = versions.get(g, [])
+        if only: selected += [v for v in vs if v in only]
+        else: selected += vs[-newest:] if newest > 0 else vs
+    builds = []
+    for v in reversed(selected):
+        missing = [c for c in components if get_version_tag(v, c) not in tags]
+        if len(missing) > 0: builds.append((v, missing))
+    built = set(get_version_tag(v, c) for (v, cs) in builds for c in cs)
+
+    retags = []
+    for (channel, v) in get_channels(versions).items():
+        if v not in selected: continue
+        for c in components:
+            (src, dst) = (get_version_tag(v, c), get_version_tag(channel, c))
+            if src in built or dst not in tags or not digest(src) or digest(src) != digest(dst):
+                retags.append((f'{registry}:{src}', f'{registry}:{dst}'))
+    return {
+        'versions': selected,
+        'builds': builds,
+        'retags': retags,
+        'present': len(selected) * len(components) - len(built)
+    }
+
+# Build & push only the images which are missing from the registry, then move the channel tags. With dry_run, only
+# print the plan. Returns True if everything synced.
+def sync(registry, components, quiet, jobs = 1, cache = None, releases_url = releases_url, push_jobs = 4,
+        push_retries = 3, tags_file = None, groups = ['official'], newest = 0, only = None, dry_run = False):
+    releases = cache.releases(releases_url) if cache else json.loads(_fetch(releases_url))
+    reg = Registry(registry)
+    plan = plan_sync(releases, reg.tags(), reg.digest, registry, components, groups, newest, only)
+    _div(f'Sync plan for {registry}: {len(plan["versions"])} versions, {plan["present"]} images present, '
+        f'{sum(len(cs) for (v, cs) in plan["builds"])} to build, {len(plan["retags"])} tags to move')
+    for (v, cs) in plan['builds']:
+        print(f'build  {v:<24} base + {", ".join(get_version_tag(v, c) for c in cs)}')
+    for (src, dst) in plan['retags']:
+        print(f'retag  {dst.split(":")[-1]:<24} -> {src.split(":")[-1]}')
+    if dry_run: return True
+
+    ok = True
+    built = set()
+    for (v, cs) in plan['builds']:
+        if build(v, cs, registry, True, quiet, jobs, cache, releases_url, push_jobs, push_retries, channel=''):
+            built.update(f'{registry}:{get_version_tag(v, c)}' for c in cs)
         else:
-            group = version.split('.')[0]
-    elif group == 'beta' and 'a' in version:
-        group = 'alpha'
-
-    for c in components:
-        img = f'{registry}:{get_version_tag(version, c)}'
-        build_args = [f'DOWNLOAD_URL={download_url}', f'COMPONENTS={component_map[c]}']
-        _div(f'Building {img} ({group}) with components: {component_map[c]}')
-
-        # Create a single Dockerfile of all the component Dockerfiles
-        df = 'docker/Dockerfile'
-        if os.path.isfile(df): os.remove(df)
-        cfs = [f'docker/base.Dockerfile', f'docker/{c}.Dockerfile', 'docker/unity.Dockerfile']
-        with open(df, 'w+') as dst:
-            for cf in cfs:
-                if not os.path.isfile(cf): continue
-                with open(cf) as src:  dst.write(src.read())
-
-        # Build & Push docker image
-        build = 'docker build'
-        if quiet: build += ' -q'
-        for a in build_args: build += f' --build-arg {a}'
-        subprocess.run(f'{build} ./docker -t {img}', shell=True, check=True)
-        if push:
-            _div(f'pushing {img}')
-
-            latest = f'{registry}:{get_version_tag(group, c)}'
-            subprocess.run(f'docker tag {img} {latest}', shell=True, check=True)
-            subprocess.run(f'docker push {registry} &', shell=True, check=True)
+            ok = False
+    # Only move a tag to an image which is now in the registry.
+    present = set(f'{registry}:{t}' for t in reg.tags())
+    synced = sorted(built)
+    for (src, dst) in plan['retags']:
+        if src not in present:
+            _out(dst.split(':')[-1], f'not moving to {src}, which is not in the registry')
+            ok = False
+        elif _retag(src, dst, src in built, push_retries):
+            synced.append(dst)
+        else:
+            ok = False
+    if tags_file: _write_atomic(tags_file, json.dumps(synced, indent=2))
+    _div(f'Synced {len(built)} images & {len(synced) - len(built)} tags' + ('' if ok else ' (with failures)'))
+    return ok
+
+# Point a tag at an image in the registry: by tagging & pushing the local image if it was just built, or else in the
+# registry itself (so the image is not pulled).
+def _retag(src, dst, local, retries):
+    prefix = dst.split(':')[-1]
+    if local:
+        if not _stream(f'docker tag {src} {dst}', prefix): return False
+        return _push(dst, retries)['ok']
+    return _stream(f'docker buildx imagetools create --tag {dst} {src}', prefix)
+
+# Build the shared base image for a version. Returns the status and the seconds taken.
+def _build_base(img, flags, quiet):
+    start = time.time()
+    prefix = img.split(':')[-1]
+    _out(prefix, f'Building shared base {img}')
+    build = 'docker build'
+    if quiet: build += ' -q'
+    if not _stream(f'{build} {flags} ./docker -f docker/base.Dockerfile -t {img}', prefix):
+        return ('build failed', time.time() - start)
+    return ('ok', time.time() - start)
+
+# Build (and tag) the image for a single component. Returns the status and the seconds taken.
+def _build_component(version, group, c, base, registry, quiet, flags = ''):
+    start = time.time()
+    prefix = get_version_tag(version, c)
+    img = f'{registry}:{prefix}'
+    build_args = [f'COMPONENTS={component_map[c]}', f'UNITY_VERSION={version}']
+    _out(prefix, f'Building {img} ({group}) from {base} with components: {component_map[c]}')
+    df = _write_dockerfile(c, base)
+
+    # Build & Tag docker image
+    build = 'docker build'
+    if quiet: build += ' -q'
+    if flags: build += f' {flags}'
+    for a in build_args: build += f' --build-arg {a}'
+    if not _stream(f'{build} ./docker -f {df} -t {img}', prefix):
+        return ('build failed', time.time() - start)
+    if not group: return ('ok', time.time() - start)
+    latest = f'{registry}:{get_version_tag(group, c)}'
+    if not _stream(f'docker tag {img} {latest}', prefix):
+        return ('build failed', time.time() - start)
+    return ('ok', time.time() - start)
+
+# Push tags through a bounded pool, retrying failures with exponential backoff. Returns the result for each tag.
+def publish(tags, jobs = 4, retries = 3):
+    _div(f'Pushing {len(tags)} tags with {jobs} workers')
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = [(t, pool.submit(_push, t, retries)) for t in tags]
+        results = dict([(t, f.result()) for (t, f) in futures])
+    _div('Pushed')
+    for (t, r) in results.items():
+        print(f'{t:<56} {"ok" if r["ok"] else "FAILED":<8} {r["seconds"]:>7.1f}s {r["attempts"]} attempt(s), '
+            f'{r["pushed"]} layers pushed ({r["bytes"] / 1e6:.1f}MB), {r["existing"]} already present')
+    return results
+
+# Push a single tag, retrying with exponential backoff.
+def _push(tag, retries, backoff = 2):
+    start = time.time()
+    attempt = 0
+    while True:
+        attempt += 1
+        lines = []
+        ok = _stream(f'docker push {tag}', tag.split(':')[-1], lines)
+        if ok or attempt > retries: break
+        delay = backoff * 2 ** (attempt - 1)
+        _out(tag.split(':')[-1], f'push failed (attempt {attempt}); retrying in {delay}s')
+        time.sleep(delay)
+    pushed = set(m.group(1) for m in [re.match(r'^([0-9a-f]{12}): Pushed', l) for l in lines] if m)
+    existing = [l for l in lines if re.match(r'^[0-9a-f]{12}: (Layer already exists|Mounted from)', l)]
+    return {
+        'ok': ok,
+        'attempts': attempt,
+        'seconds': time.time() - start,
+        'pushed': len(pushed),
+        'existing': len(existing),
+        'bytes': _layer_bytes(tag, pushed) if ok else 0
+    }
+
+# The compressed size of the given layers of a pushed tag. `docker push` names layers by their (short) DiffIDs, the
+# digests of the uncompressed layers, while the registry manifest lists the compressed blobs; both are in the same
+# order, so the local image's DiffIDs are matched to the manifest's layers by index.
+def _layer_bytes(tag, layers):
+    if len(layers) <= 0: return 0
+    sizes = _layer_sizes(tag)
+    return sum(size for (diff_id, size) in sizes if diff_id[7:19] in layers)
+
+# The (DiffID, compressed size) of each layer of a pushed tag, from the bottom up.
+def _layer_sizes(tag):
+    diff_ids = _diff_ids(tag)
+    res = subprocess.run(f'docker manifest inspect {tag}', shell=True, check=False, capture_output=True, text=True)
+    try:                manifest = json.loads(res.stdout)
+    except ValueError:  return []
+    blobs = manifest.get('layers', [])
+    if not diff_ids or len(blobs) != len(diff_ids): return []
+    return [(d, b.get('size', 0)) for (d, b) in zip(diff_ids, blobs)]
+
+# The DiffIDs of a local image's layers, from the bottom up (none if it is not local).
+def _diff_ids(img):
+    res = subprocess.run(f'docker image inspect -f "{{{{json .RootFS.Layers}}}}" {img}',
+        shell=True, check=False, capture_output=True, text=True)
+    try:                return json.loads(res.stdout) or []
+    except ValueError:  return []
+
+# Create a single Dockerfile of all the Dockerfiles for a component, on top of the shared base image
+def _write_dockerfile(c, base):
+    df = f'docker/Dockerfile.{c if c else "unity"}'
+    cfs = [f'docker/{c}.Dockerfile', 'docker/unity.Dockerfile']
+    with open(df, 'w+') as dst:
+        dst.write(f'FROM {base}\n\n')
+        for cf in cfs:
+            if not os.path.isfile(cf): continue
+            with open(cf) as src:  dst.write(src.read())
+    return df
+
+# The size, in bytes, of a local docker image
+def _image_size(img):
+    res = subprocess.run(f'docker image inspect -f "{{{{.Size}}}}" {img}',
+        shell=True, check=False, capture_output=True, text=True)
+    try:                return int(res.stdout.strip())
+    except ValueError:  return 0
+
+# Run a shell command, streaming its output with a prefix (and collecting it into lines, if given).
+# Returns True on success.
+def _stream(cmd, prefix, lines = None):
+    proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    for line in proc.stdout:
+        _out(prefix, line.rstrip())
+        if lines is not None: lines.append(line.strip())
+    return proc.wait() == 0
+
+# Print a line prefixed with the component it belongs to (safe across worker threads)
+_print_lock = threading.Lock()
+def _out(prefix, msg):
+    with _print_lock: print(f'[{prefix}] {msg}', flush=True)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -93,9 +515,47 @@ if __name__ == "__main__":
         help='Push the built images?')
     parser.add_argument('--verbose', action='store_true',
         help='Include Docker output?')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+        help='How many components to build concurrently')
+    parser.add_argument('--push-jobs', type=int, default=4,
+        help='How many tags to push concurrently')
+    parser.add_argument('--push-retries', type=int, default=3,
+        help='How many times to retry a failed push')
+    parser.add_argument('--cache', default=os.path.expanduser('~/.cache/unity3d-buildkite'),
+        help='Where to cache Unity installers and the releases JSON')
+    parser.add_argument('--no-cache', action='store_true',
+        help='Always download the installer and releases JSON')
+    parser.add_argument('--cache-size', type=float, default=20,
+        help='Maximum size of the installer cache, in GB')
+    parser.add_argument('--cache-port', type=int, default=8765,
+        help='The localhost port the installer cache is served to docker builds on')
+    parser.add_argument('--releases-ttl', type=int, default=3600,
+        help='How long (in seconds) the cached releases JSON is used before re-fetching')
+    parser.add_argument('--releases', default=releases_url,
+        help='The releases JSON URL (or a local file)')
+    parser.add_argument('--sync', action='store_true',
+        help='Build (and push) only the images missing from the registry, and move the channel tags')
+    parser.add_argument('--dry-run', action='store_true',
+        help='With --sync, only print what would be built & tagged')
+    parser.add_argument('--groups', default='official',
+        help='With --sync, the comma-separated release groups to sync')
+    parser.add_argument('--newest', type=int, default=3,
+        help='With --sync, how many of the newest versions of each group to sync (0 for all)')
+    parser.add_argument('--tags-file',
+        help='Where to write the pushed tags (as a JSON list), e.g. for the pre-pull of the helm chart')
     opts = parser.parse_args()
 
-    if opts.components: components = opts.components.split(',')
-    else: components = list(component_map)
+    components = parse_components(opts.components)
+
+    cache = None
+    if not opts.no_cache: cache = InstallerCache(opts.cache, opts.cache_size * 1e9, opts.releases_ttl,
+        opts.cache_port)
 
-    build(opts.version, components, opts.dst, not opts.no_push, not opts.verbose)
+    if opts.sync:
+        only = opts.version.split(',') if opts.version else None
+        if not sync(opts.dst, components, not opts.verbose, opts.jobs, cache, opts.releases, opts.push_jobs,
+                opts.push_retries, opts.tags_file, opts.groups.split(','), opts.newest, only, opts.dry_run):
+            exit(1)
+    elif not build(opts.version, components, opts.dst, not opts.no_push, not opts.verbose, opts.jobs,
+            cache, opts.releases, opts.push_jobs, opts.push_retries, opts.tags_file):
+        exit(1)
@@ -28,6 +28,8 @@ namespace Editor.UnityCI {
 
     public string JdkPath { get; set; }
 
+    public bool Incremental { get; set; }
+
     private SemVersion _version;
 
     private Dictionary<string, string> _args;
@@ -42,7 +44,8 @@ namespace Editor.UnityCI {
         File.WriteAllText("Assets/Resources/Commit.txt", Commit);
       }
       Debug.LogFormat("[Build] Refreshing assets for {0}", this);
-      AssetDatabase.Refresh(ImportAssetOptions.ForceUpdate);
+      // An incremental build trusts the restored Library, and only imports what changed.
+      AssetDatabase.Refresh(Incremental ? ImportAssetOptions.Default : ImportAssetOptions.ForceUpdate);
       Debug.LogFormat($"[Build] Asset Refresh Complete.");
       BuildTarget bt = UnityBuildTarget;
       string[] scenes = Scenes.ToArray();
@@ -66,14 +69,20 @@ namespace Editor.UnityCI {
           {"totalTime", report.summary.totalTime.ToString()},
           {"buildStartedAt", report.summary.buildStartedAt.ToString()},
           {"buildEndedAt", report.summary.buildEndedAt.ToString()},
-          {"errors", string.Join("\n", errors)}
+          {"errors", string.Join("\n", errors)},
+          {"steps", string.Join("\n", report.steps.Select(s => $"{s.duration.TotalSeconds:0.###}\t{s.name}"))}
         }));
       }
     }
 
     // Since Unity's JsonUtility does not support Dictionaries, and we don't want to introduce dependencies...
     private string SimpleJson(Dictionary<string, string> dict) {
-      return "{" + string.Join(",", dict.Keys.Select(k => $"\"{k}\": \"" + dict[k].Replace("\"", "\\\"") + "\"")) + "}";
+      return "{" + string.Join(",", dict.Keys.Select(k => $"\"{k}\": \"" + JsonEscape(dict[k]) + "\"")) + "}";
+    }
+
+    private string JsonEscape(string str) {
+      return str.Replace("\\", "\\\\").Replace("\"", "\\\"")
+        .Replace("\n", "\\n").Replace("\r", "\\r").Replace("\t", "\\t");
     }
 
     private void ClearFolder(string FolderName) {
@@ -147,6 +156,7 @@ namespace Editor.UnityCI {
       Commit = GetArg("Commit");
       AndroidSdkRoot = GetArg("AndroidSdkRoot");
       JdkPath = GetArg("JdkPath");
+      Incremental = GetArg("Incremental") == "true";
 
       if (string.IsNullOrEmpty(Name)) {
         throw new ArgumentNullException(nameof(Name));
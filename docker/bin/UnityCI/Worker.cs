@@ -0,0 +1,74 @@
+using System;
+using System.Collections.Generic;
+using System.IO;
+using System.Linq;
+using UnityEditor;
+using UnityEngine;
+
+namespace Editor.UnityCI {
+  // A resident editor for the worker pool (make.py worker serve). Instead of quitting after one build, it builds each
+  // request the pool drops into its directory: "{id}.req" holds "key=value" lines of BuildApp arguments, and the
+  // answer is written to "{id}.res" (empty on success, otherwise the error).
+  [InitializeOnLoad]
+  public static class Worker {
+    private static readonly string _dir = GetWorkerDir();
+
+    private static double _lastHeartbeat;
+
+    static Worker() {
+      // Runs on start-up and again after every domain reload, so polling survives script changes.
+      if (_dir != null) EditorApplication.update += Poll;
+    }
+
+    public static void Serve() {
+      if (_dir == null) {
+        throw new ArgumentNullException("workerDir");
+      }
+      Debug.LogFormat("[Build] Worker waiting for requests in {0}", _dir);
+    }
+
+    private static void Poll() {
+      // The pool treats a stale heartbeat from an idle editor as a hung editor.
+      if (EditorApplication.timeSinceStartup - _lastHeartbeat >= 1) Heartbeat();
+      if (File.Exists(Path.Combine(_dir, "stop"))) {
+        Debug.Log("[Build] Worker stopping.");
+        EditorApplication.update -= Poll;
+        EditorApplication.Exit(0);
+        return;
+      }
+      string req = Directory.GetFiles(_dir, "*.req").OrderBy(f => f).FirstOrDefault();
+      if (req == null) return;
+
+      string id = Path.GetFileNameWithoutExtension(req);
+      Dictionary<string, string> args = File.ReadAllLines(req)
+        .Where(l => l.Contains("="))
+        .ToDictionary(l => l.Substring(0, l.IndexOf('=')), l => l.Substring(l.IndexOf('=') + 1));
+      File.Delete(req);
+
+      string error = "";
+      try {
+        Debug.LogFormat("[Build] Worker building request {0}", id);
+        new BuildApp(args).Build();
+      } catch (Exception e) {
+        Debug.LogException(e);
+        error = e.ToString();
+      }
+      // No beat was written during the build; beat before answering, so the pool does not take the editor for hung.
+      Heartbeat();
+      string tmp = Path.Combine(_dir, id + ".tmp");
+      File.WriteAllText(tmp, error);
+      File.Move(tmp, Path.Combine(_dir, id + ".res"));
+    }
+
+    private static void Heartbeat() {
+      _lastHeartbeat = EditorApplication.timeSinceStartup;
+      File.WriteAllText(Path.Combine(_dir, "heartbeat"), DateTime.UtcNow.ToString("o"));
+    }
+
+    private static string GetWorkerDir() {
+      string[] args = Environment.GetCommandLineArgs();
+      int i = Array.IndexOf(args, "-workerDir");
+      return i >= 0 && i + 1 < args.Length ? args[i + 1] : null;
+    }
+  }
+}
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3.7
-import os, sys, logging, argparse, subprocess, maker
+import os, sys, logging, argparse, subprocess
+from maker import registry
 from maker.maker import Maker
 
 class Make():
@@ -8,14 +9,12 @@ class Make():
         except OSError:     self.fp = __file__
         self.bin = os.path.join(os.path.dirname(self.fp), '../')
 
-        # Iterate module directory to load classes.
-        self.makers = Maker(make = self)._load_subclasses()
-
-        if len(sys.argv) < 2 or not sys.argv[1] in self.makers:
-            print(f'Syntax: {self.fp} {list(self.makers)}')
+        # Only the module for the requested subcommand is loaded.
+        if len(sys.argv) < 2 or not sys.argv[1] in registry:
+            print(f'Syntax: {self.fp} {list(registry)}')
             exit(1)
         self.maker_name = sys.argv[1]
-        self.maker = self.makers[self.maker_name]
+        self.maker = Maker(make = self)._load_subclass(self.maker_name, registry[self.maker_name])
         if len(sys.argv) < 3 or not sys.argv[2] in self.maker.methods:
             print(f'Syntax: {self.fp} {self.maker_name} {list(self.maker.methods)}')
             exit(1)
@@ -24,24 +23,27 @@ class Make():
         args = sys.argv[3:]
 
         log_levels = ['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG']
-        sha = self._git('rev-parse HEAD') # Git SHA will be the default commit
-        tag = self._git('tag -l "v*" | tail -1') # vX.X.X tag will be used as default version
-        vers = tag[1:] if len(tag) > 1 else '0.0.1' # Without a version tag, 0.0.1 is used
 
         parser = argparse.ArgumentParser(f'{self.fp} {self.maker_name} {self.method_name}')
         self.maker._parse_args(parser, self.method_name)
         parser.add_argument('--work', '-w', default=os.getcwd(), help='Work directory (where code lives)')
-        parser.add_argument('--version', '-v', default=vers, help='SemVer version')
+        parser.add_argument('--version', '-v', help='SemVer version (default: the latest vX.X.X tag)')
         parser.add_argument('--prerelease', '-p',
           default=os.getenv('BUILDKITE_BRANCH', ''), help='SemVer prerelease field')
         parser.add_argument('--build', '-b',
           default=os.getenv('BUILDKITE_BUILD_NUMBER', ''), help='SemVer build number')
         parser.add_argument('--commit', '-s',
-          default=os.getenv('BUILDKITE_COMMIT', sha), help='SemVer SHA')
+          default=os.getenv('BUILDKITE_COMMIT'), help='SemVer SHA (default: the git HEAD)')
         parser.add_argument('--log-level', '-l', choices=log_levels, default='INFO', help='logging level')
         parser.add_argument('--log-format', '-f', default='[%(levelname)s] [%(name)s] %(message)s')
         self.opts = parser.parse_args(args)
 
+        # Git is only consulted for the defaults which were not given explicitly.
+        if self.opts.version is None or self.opts.commit is None:
+            (sha, tag) = self._git_meta()
+            if self.opts.version is None: self.opts.version = tag[1:] if len(tag) > 1 else '0.0.1'
+            if self.opts.commit is None: self.opts.commit = sha
+
         self.release = self.opts.version
         self.semver = self.opts.version
         if self.opts.prerelease and len(self.opts.prerelease) > 0:
@@ -53,7 +55,42 @@ class Make():
 
         logging.basicConfig(format=self.opts.log_format, level=self.opts.log_level)
         self.log = logging.getLogger('make')
-        self.maker.method()
+        success = False
+        try:
+            with self.maker._phase(self.method_name): self.maker.method()
+            success = True
+        finally:
+            self.maker._write_metrics(success)
+
+    # The HEAD commit SHA and the latest "v*" tag (as sorted by `git tag -l`), read directly from .git.
+    # Falls back to the git CLI when .git is not a plain directory (e.g., in a worktree or submodule).
+    def _git_meta(self):
+        d = os.getcwd()
+        while not os.path.exists(os.path.join(d, '.git')) and os.path.dirname(d) != d:
+            d = os.path.dirname(d)
+        git = os.path.join(d, '.git')
+        if not os.path.isdir(git):
+            return (self._git('rev-parse HEAD'), self._git('tag -l "v*" | tail -1'))
+        packed = {}
+        if os.path.isfile(os.path.join(git, 'packed-refs')):
+            with open(os.path.join(git, 'packed-refs')) as f:
+                for line in f:
+                    parts = line.strip().split(' ')
+                    if len(parts) == 2 and not line.startswith('#'): packed[parts[1]] = parts[0]
+        tags = [r[len('refs/tags/'):] for r in packed if r.startswith('refs/tags/v')]
+        tags_dir = os.path.join(git, 'refs', 'tags')
+        for (root, dirs, files) in os.walk(tags_dir):
+            tags += [os.path.relpath(os.path.join(root, fn), tags_dir).replace(os.sep, '/') for fn in files]
+        tags = sorted(set([t for t in tags if t.startswith('v')]))
+
+        with open(os.path.join(git, 'HEAD')) as f: sha = f.read().strip()
+        if sha.startswith('ref: '):
+            ref = sha[5:]
+            if os.path.isfile(os.path.join(git, ref)):
+                with open(os.path.join(git, ref)) as f: sha = f.read().strip()
+            else:
+                sha = packed.get(ref, '')
+        return (sha, tags[-1] if len(tags) > 0 else '')
 
     # Run a git command and return the output (or an empty string)
     def _git(self, cmd):
@@ -0,0 +1,10 @@
+# The make.py subcommands, and the modules (within this package) which implement them.
+# A module is only imported when its subcommand is run.
+registry = {
+    'artifacts': 'artifacts',
+    'cache': 'cache',
+    'disk': 'disk',
+    'docker': 'docker',
+    'unity': 'unity',
+    'worker': 'worker'
+}
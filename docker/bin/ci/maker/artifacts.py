@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+import os, json, hashlib, tempfile
+from concurrent.futures import ThreadPoolExecutor
+from .maker import Maker
+
+chunk_size = 4 << 20
+
+# A content-addressed store of build outputs (in a local or mounted directory). Files are split into chunks named
+# by their SHA256, so chunks shared between builds are only stored once; a build is a manifest of its files' chunks.
+class ArtifactStore():
+    def __init__(self, path, jobs = None):
+        self.path = path
+        self.jobs = jobs if jobs else (os.cpu_count() or 1)
+        self.chunks = os.path.join(path, 'chunks')
+        self.manifests = os.path.join(path, 'manifests')
+        os.makedirs(self.chunks, exist_ok=True)
+        os.makedirs(self.manifests, exist_ok=True)
+
+    # Add the tree at root to the store as build_id, copying only the chunks the store does not have yet.
+    # Returns the total and newly-stored bytes.
+    def put(self, build_id, root):
+        manifest = {'id': build_id, 'dirs': [], 'links': {}, 'files': {}}
+        paths = []
+        for (d, dirs, files) in os.walk(root):
+            dirs.sort()
+            for n in sorted(dirs + files):
+                fp = os.path.join(d, n)
+                rel = os.path.relpath(fp, root)
+                if os.path.islink(fp): manifest['links'][rel] = os.readlink(fp)
+                elif os.path.isdir(fp): manifest['dirs'].append(rel)
+                else: paths.append((rel, fp))
+        total = 0
+        stored = 0
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            for ((rel, fp), (f, new)) in zip(paths, pool.map(lambda p: self._put_file(p[1]), paths)):
+                manifest['files'][rel] = f
+                total += f['size']
+                stored += new
+        manifest['size'] = total
+        self._write(self._manifest_path(build_id), json.dumps(manifest, indent=2).encode())
+        return {'files': len(paths), 'bytes': total, 'new_bytes': stored, 'reused_bytes': total - stored}
+
+    # Rebuild the tree of a build at dst. Returns the number of bytes written.
+    def get(self, build_id, dst):
+        with open(self._manifest_path(build_id)) as fp: manifest = json.load(fp)
+        os.makedirs(dst, exist_ok=True)
+        for d in manifest['dirs']: os.makedirs(os.path.join(dst, d), exist_ok=True)
+        items = list(manifest['files'].items())
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            list(pool.map(lambda i: self._get_file(i[1], os.path.join(dst, i[0])), items))
+        for (rel, target) in manifest['links'].items():
+            fp = os.path.join(dst, rel)
+            if os.path.lexists(fp): os.remove(fp)
+            os.symlink(target, fp)
+        return manifest['size']
+
+    # The IDs of all the builds in the store.
+    def builds(self):
+        return sorted([fn[:-5] for fn in os.listdir(self.manifests) if fn.endswith('.json')])
+
+    def _put_file(self, fp):
+        chunks = []
+        new = 0
+        size = 0
+        with open(fp, 'rb') as f:
+            while True:
+                data = f.read(chunk_size)
+                if len(data) <= 0: break
+                h = hashlib.sha256(data).hexdigest()
+                cp = self._chunk_path(h)
+                if not os.path.isfile(cp):
+                    self._write(cp, data)
+                    new += len(data)
+                chunks.append(h)
+                size += len(data)
+        return ({'size': size, 'mode': os.stat(fp).st_mode & 0o777, 'chunks': chunks}, new)
+
+    def _get_file(self, f, fp):
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
+        with open(fp, 'wb') as out:
+            for h in f['chunks']:
+                with open(self._chunk_path(h), 'rb') as c: data = c.read()
+                if hashlib.sha256(data).hexdigest() != h: raise Exception(f'Chunk {h} is corrupt')
+                out.write(data)
+        os.chmod(fp, f['mode'])
+
+    def _chunk_path(self, h):
+        return os.path.join(self.chunks, h[:2], h)
+
+    def _manifest_path(self, build_id):
+        return os.path.join(self.manifests, f'{build_id}.json')
+
+    # Write a file atomically, so concurrent builds never see (or clobber) partial chunks.
+    def _write(self, fp, data):
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fp), prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f: f.write(data)
+        os.replace(tmp, fp)
+
+class Artifacts(Maker):
+    # Add arguments.
+    def _parse_args(self, parser, method):
+        parser.add_argument('--store', default=os.getenv('ARTIFACT_STORE', os.path.expanduser('~/.cache/unity3d/artifacts')),
+            help='The artifact store directory.')
+        if method == 'store':
+            parser.add_argument('src', help='The directory to store.')
+            parser.add_argument('build_id', help='The name to store it under.')
+        if method == 'restore':
+            parser.add_argument('build_id', help='The build to restore.')
+            parser.add_argument('dst', help='Where to restore it to.')
+        return super()._parse_args(parser, method)
+
+    # Add a build's output to the store.
+    def store(self):
+        stats = ArtifactStore(self.make.opts.store).put(self.make.opts.build_id, self.make.opts.src)
+        self.log.info(f'stored {self.make.opts.build_id}: {stats["bytes"]}b in {stats["files"]} files, '
+            f'{stats["new_bytes"]}b new ({stats["reused_bytes"]}b already in the store)')
+
+    # Rebuild a build's output from the store.
+    def restore(self):
+        store = ArtifactStore(self.make.opts.store)
+        if not self.make.opts.build_id in store.builds():
+            self.log.error(f'{self.make.opts.build_id} is not in {self.make.opts.store}')
+            exit(1)
+        size = store.get(self.make.opts.build_id, self.make.opts.dst)
+        self.log.info(f'restored {self.make.opts.build_id} ({size}b) to {self.make.opts.dst}')
+
+    # List the builds in the store.
+    def list(self):
+        for build_id in ArtifactStore(self.make.opts.store).builds(): print(build_id)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import os, json, shutil, tempfile, fcntl, contextlib
+from .maker import Maker
+
+# A cache of finished builds (their archive and reports) in a local or mounted directory, keyed by everything which
+# determines the player. The least-recently-used builds are evicted once the cache grows beyond max_bytes.
+class BuildCache():
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.builds = os.path.join(path, 'builds')
+        os.makedirs(self.builds, exist_ok=True)
+
+    # Copy the files of a cached build into dst. Returns their names, or None on a miss.
+    def get(self, key, dst):
+        d = os.path.join(self.builds, key)
+        if not os.path.isdir(d):
+            self._count('misses')
+            return None
+        os.utime(d)
+        os.makedirs(dst, exist_ok=True)
+        files = sorted(os.listdir(d))
+        for fn in files: shutil.copy2(os.path.join(d, fn), dst)
+        self._count('hits')
+        return files
+
+    # Store the files of a build under key, then evict old builds until the cache fits.
+    def put(self, key, files):
+        d = os.path.join(self.builds, key)
+        if os.path.isdir(d): return
+        tmp = tempfile.mkdtemp(dir=self.builds, prefix='.tmp-')
+        for fp in files: shutil.copy2(fp, tmp)
+        try:
+            os.rename(tmp, d)
+        except OSError:
+            # Another build stored the same key first.
+            shutil.rmtree(tmp)
+            return
+        self._evict(d)
+
+    # The hit/miss/eviction counts, and the current size of the cache.
+    def stats(self):
+        with self._stats() as stats: ret = dict(stats)
+        ret['builds'] = len([fn for fn in os.listdir(self.builds) if not fn.startswith('.')])
+        ret['bytes'] = sum([self._size(os.path.join(self.builds, fn)) for fn in os.listdir(self.builds)])
+        return ret
+
+    def _evict(self, keep):
+        dirs = [os.path.join(self.builds, fn) for fn in os.listdir(self.builds) if not fn.startswith('.')]
+        dirs.sort(key=os.path.getmtime)
+        sizes = dict([(d, self._size(d)) for d in dirs])
+        total = sum(sizes.values())
+        evicted = 0
+        for d in dirs:
+            if total <= self.max_bytes: break
+            if d == keep: continue
+            shutil.rmtree(d, ignore_errors=True)
+            total -= sizes[d]
+            evicted += 1
+        if evicted > 0: self._count('evictions', evicted)
+
+    def _size(self, d):
+        return sum([os.path.getsize(os.path.join(d, fn)) for fn in os.listdir(d)])
+
+    def _count(self, name, n = 1):
+        with self._stats() as stats: stats[name] = stats.get(name, 0) + n
+
+    # The stats file, locked (as concurrent builds may share the cache), and saved afterwards.
+    @contextlib.contextmanager
+    def _stats(self):
+        fp = os.path.join(self.path, 'stats.json')
+        with open(os.path.join(self.path, 'stats.lock'), 'w+') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+            if os.path.isfile(fp):
+                with open(fp) as f: stats.update(json.load(f))
+            yield stats
+            with open(fp, 'w+') as f: json.dump(stats, f)
+
+class Cache(Maker):
+    # Add arguments.
+    def _parse_args(self, parser, method):
+        parser.add_argument('--build_cache', default=os.getenv('UNITY_BUILD_CACHE', os.path.expanduser('~/.cache/unity3d/builds')),
+            help='The build cache directory.')
+        return super()._parse_args(parser, method)
+
+    # Print the build cache's stats.
+    def stats(self):
+        stats = BuildCache(self.make.opts.build_cache, 0).stats()
+        for (k, v) in stats.items(): print(f'{k}: {v}')
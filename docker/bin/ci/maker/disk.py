@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+import os, re, json, time, shutil, datetime, subprocess
+from .maker import Maker
+
+# The relative cost of getting each kind of item back once it is evicted. Items are evicted in order of the time
+# since they were last used divided by this cost, so the stale & cheap go first (and those costing nothing, first of all).
+costs = {
+    'container': 0,     # Exited containers.
+    'dangling': 0,      # Untagged images.
+    'artifact': 1,      # bin/ outputs, which the build that made them has already uploaded.
+    'image': 2,         # Tagged images, pulled again (or rebuilt from the build cache) when needed.
+    'build_cache': 4,   # BuildKit cache entries: the layers the next image build would reuse.
+    'library': 8,       # Library snapshots: without one, Unity imports every asset again.
+}
+docker_kinds = ['container', 'dangling', 'image', 'build_cache']
+
+size_units = {'b': 1, 'kb': 1e3, 'mb': 1e6, 'gb': 1e9, 'tb': 1e12}
+duration_units = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400, 'week': 604800, 'month': 2592000, 'year': 31536000}
+
+# Add the arguments of the disk budget.
+def add_args(parser):
+    parser.add_argument('--watermark', type=float, default=float(os.getenv('DISK_WATERMARK', '0.8')),
+        help='Evict until the disk is at most this full (0-1).')
+    parser.add_argument('--budget', type=float, default=float(os.getenv('DISK_BUDGET', '0')),
+        help='Also evict until the items take at most this many GB (0 for no limit).')
+    parser.add_argument('--disk', default=os.getenv('DISK_PATH', ''),
+        help='A path on the disk to keep under the watermark (default: the work directory).')
+    parser.add_argument('--dry_run', action='store_true', help='Only log what would be evicted.')
+
+# A human-readable size, as Docker prints them (e.g. 1.2GB), in bytes.
+def parse_size(s):
+    m = re.match(r'^([\d.]+)\s*([kMGT]?B)$', s.strip(), re.IGNORECASE)
+    return int(float(m.group(1)) * size_units[m.group(2).lower()]) if m else 0
+
+# A time as Docker prints it: either absolute (2020-01-02 03:04:05 +0000 UTC) or relative (About an hour ago).
+def parse_time(s, now):
+    m = re.match(r'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)', s or '')
+    if m:
+        t = datetime.datetime.strptime(m.group(1), '%Y-%m-%d %H:%M:%S').replace(tzinfo=datetime.timezone.utc)
+        return t.timestamp()
+    m = re.match(r'^(?:about )?(an?|\d+|less than a) (second|minute|hour|day|week|month|year)s? ago', (s or '').lower())
+    if not m: return 0
+    n = 1 if not m.group(1).isdigit() else int(m.group(1))
+    return now - n * duration_units[m.group(2)]
+
+# The disk space held by a file or directory tree.
+def tree_size(fp):
+    if not os.path.isdir(fp) or os.path.islink(fp): return os.lstat(fp).st_size
+    total = 0
+    for (root, dirs, files) in os.walk(fp):
+        for fn in files: total += os.lstat(os.path.join(root, fn)).st_size
+    return total
+
+# Frees disk space by evicting the warm state which is cheapest to lose, only until the disk is under a watermark
+# (and the items within a budget), rather than throwing all of it away.
+class DiskGC():
+    def __init__(self, log, kinds = list(costs), work = None, cache_dir = None):
+        self.log = log
+        self.kinds = kinds
+        self.work = work
+        self.cache_dir = cache_dir
+
+    # Every evictable item: {kind, name, bytes, last_used, remove}.
+    def collect(self, now = None):
+        now = now if now else time.time()
+        items = []
+        if any(k in docker_kinds for k in self.kinds): items += self._docker_items(now)
+        if 'library' in self.kinds and self.cache_dir:
+            d = os.path.join(self.cache_dir, 'library')
+            for fn in (sorted(os.listdir(d)) if os.path.isdir(d) else []):
+                if not fn.endswith('.tar'): continue
+                fp = os.path.join(d, fn)
+                items.append(self._item('library', fn[:-4], tree_size(fp), os.path.getmtime(fp),
+                    lambda fp=fp: self._remove_files([fp, fp[:-4] + '.sha1'])))
+        if 'artifact' in self.kinds and self.work:
+            d = os.path.join(self.work, 'bin')
+            for fn in (sorted(os.listdir(d)) if os.path.isdir(d) else []):
+                fp = os.path.join(d, fn)
+                items.append(self._item('artifact', f'bin/{fn}', tree_size(fp), os.path.getmtime(fp),
+                    lambda fp=fp: self._remove_files([fp])))
+        return [i for i in items if i['kind'] in self.kinds]
+
+    # Items in eviction order.
+    def rank(self, items, now = None):
+        now = now if now else time.time()
+        def score(i):
+            cost = costs[i['kind']]
+            return (cost > 0, -(now - i['last_used']) / cost if cost > 0 else 0, -i['bytes'])
+        return sorted(items, key=score)
+
+    # Evict items until the disk at path is no fuller than watermark, and the items take no more than budget bytes
+    # (if non-zero). Returns a summary of what was reclaimed & kept.
+    def run(self, path, watermark, budget = 0, dry_run = False):
+        now = time.time()
+        items = self.rank(self.collect(now), now)
+        usage = shutil.disk_usage(path)
+        total = sum(i['bytes'] for i in items)
+        need = max(usage.used - watermark * usage.total, total - budget if budget > 0 else 0)
+        self.log.info(f'Disk at {path}: {usage.used / 1e9:.1f}/{usage.total / 1e9:.1f}GB used '
+            f'({usage.used / usage.total:.0%}, watermark {watermark:.0%}); {len(items)} items take {total / 1e9:.2f}GB'
+            + (f' (budget {budget / 1e9:.1f}GB)' if budget > 0 else ''))
+        evicted = []
+        reclaimed = 0
+        for i in items:
+            if reclaimed >= need: break
+            self.log.info(f'{"Would evict" if dry_run else "Evicting"} {i["kind"]} {i["name"]} ({i["bytes"] / 1e6:.1f}MB, '
+                f'last used {self._age(now - i["last_used"])} ago)')
+            if not dry_run and not i['remove']():
+                self.log.warning(f'Could not evict {i["kind"]} {i["name"]}')
+                continue
+            evicted.append(i)
+            reclaimed += i['bytes']
+        gone = set(id(i) for i in evicted)
+        kept = [i for i in items if not id(i) in gone]
+        summary = {
+            'reclaimed': self._by_kind(evicted),
+            'kept': self._by_kind(kept),
+            'reclaimed_bytes': reclaimed,
+            'kept_bytes': sum(i['bytes'] for i in kept),
+            'disk_used': usage.used - (0 if dry_run else reclaimed),
+            'disk_total': usage.total
+        }
+        self.log.info(f'{"Would reclaim" if dry_run else "Reclaimed"} {reclaimed / 1e9:.2f}GB from {len(evicted)} items '
+            f'({self._describe(summary["reclaimed"])}); kept {summary["kept_bytes"] / 1e9:.2f}GB of warm state '
+            f'({self._describe(summary["kept"])})')
+        return summary
+
+    # The containers, images & build cache of the Docker daemon.
+    def _docker_items(self, now):
+        res = subprocess.run('docker system df -v --format "{{json .}}"', shell=True, check=False,
+            capture_output=True, text=True)
+        if res.returncode != 0:
+            self.log.warning(f'Could not read the Docker disk usage: {res.stderr.strip()}')
+            return []
+        df = json.loads(res.stdout)
+        items = []
+        last_used = {}
+        for c in df.get('Containers') or []:
+            created = parse_time(c.get('CreatedAt'), now)
+            last_used[c.get('Image')] = max(last_used.get(c.get('Image'), 0), created)
+            if c.get('State') != 'exited': continue
+            items.append(self._item('container', c.get('Names', c['ID']), parse_size(c.get('Size', '0B').split(' ')[0]),
+                created, lambda c=c: self._docker(f'rm {c["ID"]}')))
+        # An image is listed once per tag (e.g. {tag} and cache-{branch}), but is one item: its bytes are counted once,
+        # and it is removed by untagging all of its tags (`rmi ID` refuses an image with several).
+        images = {}
+        for img in df.get('Images') or []: images.setdefault(img['ID'], []).append(img)
+        for (image_id, rows) in images.items():
+            # Images which a container (even a stopped one) still uses cannot be removed.
+            if any(str(img.get('Containers', '0')) not in ['0', 'N/A'] for img in rows): continue
+            img = rows[0]
+            names = [f'{r.get("Repository")}:{r.get("Tag")}' for r in rows if r.get('Repository') != '<none>']
+            size = parse_size(img.get('UniqueSize') or '') or \
+                max(0, parse_size(img.get('Size', '0B')) - parse_size(img.get('SharedSize', '0B')))
+            used = max([parse_time(img.get('CreatedAt'), now)] + [last_used.get(n, 0) for n in names])
+            kind = 'image' if len(names) > 0 else 'dangling'
+            items.append(self._item(kind, ', '.join(names) if kind == 'image' else image_id, size, used,
+                lambda names=names, image_id=image_id: self._docker(f'rmi {" ".join(names) if names else image_id}')))
+        for b in df.get('BuildCache') or []:
+            if str(b.get('InUse', 'false')).lower() == 'true': continue
+            used = parse_time(b.get('LastUsedAt'), now) or parse_time(b.get('CreatedAt'), now)
+            items.append(self._item('build_cache', f'{b["ID"]} {b.get("Description", "")[:40]}'.strip(),
+                parse_size(b.get('Size', '0B')), used, lambda b=b: self._docker(f'builder prune -f --filter id={b["ID"]}')))
+        return items
+
+    def _item(self, kind, name, size, last_used, remove):
+        return {'kind': kind, 'name': name, 'bytes': size, 'last_used': last_used, 'remove': remove}
+
+    def _docker(self, cmd):
+        res = subprocess.run(f'docker {cmd}', shell=True, check=False, capture_output=True, text=True)
+        if res.returncode != 0: self.log.debug(res.stderr.strip())
+        return res.returncode == 0
+
+    def _remove_files(self, fps):
+        for fp in fps:
+            if os.path.isdir(fp) and not os.path.islink(fp): shutil.rmtree(fp, ignore_errors=True)
+            elif os.path.lexists(fp): os.remove(fp)
+        return True
+
+    def _by_kind(self, items):
+        ret = {}
+        for i in items:
+            k = ret.setdefault(i['kind'], {'items': 0, 'bytes': 0})
+            k['items'] += 1
+            k['bytes'] += i['bytes']
+        return ret
+
+    def _describe(self, by_kind):
+        if len(by_kind) <= 0: return 'nothing'
+        return ', '.join([f'{v["items"]} {k} {v["bytes"] / 1e9:.2f}GB' for (k, v) in by_kind.items()])
+
+    def _age(self, secs):
+        for (unit, n) in [('d', 86400), ('h', 3600), ('m', 60)]:
+            if secs >= n: return f'{secs / n:.0f}{unit}'
+        return f'{secs:.0f}s'
+
+class Disk(Maker):
+    # Add arguments.
+    def _parse_args(self, parser, method):
+        add_args(parser)
+        parser.add_argument('--kinds', default=','.join(costs),
+            help='The comma-separated kinds of items which may be evicted.')
+        parser.add_argument('--cache_dir',
+            default=os.getenv('UNITY_CACHE_DIR', os.path.expanduser('~/.cache/unity3d')),
+            help='Where Library snapshots are kept.')
+        return super()._parse_args(parser, method)
+
+    # Evict the warm state which is cheapest to lose, until the disk is under the watermark.
+    def gc(self):
+        opts = self.make.opts
+        gc = DiskGC(self.log, opts.kinds.split(','), opts.work, opts.cache_dir)
+        summary = gc.run(opts.disk or opts.work, opts.watermark, opts.budget * 1e9, opts.dry_run)
+        self._record(summary)
+
+    # List the items in the order they would be evicted.
+    def usage(self):
+        opts = self.make.opts
+        gc = DiskGC(self.log, opts.kinds.split(','), opts.work, opts.cache_dir)
+        now = time.time()
+        for i in gc.rank(gc.collect(now), now):
+            print(f'{i["kind"]:<12} {i["bytes"] / 1e6:>10.1f}MB {gc._age(now - i["last_used"]):>6}  {i["name"]}')
+
+    # Record the bytes reclaimed & kept of each kind as metrics.
+    def _record(self, summary):
+        for which in ['reclaimed', 'kept']:
+            for (kind, v) in summary[which].items(): self._metric(f'disk_{which}_bytes', kind, v['bytes'])
+            self._metric(f'disk_{which}_bytes', 'total', summary[f'{which}_bytes'])
+        self._metric('disk_used_ratio', '', summary['disk_used'] / summary['disk_total'])
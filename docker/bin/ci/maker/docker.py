@@ -1,6 +1,22 @@
 #!/usr/bin/env python3
-import subprocess, os
+import subprocess, os, re, json, shutil
 from .maker import Maker
+from .disk import DiskGC, docker_kinds, add_args as add_disk_args
+
+# The layers of a player, from the least to the most often changed: the engine (which only changes with the Unity
+# version), the data (which changes with the content) and the managed assemblies (which change with the code).
+layers = ['engine', 'data', 'managed']
+
+# The layer a file of a player belongs in, by its path within the player.
+def player_layer(rel):
+    parts = rel.replace(os.sep, '/').split('/')
+    if parts[0].startswith('GameAssembly.'): return 'managed'
+    if len(parts) < 2 or not parts[0].endswith('_Data'): return 'engine'
+    if parts[1] in ['Managed', 'il2cpp_data']: return 'managed'
+    if parts[1] in ['Plugins', 'MonoBleedingEdge', 'Mono', 'UnitySubsystems']: return 'engine'
+    # The small build settings next to the data list the assemblies, so they change along with them.
+    if len(parts) == 2 and (parts[1].endswith('.json') or parts[1] == 'boot.config'): return 'managed'
+    return 'data'
 
 class Docker(Maker):
     # container_dir = 'containers/'
@@ -15,15 +31,30 @@ class Docker(Maker):
             parser.add_argument('registry', default='', help='The docker registry.')
             parser.add_argument('--tag', default='', help='The docker tag.')
             parser.add_argument('--tar', default='', help='The docker registry.')
+            parser.add_argument('--layered', action='store_true', default=os.getenv('DOCKER_LAYERED', '') == 'true',
+                help='Split the player into layers by how often they change, and build with BuildKit\'s inline cache.')
+            parser.add_argument('--cache_from', default='',
+                help='Comma-separated images to reuse layers from (default: this branch\'s and master\'s last push).')
             # parser.add_argument('scenes', help='Which scenes to build (comma-separated).')
             # parser.add_argument('--unity_func', default='DataSculptUnityEditor.CI.Build.Compile', help='The build function.')
             # parser.add_argument('--unity_exe', default=self._get_default_unity_ci_path(), help='The Unity executable.')
             # # parser.add_argument('--unity_log', default='/dev/stdout', help='Where Unity should log.')
             # parser.add_argument('--unity_bin', default=os.path.join(os.getcwd(), 'bin'), help='The root output folder for Unity.')
+        if method == 'clean':
+            add_disk_args(parser)
+            parser.add_argument('--prune', action='store_true',
+                help='Remove every unused image, container & build cache entry, regardless of the disk budget.')
         return super()._parse_args(parser, method)
 
-    # Remove all build files.
+    # Free disk space: only evict the images & build cache which are the stalest and cheapest to get back, until the disk
+    # is under the watermark (or, with --prune, remove everything unused).
     def clean(self):
+        opts = self.make.opts
+        if not opts.prune:
+            summary = DiskGC(self.log, docker_kinds).run(opts.disk or opts.work, opts.watermark, opts.budget * 1e9,
+                opts.dry_run)
+            for which in ['reclaimed', 'kept']: self._metric(f'disk_{which}_bytes', 'total', summary[f'{which}_bytes'])
+            return
         self._clean_docker('network prune --force')
         self._clean_docker('system prune --force')
         self._clean_docker('rmi $(docker images --filter "dangling=true" -q --no-trunc)')
@@ -35,16 +66,130 @@ class Docker(Maker):
         t = self.make.opts.tag if len(self.make.opts.tag) > 0 else f'v{self.make.release}'
         tag = f'{self.make.opts.registry}/{self.make.opts.name}:{t}'
         src = f'bin/{self.make.opts.platform}'
+        if self.make.opts.layered: return self._build_layered(tag, src)
         df = os.path.join(os.path.dirname(self.make.bin), 'ci/Dockerfile')
         args = f'--build-arg PROJECT_NAME={self.make.opts.name}'
         cmd = f'docker build {args} {src} -f {df} -t "{tag}"'
         self.log.info(f'builing {tag} from {src} using {df}')
-        res = subprocess.run(cmd, shell=True, check=False, capture_output=True, text=True)
+        with self._phase('docker_build'):
+            res = subprocess.run(cmd, shell=True, check=False, capture_output=True, text=True)
         if res.returncode != 0:
             self.log.error(res.stderr.strip())
             exit(1)
         self.log.info(f'pushing {tag}')
-        if not self._exe(f'docker push {tag}'): exit(1)
+        with self._phase('docker_push'): ok = self._exe(f'docker push {tag}')
+        if not ok: exit(1)
+
+    # Build the player in layers ordered by how often they change, so a code change only rebuilds (and pushes) the
+    # managed assemblies. BuildKit reuses the layers of this branch's last push (or master's, for a new branch), and
+    # stores its cache inline in the pushed image for the next build.
+    def _build_layered(self, tag, src):
+        opts = self.make.opts
+        repo = tag.rsplit(':', 1)[0]
+        branches = [re.sub(r'[^\w.-]', '_', b) for b in [opts.prerelease, 'master'] if b]
+        cache_tags = [f'{repo}:cache-{b}' for b in dict.fromkeys(branches)]
+        cache_from = [c for c in opts.cache_from.split(',') if len(c) > 0] or cache_tags
+        ctx = os.path.join(src, '.docker-layers')
+        df = os.path.join(os.path.dirname(self.make.bin), 'ci/layered.Dockerfile')
+        with self._phase('docker_layers'): sizes = self._stage_layers(os.path.join(src, opts.name), ctx)
+        self.log.info('layers: ' + ' '.join([f'{l}={sizes[l] / 1e6:.1f}MB' for l in layers]))
+
+        args = f'--progress=plain --build-arg PROJECT_NAME={opts.name} --build-arg BUILDKIT_INLINE_CACHE=1'
+        args += ''.join([f' --cache-from {c}' for c in cache_from])
+        cmd = f'docker build {args} {ctx} -f {df} -t "{tag}" -t "{cache_tags[0]}"'
+        self.log.info(f'building {tag} from {src} in layers, reusing {", ".join(cache_from)}')
+        try:
+            with self._phase('docker_build'): (ok, lines) = self._stream(cmd, {'DOCKER_BUILDKIT': '1'})
+        finally:
+            shutil.rmtree(ctx, ignore_errors=True)
+        if not ok:
+            self.log.error(f'failed to build {tag}')
+            exit(1)
+        steps = self._buildkit_steps(lines)
+
+        pushed = set()
+        for t in [tag, cache_tags[0]]:
+            self.log.info(f'pushing {t}')
+            with self._phase('docker_push'): (ok, lines) = self._stream(f'docker push {t}')
+            if not ok:
+                self.log.error(f'failed to push {t}')
+                exit(1)
+            pushed.update([m.group(1) for m in [re.match(r'^([0-9a-f]{12}): Pushed', l) for l in lines] if m])
+        self._report_layers(tag, steps, pushed)
+
+    # Link (or copy) each file of the player into the layer it belongs in. Returns the bytes in each layer.
+    def _stage_layers(self, player, ctx):
+        if os.path.isdir(ctx): shutil.rmtree(ctx)
+        sizes = dict([(l, 0) for l in layers])
+        for l in layers: os.makedirs(os.path.join(ctx, 'layers', l))
+        for (root, dirs, files) in os.walk(player):
+            for fn in dirs + files:
+                fp = os.path.join(root, fn)
+                rel = os.path.relpath(fp, player)
+                layer = player_layer(rel)
+                dst = os.path.join(ctx, 'layers', layer, rel)
+                if os.path.isdir(fp) and not os.path.islink(fp):
+                    os.makedirs(dst, exist_ok=True)
+                    continue
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                if os.path.islink(fp):
+                    os.symlink(os.readlink(fp), dst)
+                    continue
+                try:
+                    os.link(fp, dst)
+                except OSError:
+                    shutil.copy2(fp, dst)
+                sizes[layer] += os.path.getsize(fp)
+        return sizes
+
+    # Whether each layer's step was reused from the cache, from BuildKit's plain progress output.
+    def _buildkit_steps(self, lines):
+        names = {}
+        cached = {}
+        for line in lines:
+            m = re.match(r'^#(\d+) \[[^\]]*\] COPY layers/(\w+)/', line)
+            if m: names[m.group(1)] = m.group(2)
+            m = re.match(r'^#(\d+) (CACHED|DONE)', line)
+            if m and m.group(1) in names: cached[names[m.group(1)]] = m.group(2) == 'CACHED'
+        return cached
+
+    # Log (and record) each layer's size, whether it was reused, and whether it had to be pushed.
+    def _report_layers(self, tag, steps, pushed):
+        sizes = self._layer_sizes(tag)
+        total = sum([size for (diff_id, size) in sizes])
+        pushed_bytes = sum([size for (diff_id, size) in sizes if diff_id[7:19] in pushed])
+        # The player's layers are the last in the image.
+        for (l, (diff_id, size)) in zip(layers, sizes[-len(layers):] if len(sizes) >= len(layers) else []):
+            self.log.info(f'layer {l:<8} {size / 1e6:>9.1f}MB  '
+                f'{"reused" if steps.get(l) else "rebuilt"}, {"pushed" if diff_id[7:19] in pushed else "already in the registry"}')
+            self._metric('docker_layer_bytes', l, size)
+            self._metric('docker_layer_reused', l, 1 if steps.get(l) else 0)
+        self._metric('docker_pushed_bytes', '', pushed_bytes)
+        self.log.info(f'pushed {pushed_bytes / 1e6:.1f}MB of {total / 1e6:.1f}MB ({len(pushed)} of {len(sizes)} layers)')
+
+    # The (DiffID, compressed size) of each layer of a pushed tag, from the bottom up. `docker push` names layers by
+    # their (short) DiffIDs, while the registry manifest lists the compressed blobs in the same order.
+    def _layer_sizes(self, tag):
+        res = subprocess.run(f'docker image inspect -f "{{{{json .RootFS.Layers}}}}" {tag}',
+            shell=True, check=False, capture_output=True, text=True)
+        try:                diff_ids = json.loads(res.stdout)
+        except ValueError:  return []
+        res = subprocess.run(f'docker manifest inspect {tag}', shell=True, check=False, capture_output=True, text=True)
+        try:                blobs = json.loads(res.stdout).get('layers', [])
+        except ValueError:  return []
+        if not diff_ids or len(blobs) != len(diff_ids): return []
+        return [(d, b.get('size', 0)) for (d, b) in zip(diff_ids, blobs)]
+
+    # Run a command, logging its output as it is written. Returns whether it succeeded, and the lines.
+    def _stream(self, cmd, env = {}):
+        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+            env=dict(os.environ, **env))
+        lines = []
+        for line in proc.stdout:
+            line = line.rstrip()
+            self.log.info(line)
+            lines.append(line)
+        return (proc.wait() == 0, lines)
 
     def _build_bazel(self):
         stamp = self.make.opts.tag
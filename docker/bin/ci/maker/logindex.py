@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import re, json, collections
+
+compiler_error = re.compile(r'(?P<file>[^\s(][^(]*)\((?P<line>\d+),(?P<column>\d+)\): error (?P<code>CS\d+): (?P<message>.*)')
+exception = re.compile(r'(?P<type>[\w.`]*Exception): (?P<message>.*)')
+shader_error = re.compile(r"Shader error in '(?P<shader>[^']*)': (?P<message>.*?)"
+    r"(?: at (?:line (?P<line>\d+)|(?P<file>.+?)\((?P<file_line>\d+)\)))?(?: \(on (?P<platform>\w+)\))?$")
+
+kinds = ['compiler_errors', 'shader_errors', 'exceptions', 'build_markers']
+
+# The most of a line which is kept (its end), however long the line is.
+max_line_length = 1 << 16
+
+# An index of the notable lines in a Unity log, built in one pass as the log is read: compiler errors (deduplicated,
+# as Unity repeats them), shader errors, exceptions with their stack traces, and [Build] markers. Every entry has
+# its line number & byte offset in the log. At most max_entries of each kind are kept (the rest are only counted).
+class LogIndex():
+    def __init__(self, on_entry = None, max_entries = 1000, max_stack = 200, max_tail = 100):
+        self.on_entry = on_entry
+        self.max_entries = max_entries
+        self.max_stack = max_stack
+        self.entries = dict([(k, []) for k in kinds])
+        self.counts = dict([(k, 0) for k in kinds])
+        self.tail = collections.deque(maxlen=max_tail)
+        self.lines = 0
+        self.bytes = 0
+        self._offset = 0
+        self._compiler_errors = {}
+        self._exception = None
+
+    # Index the next line of the log (without its line ending), which starts at offset bytes.
+    def add(self, line, offset):
+        self.lines += 1
+        self._offset = offset
+        self.tail.append(line)
+        if self._exception is not None:
+            # A stack trace ends at a blank line (or at the next [Build] marker).
+            if len(line.strip()) > 0 and not line.startswith('[Build]'):
+                if len(self._exception['stack']) < self.max_stack: self._exception['stack'].append(line)
+                return
+            self._end_exception()
+        # Cheap substring checks first, so most lines never reach a regex.
+        if line.startswith('[Build]'):
+            self._add('build_markers', {'text': line})
+        elif 'error CS' in line:
+            m = compiler_error.search(line)
+            if m: return self._add_compiler_error(m)
+        elif 'Shader error' in line:
+            m = shader_error.search(line)
+            if m:
+                self._add('shader_errors', {
+                    'shader': m.group('shader'),
+                    'message': m.group('message'),
+                    'file': m.group('file') or '',
+                    'source_line': int(m.group('line') or m.group('file_line') or 0),
+                    'platform': m.group('platform') or '',
+                    'text': line
+                })
+        if 'Exception:' in line:
+            m = exception.search(line)
+            if m: self._exception = self._entry({'type': m.group('type'), 'message': m.group('message'),
+                'text': line, 'stack': []})
+
+    # The log has ended (at size bytes); close any exception still being read.
+    def finish(self, size):
+        self.bytes = size
+        if self._exception is not None: self._end_exception()
+
+    def errors(self):
+        return sum([self.counts[k] for k in kinds if k != 'build_markers'])
+
+    def to_json(self):
+        ret = {'lines': self.lines, 'bytes': self.bytes, 'counts': self.counts}
+        ret.update(self.entries)
+        return ret
+
+    def write(self, fp):
+        with open(fp, 'w+') as f: json.dump(self.to_json(), f, indent=2)
+
+    # A readable description of an entry.
+    def format(self, kind, entry):
+        if kind == 'exceptions': return '\n'.join([entry['text']] + entry['stack'])
+        if kind == 'compiler_errors' and entry['count'] > 1: return f'{entry["text"]} (x{entry["count"]})'
+        return entry['text']
+
+    # Index a whole log file.
+    @staticmethod
+    def scan(fp, **kwargs):
+        index = LogIndex(**kwargs)
+        offset = 0
+        with open(fp, 'rb') as f:
+            partial = b''
+            start = 0
+            while True:
+                raw = f.readline(max_line_length)
+                if not raw and not partial: break
+                # A line longer than the limit is read in chunks, keeping only its end.
+                if raw and not raw.endswith(b'\n'):
+                    if not partial: start = offset
+                    partial = (partial + raw)[-max_line_length:]
+                    offset += len(raw)
+                    continue
+                if not partial: start = offset
+                index.add((partial + raw)[-max_line_length:].decode('utf-8', 'replace').rstrip('\r\n'), start)
+                offset += len(raw)
+                partial = b''
+        index.finish(offset)
+        return index
+
+    def _add_compiler_error(self, m):
+        key = (m.group('file'), m.group('line'), m.group('column'), m.group('code'))
+        if key in self._compiler_errors:
+            self._compiler_errors[key]['count'] += 1
+            return
+        entry = self._add('compiler_errors', {
+            'file': m.group('file'),
+            'source_line': int(m.group('line')),
+            'column': int(m.group('column')),
+            'code': m.group('code'),
+            'message': m.group('message'),
+            'count': 1,
+            'text': m.group(0)
+        })
+        if entry: self._compiler_errors[key] = entry
+
+    def _end_exception(self):
+        e = self._exception
+        self._exception = None
+        self.counts['exceptions'] += 1
+        if len(self.entries['exceptions']) >= self.max_entries: return
+        self.entries['exceptions'].append(e)
+        if self.on_entry: self.on_entry('exceptions', e)
+
+    def _entry(self, entry):
+        entry['line'] = self.lines
+        entry['offset'] = self._offset
+        return entry
+
+    def _add(self, kind, entry):
+        self.counts[kind] += 1
+        if len(self.entries[kind]) >= self.max_entries: return None
+        entry = self._entry(entry)
+        self.entries[kind].append(entry)
+        if self.on_entry: self.on_entry(kind, entry)
+        return entry
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import os, pkgutil, importlib, inspect, logging, subprocess
+import os, importlib, inspect, logging, subprocess, contextlib, json, time
 
 class Maker():
     # Assign all keyword arguments as properties on self, and keep the kwargs for later.
@@ -10,27 +10,65 @@ class Maker():
         ms = inspect.getmembers(self, predicate=inspect.ismethod)
         self.methods = dict([(n, m) for (n, m) in ms if not n.startswith('_')])
         self.log = logging.getLogger(self.__class__.__name__)
+        # Metrics are {metric_name: {key: value}}, written to metrics_dir (by default, bin/metrics/{maker}-{method} in
+        # the work directory).
+        self.metrics = {}
+        self.metrics_labels = {}
+        self.metrics_dir = None
 
     # Add the names of the methods to a parser object.
     def _parse_args(self, parser, method_name):
         return parser
 
-    # Instantiate one of each of the subclasses of this class.
-    def _load_subclasses(self):
-        module_dir = os.path.dirname(__file__)
-        module_name = os.path.basename(os.path.normpath(module_dir))
-        parent_class = self.__class__
-        modules = {}
-        # Load all the modules it the package:
-        for (module_loader, name, ispkg) in pkgutil.iter_modules([module_dir]):
-            modules[name] = importlib.import_module('.' + name, module_name)
-
-        # Instantiate one of each class, passing the keyword arguments.
-        ret = {}
-        for cls in parent_class.__subclasses__():
-            path = cls.__module__.split('.')
-            ret[path[-1]] = cls(**self._kwargs)
-        return ret
+    # Import the module for a subcommand, and instantiate the subclass of this class which it defines.
+    def _load_subclass(self, name, module_name):
+        package = os.path.basename(os.path.dirname(__file__))
+        module = importlib.import_module('.' + module_name, package)
+        for (n, cls) in inspect.getmembers(module, inspect.isclass):
+            if issubclass(cls, self.__class__) and cls.__module__ == module.__name__:
+                return cls(**self._kwargs)
+        raise Exception(f'{module.__name__} does not define a {self.__class__.__name__} for {name}')
+
+    # Time a phase of a method. Durations of repeated phases accumulate.
+    @contextlib.contextmanager
+    def _phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self._metric('phase_seconds', name, time.time() - start)
+
+    # Add a value to a metric.
+    def _metric(self, metric, key, value):
+        vals = self.metrics.setdefault(metric, {})
+        vals[key] = vals.get(key, 0) + value
+
+    # Log the phase timings, and write all metrics as JSON and in the Prometheus textfile format.
+    def _write_metrics(self, success):
+        phases = self.metrics.get('phase_seconds', {})
+        if len(phases) > 0:
+            self.log.info('timings: ' + ' '.join([f'{k}={v:.1f}s' for (k, v) in phases.items()]))
+        if not self.metrics_dir:
+            name = f'{self.make.maker_name}-{self.make.method_name}'
+            self.metrics_dir = os.path.join(self.make.opts.work, 'bin', 'metrics', name)
+            self.metrics_labels = dict({'maker': self.make.maker_name, 'method': self.make.method_name},
+                **self.metrics_labels)
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        self.metrics['success'] = {'': 1 if success else 0}
+        with open(os.path.join(self.metrics_dir, 'metrics.json'), 'w+') as fp:
+            json.dump({'labels': self.metrics_labels, 'metrics': self.metrics}, fp, indent=2)
+        lines = []
+        for (metric, vals) in self.metrics.items():
+            lines.append(f'# TYPE make_{metric} gauge')
+            for (key, value) in vals.items():
+                labels = dict(self.metrics_labels, **({'name': key} if key else {}))
+                labels = ','.join([f'{k}="{self._prom_escape(v)}"' for (k, v) in labels.items()])
+                lines.append(f'make_{metric}{{{labels}}} {value}')
+        with open(os.path.join(self.metrics_dir, 'metrics.prom'), 'w+') as fp: fp.write('\n'.join(lines) + '\n')
+
+    # Escape a Prometheus label value.
+    def _prom_escape(self, value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
 
     def _exe(self, cmd):
         res = subprocess.run(cmd, shell=True, check=False, capture_output=True, text=True)
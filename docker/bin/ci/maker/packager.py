@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+import os, json, time, zlib, struct, hashlib, tarfile, zipfile, collections
+from concurrent.futures import ThreadPoolExecutor
+
+# Files which are already compressed, and so are stored as-is in a zip.
+stored_extensions = ['.obb', '.bundle', '.ress', '.resource', '.unity3d', '.apk', '.aab', '.zip', '.gz', '.xz',
+    '.zst', '.png', '.jpg', '.jpeg', '.ogg', '.mp3', '.mp4', '.webm']
+
+formats = ['zip', 'tar.zst']
+
+# Packages build outputs into a single archive, compressing across all cores and streaming straight to disk.
+# Every file is hashed on the way through, and the hashes are written to a manifest.
+class Packager():
+    def __init__(self, jobs = None, chunk_size = 1 << 20, level = 6):
+        self.jobs = jobs if jobs else (os.cpu_count() or 1)
+        self.chunk_size = chunk_size
+        self.level = level
+
+    # Package the names (files or directories) within root to dst. Returns the manifest.
+    def package(self, fmt, root, names, dst, manifest_fp = None):
+        entries = self._entries(root, names)
+        start = time.time()
+        if fmt == 'zip': self._zip(entries, dst)
+        elif fmt == 'tar.zst': self._tar_zst(entries, dst)
+        else: raise Exception(f'Unknown package format {fmt} (expected one of {formats})')
+        manifest = {
+            'archive': os.path.basename(dst),
+            'format': fmt,
+            'size': os.path.getsize(dst),
+            'seconds': time.time() - start,
+            'files': dict([(e['name'], {'size': e['size'], 'sha256': e['sha256'], 'stored': e['stored']})
+                for e in entries if not e['dir']])
+        }
+        if manifest_fp:
+            with open(manifest_fp, 'w+') as fp: json.dump(manifest, fp, indent=2)
+        return manifest
+
+    # Unpack an archive written by package() into dst, restoring the file modes.
+    def extract(self, fmt, archive, dst):
+        if fmt == 'zip':
+            with zipfile.ZipFile(archive) as z:
+                for info in z.infolist():
+                    path = z.extract(info, dst)
+                    mode = (info.external_attr >> 16) & 0o777
+                    if mode and not info.is_dir(): os.chmod(path, mode)
+        elif fmt == 'tar.zst':
+            zstandard = self._zstandard()
+            with open(archive, 'rb') as raw, zstandard.ZstdDecompressor().stream_reader(raw) as f, \
+                    tarfile.open(fileobj=f, mode='r|') as tar:
+                tar.extractall(dst)
+        else: raise Exception(f'Unknown package format {fmt} (expected one of {formats})')
+
+    # List the directories and files to package (following symlinks, like `zip -r`).
+    def _entries(self, root, names):
+        ret = []
+        for name in names:
+            path = os.path.join(root, name)
+            if os.path.isfile(path):
+                ret.append(self._entry(path, name))
+                continue
+            for (d, dirs, files) in os.walk(path, followlinks=True):
+                dirs.sort()
+                rel = os.path.relpath(d, root)
+                ret.append(self._entry(d, rel + '/'))
+                for fn in sorted(files):
+                    fp = os.path.join(d, fn)
+                    if os.path.exists(fp): ret.append(self._entry(fp, os.path.join(rel, fn)))
+        return ret
+
+    def _entry(self, path, name):
+        st = os.stat(path)
+        is_dir = name.endswith('/')
+        return {
+            'path': path,
+            'name': name.replace(os.sep, '/'),
+            'dir': is_dir,
+            'mode': st.st_mode,
+            'mtime': st.st_mtime,
+            'size': 0 if is_dir else st.st_size,
+            'stored': is_dir or os.path.splitext(name)[1].lower() in stored_extensions,
+            'sha256': None
+        }
+
+    # Read a file in chunks, hashing it (SHA256 for the manifest, CRC32 for zip) along the way.
+    def _read(self, e):
+        sha = hashlib.sha256()
+        e['crc'] = 0
+        with open(e['path'], 'rb') as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                sha.update(chunk)
+                e['crc'] = zlib.crc32(chunk, e['crc'])
+                last = len(chunk) < self.chunk_size
+                yield (chunk, last)
+                if last: break
+        e['sha256'] = sha.hexdigest()
+
+    # Deflate one chunk of a file. Chunks are primed with the tail of the previous chunk, and all but the
+    # last end on a sync flush, so their concatenation is a single valid deflate stream (as pigz does).
+    def _deflate(self, chunk, prev, last):
+        if prev: c = zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=prev[-32768:])
+        else: c = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        return c.compress(chunk) + c.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+    # Write a zip. Chunks are compressed by a pool of threads while the results are written in order; the
+    # window of chunks in flight bounds the memory used.
+    def _zip(self, entries, dst):
+        window = self.jobs * 4
+        central = []
+        with open(dst, 'wb') as out, ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            queue = collections.deque()
+            for e in entries:
+                queue.append(('start', e, None))
+                if not e['dir']:
+                    prev = None
+                    for (chunk, last) in self._read(e):
+                        data = chunk if e['stored'] else pool.submit(self._deflate, chunk, prev, last)
+                        queue.append(('data', e, data))
+                        prev = chunk
+                        while len(queue) > window: self._zip_write(out, queue.popleft(), central)
+                queue.append(('end', e, None))
+            while queue: self._zip_write(out, queue.popleft(), central)
+            self._zip_central(out, central)
+
+    def _zip_write(self, out, item, central):
+        (kind, e, data) = item
+        if kind == 'start':
+            e['offset'] = out.tell()
+            e['csize'] = 0
+            e['zip64'] = e['size'] >= 0xF0000000
+            out.write(self._zip_local_header(e))
+        elif kind == 'data':
+            if not type(data) is bytes: data = data.result()
+            e['csize'] += len(data)
+            out.write(data)
+        else:
+            # Patch the CRC & sizes into the local header, now that they are known.
+            end = out.tell()
+            crc = e.get('crc', 0)
+            out.seek(e['offset'] + 14)
+            if e['zip64']:
+                out.write(struct.pack('<III', crc, 0xFFFFFFFF, 0xFFFFFFFF))
+                out.seek(e['offset'] + 30 + len(e['name'].encode()) + 4)
+                out.write(struct.pack('<QQ', e['size'], e['csize']))
+            else:
+                out.write(struct.pack('<III', crc, e['csize'], e['size']))
+            out.seek(end)
+            central.append(e)
+
+    def _zip_local_header(self, e):
+        name = e['name'].encode()
+        extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0) if e['zip64'] else b''
+        (dtime, ddate) = self._dos_time(e['mtime'])
+        return struct.pack('<IHHHHHIIIHH', 0x04034b50, 45 if e['zip64'] else 20, 0x0800,
+            0 if e['stored'] else 8, dtime, ddate, 0, 0, 0, len(name), len(extra)) + name + extra
+
+    def _zip_central(self, out, central):
+        cd_offset = out.tell()
+        for e in central:
+            name = e['name'].encode()
+            (usize, csize, offset) = (e['size'], e['csize'], e['offset'])
+            big = [v for v in [usize, csize, offset] if v >= 0xFFFFFFFF]
+            extra = b''
+            if big: extra = struct.pack('<HH', 0x0001, 8 * len(big)) + b''.join([struct.pack('<Q', v) for v in big])
+            (dtime, ddate) = self._dos_time(e['mtime'])
+            attr = ((e['mode'] & 0xFFFF) << 16) | (0x10 if e['dir'] else 0)
+            out.write(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | 45, 45 if big else 20, 0x0800,
+                0 if e['stored'] else 8, dtime, ddate, e.get('crc', 0),
+                min(csize, 0xFFFFFFFF), min(usize, 0xFFFFFFFF), len(name), len(extra), 0, 0, 0, attr,
+                min(offset, 0xFFFFFFFF)) + name + extra)
+        cd_size = out.tell() - cd_offset
+        count = len(central)
+        if count >= 0xFFFF or cd_size >= 0xFFFFFFFF or cd_offset >= 0xFFFFFFFF:
+            eocd64 = out.tell()
+            out.write(struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, count, count, cd_size, cd_offset))
+            out.write(struct.pack('<IIQI', 0x07064b50, 0, eocd64, 1))
+        out.write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+            min(cd_size, 0xFFFFFFFF), min(cd_offset, 0xFFFFFFFF), 0))
+
+    def _dos_time(self, mtime):
+        t = time.localtime(max(mtime, 315532800))
+        return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+    # Write a tar, compressed with multi-threaded zstd.
+    def _tar_zst(self, entries, dst):
+        zstandard = self._zstandard()
+        cctx = zstandard.ZstdCompressor(level=3, threads=self.jobs)
+        with open(dst, 'wb') as raw, cctx.stream_writer(raw) as out, tarfile.open(fileobj=out, mode='w|') as tar:
+            for e in entries:
+                info = tar.gettarinfo(e['path'], e['name'].rstrip('/'))
+                if e['dir']:
+                    tar.addfile(info)
+                    continue
+                # Dereference symlinks, as the zip format does.
+                info.type = tarfile.REGTYPE
+                info.linkname = ''
+                info.size = e['size']
+                chunks = self._read(e)
+                tar.addfile(info, _ChunkReader(chunks))
+                for _ in chunks: pass
+
+    def _zstandard(self):
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception('The tar.zst format requires the zstandard module (pip3 install zstandard)')
+        return zstandard
+
+# A file-like object over the chunks of a file, so tarfile can stream (and hash) it.
+class _ChunkReader():
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buf = b''
+        self.pos = 0
+
+    # tarfile expects every read to return the full size (until the end of the file).
+    def read(self, size = -1):
+        parts = []
+        while size != 0:
+            if self.pos >= len(self.buf):
+                chunk = next(self.chunks, None)
+                if not chunk or len(chunk[0]) <= 0: break
+                (self.buf, self.pos) = (chunk[0], 0)
+            n = len(self.buf) - self.pos
+            if size > 0: n = min(n, size)
+            parts.append(self.buf[self.pos:self.pos + n])
+            self.pos += n
+            if size > 0: size -= n
+        return b''.join(parts)
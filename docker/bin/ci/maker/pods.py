@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+import os, shutil, hashlib, tempfile, subprocess
+
+# Where CocoaPods keeps its spec repos.
+def repos_dir():
+    return os.path.join(os.getenv('CP_HOME_DIR', os.path.expanduser('~/.cocoapods')), 'repos')
+
+# A cache of installed pods (in a local or mounted directory), keyed by the Podfile (and lockfile) they were installed
+# from, plus a snapshot of the spec repos. The least-recently-used installs are evicted once the cache grows beyond
+# max_bytes.
+class PodCache():
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.pods = os.path.join(path, 'pods')
+        self.repos = os.path.join(path, 'repos.tar')
+        os.makedirs(self.pods, exist_ok=True)
+
+    # The key for the pods of an Xcode project: its Podfile, its Podfile.lock (if any) and the CocoaPods version.
+    def key(self, ios_dir, version = ''):
+        h = hashlib.sha1(version.encode())
+        for fn in ['Podfile', 'Podfile.lock']:
+            fp = os.path.join(ios_dir, fn)
+            if not os.path.isfile(fp): continue
+            h.update(fn.encode())
+            with open(fp, 'rb') as f: h.update(f.read())
+        return h.hexdigest()
+
+    # Restore Pods/ (and the Podfile.lock) into the Xcode project. Returns False on a miss.
+    def restore(self, key, ios_dir):
+        d = os.path.join(self.pods, key)
+        if not os.path.isdir(d): return False
+        os.utime(d)
+        self._tar(f'-xf {os.path.join(d, "Pods.tar")} -C {ios_dir}')
+        lock = os.path.join(d, 'Podfile.lock')
+        if os.path.isfile(lock) and not os.path.isfile(os.path.join(ios_dir, 'Podfile.lock')): shutil.copy2(lock, ios_dir)
+        return True
+
+    # Store the installed Pods/ (and Podfile.lock) of the Xcode project under key, then evict old installs.
+    def store(self, key, ios_dir):
+        d = os.path.join(self.pods, key)
+        if os.path.isdir(d) or not os.path.isdir(os.path.join(ios_dir, 'Pods')): return
+        tmp = tempfile.mkdtemp(dir=self.pods, prefix='.tmp-')
+        try:
+            self._tar(f'-cf {os.path.join(tmp, "Pods.tar")} -C {ios_dir} Pods')
+            lock = os.path.join(ios_dir, 'Podfile.lock')
+            if os.path.isfile(lock): shutil.copy2(lock, tmp)
+            os.rename(tmp, d)
+        except (OSError, subprocess.CalledProcessError):
+            # Another build stored the same key first (or the archive could not be written).
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self._evict(d)
+
+    # Restore the spec repos, unless CocoaPods already has them. Returns True if they were restored.
+    def restore_repos(self, dst):
+        if (os.path.isdir(dst) and len(os.listdir(dst)) > 0) or not os.path.isfile(self.repos): return False
+        os.makedirs(dst, exist_ok=True)
+        os.utime(self.repos)
+        self._tar(f'-xf {self.repos} -C {dst}')
+        return True
+
+    # Snapshot the spec repos (after an install which may have updated them).
+    def store_repos(self, src):
+        if not os.path.isdir(src) or len(os.listdir(src)) <= 0: return
+        tmp = f'{self.repos}.{os.getpid()}.tmp'
+        self._tar(f'-cf {tmp} -C {src} .')
+        os.replace(tmp, self.repos)
+
+    # The number & total size of the cached installs, and the size of the spec repos snapshot.
+    def stats(self):
+        dirs = [os.path.join(self.pods, fn) for fn in os.listdir(self.pods) if not fn.startswith('.')]
+        return {
+            'installs': len(dirs),
+            'bytes': sum([self._size(d) for d in dirs]),
+            'repos_bytes': os.path.getsize(self.repos) if os.path.isfile(self.repos) else 0
+        }
+
+    # Remove the least-recently-used installs until the cache (including the spec repos) fits within max_bytes.
+    def _evict(self, keep):
+        dirs = [os.path.join(self.pods, fn) for fn in os.listdir(self.pods) if not fn.startswith('.')]
+        dirs.sort(key=os.path.getmtime)
+        sizes = dict([(d, self._size(d)) for d in dirs])
+        total = sum(sizes.values()) + (os.path.getsize(self.repos) if os.path.isfile(self.repos) else 0)
+        for d in dirs:
+            if total <= self.max_bytes: break
+            if d == keep: continue
+            shutil.rmtree(d, ignore_errors=True)
+            total -= sizes[d]
+
+    def _size(self, d):
+        return sum([os.path.getsize(os.path.join(d, fn)) for fn in os.listdir(d)])
+
+    def _tar(self, args):
+        subprocess.run(f'tar {args}', shell=True, check=True, capture_output=True)
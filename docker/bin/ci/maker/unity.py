@@ -1,6 +1,39 @@
 #!/usr/bin/env python3
-import os, json, platform, subprocess, yaml, shutil
+import os, re, sys, json, platform, subprocess, shutil, hashlib, threading, time, filecmp
+from concurrent.futures import ThreadPoolExecutor
 from .maker import Maker
+from .packager import Packager, formats
+from .artifacts import ArtifactStore
+from .cache import BuildCache
+from .pods import PodCache, repos_dir as pod_repos_dir
+from .worker import WorkerBuild
+from .logindex import LogIndex, kinds as log_kinds, max_line_length
+
+# Files the build itself writes into the project, which must not change the fingerprint.
+volatile_files = [f'Assets/Resources/{fn}{ext}' for fn in ['Version.txt', 'Commit.txt'] for ext in ['', '.meta']]
+
+# Bounds on how much of the Unity log is held in memory while it is streamed.
+max_exception_lines = 200
+
+# Durations which Unity writes to its log: (metric name, text the line must contain, pattern, seconds per unit).
+log_timings = [
+    ('asset_refresh', 'Refresh completed', re.compile(r'Refresh completed in ([\d.]+) seconds'), 1),
+    ('asset_pipeline_refresh', 'Asset Pipeline', re.compile(r'Asset Pipeline Refresh: Total: ([\d.]+) seconds'), 1),
+    ('domain_reload', 'Completed reload', re.compile(r'Completed reload, in\s+([\d.]+) seconds'), 1),
+    ('native_plugins_refresh', 'native plugins',
+        re.compile(r'Refreshing native plugins compatible for Editor in ([\d.]+) ms'), 0.001),
+    ('script_compilation', 'finished in', re.compile(r'[Cc]ompil\w+ .*finished in ([\d.]+) ?s'), 1),
+]
+
+# Serializes the output of platforms building in parallel.
+print_lock = threading.Lock()
+
+# Use the OS to determine where Unity should be located.
+def default_unity_exe():
+    path = 'xvfb-run --auto-servernum --server-args=\'-screen 0 640x480x24\' /opt/Unity/Editor/Unity'
+    if platform.system() == 'Darwin':
+        path = '/Applications/Unity/Unity.app/Contents/MacOS/Unity'
+    return os.getenv('UNITY_CI', path)
 
 class Unity(Maker):
     # Add arguments.
@@ -10,12 +43,35 @@ class Unity(Maker):
                 default=self._get_default_unity_ci_path(), help='The Unity executable.')
         if method == 'build':
             parser.add_argument('name', help='The name of the project to build.')
-            parser.add_argument('platform', help='The Unity BuildTarget.')
+            parser.add_argument('platform', help='The Unity BuildTarget (or several, comma-separated).')
             parser.add_argument('scenes', help='Which scenes to build (comma-separated).')
             parser.add_argument('--unity_func',
                 default='Editor.UnityCI.Build.Compile', help='The build function.')
             parser.add_argument('--unity_bin',
                 default=os.path.join(os.getcwd(), 'bin'), help='The root output folder for Unity.')
+            parser.add_argument('--incremental', action='store_true',
+                help='Reuse the Library snapshot (and skip the build when the inputs are unchanged).')
+            parser.add_argument('--cache_dir',
+                default=os.getenv('UNITY_CACHE_DIR', os.path.expanduser('~/.cache/unity3d')),
+                help='Where Library snapshots are kept.')
+            parser.add_argument('--package', choices=formats, default='zip',
+                help='The archive format for the build (already-compressed files are stored as-is in a zip).')
+            parser.add_argument('--artifact_store', default=os.getenv('ARTIFACT_STORE', ''),
+                help='A content-addressed store to add the build output to (only new chunks are copied).')
+            parser.add_argument('--build_cache', default=os.getenv('UNITY_BUILD_CACHE', ''),
+                help='A (local or shared) directory of finished builds, to reuse when nothing which affects the player changed.')
+            parser.add_argument('--build_cache_size', type=float, default=50,
+                help='The maximum size (in GB) of the build cache.')
+            parser.add_argument('--pod_cache', default=os.getenv('UNITY_POD_CACHE', ''),
+                help='A directory of installed CocoaPods (and the spec repos), reused while the Podfile is unchanged.')
+            parser.add_argument('--pod_cache_size', type=float, default=10,
+                help='The maximum size (in GB) of the pod cache.')
+            parser.add_argument('--worker', default=os.getenv('UNITY_WORKER', ''),
+                help='Build on the resident editor of the worker pool in this directory (see `worker serve`).')
+            parser.add_argument('--jobs', type=int, default=1,
+                help='With several platforms, how many to build at once (each in a copy of the project).')
+            parser.add_argument('--job_memory', type=float, default=8,
+                help='The memory (in GB) to reserve for each parallel Unity build.')
         if method == 'activate':
             parser.add_argument('--unity_username',
                 default=os.getenv('UNITY_USERNAME', ''), help='The Unity account username.')
@@ -74,27 +130,33 @@ class Unity(Maker):
 
     # Main build function.
     def build(self):
+        platforms = [p for p in self.make.opts.platform.split(',') if len(p) > 0]
+        if len(platforms) > 1: return self._build_targets(platforms)
         name = self.make.opts.name
         self.log.info(f'Building {name} for {self.make.opts.platform}...')
 
-        # Clean bin
         bin_dir = os.path.join(self.make.opts.unity_bin, self.make.opts.platform)
         report_fp = os.path.join(bin_dir, 'build.json')
-        self.log.info(f'Building scenes {self.make.opts.scenes} to {bin_dir}')
-        if not os.path.exists(bin_dir): os.makedirs(bin_dir)
-        subprocess.run(f'rm -rf {bin_dir}/**', shell=True, check=False)
+        key_fp = os.path.join(bin_dir, 'inputs.sha1')
         output = os.path.join(bin_dir, name)
+        zf = f'{name}-{self.make.opts.platform}-{self.make.semver}.{self.make.opts.package}'
+        self.metrics_dir = bin_dir
+        self.metrics_labels = {'project': name, 'platform': self.make.opts.platform, 'version': self.make.semver}
 
         # Copy the CI
         if self.make.opts.unity_func.startswith('Editor.UnityCI'):
             uci_dest = os.path.join(self.make.opts.work, 'Assets/Editor/UnityCI')
             uci_src = os.path.join(os.path.dirname(self.make.bin), 'UnityCI')
             self.log.info(f'Installing UnityCI to {uci_dest}...')
-            os.makedirs(uci_dest, exist_ok=True)
-            for fn in os.listdir(uci_src):
-                ffn = os.path.join(uci_src, fn)
-                if os.path.isfile(ffn):
-                    shutil.copy(ffn, uci_dest)
+            with self._phase('install_ci'):
+                os.makedirs(uci_dest, exist_ok=True)
+                for fn in os.listdir(uci_src):
+                    ffn = os.path.join(uci_src, fn)
+                    # Unchanged scripts are left alone, so a resident editor does not recompile them.
+                    dfn = os.path.join(uci_dest, fn)
+                    if os.path.isfile(dfn) and filecmp.cmp(ffn, dfn, shallow=False): continue
+                    if os.path.isfile(ffn):
+                        shutil.copy(ffn, uci_dest)
 
         build_flags = {
             'Name': name,
@@ -111,15 +173,52 @@ class Unity(Maker):
             if not build_flags['Name'].endswith('.apk'):
                 build_flags['Name'] += '.apk'
 
+        # Skip the whole build when neither the project nor the (commit-independent) flags changed.
+        if self.make.opts.incremental:
+            build_flags['Incremental'] = 'true'
+            with self._phase('fingerprint'): fingerprint = self._fingerprint()
+            key = self._build_key(fingerprint, build_flags)
+            if self._read(key_fp) == key and os.path.isfile(os.path.join(bin_dir, zf)):
+                self.log.info(f'Inputs unchanged ({key}); reusing {zf}')
+                return
+
+        # Clean bin
+        self.log.info(f'Building scenes {self.make.opts.scenes} to {bin_dir}')
+        if not os.path.exists(bin_dir): os.makedirs(bin_dir)
+        with self._phase('clean'): subprocess.run(f'rm -rf {bin_dir}/**', shell=True, check=False)
+
+        # Reuse a finished build of the same sources, flags and Unity version.
+        cache = None
+        if self.make.opts.build_cache:
+            cache = BuildCache(self.make.opts.build_cache, self.make.opts.build_cache_size * 1e9)
+            with self._phase('build_cache'):
+                cache_key = self._cache_key(build_flags)
+                hit = cache.get(cache_key, bin_dir)
+                if hit: Packager().extract(self.make.opts.package, os.path.join(bin_dir, zf), bin_dir)
+            self._log_cache(cache, cache_key, hit)
+            if hit: return
+        if self.make.opts.incremental:
+            with self._phase('restore_library'): self._restore_library()
+
         # Build Unity game.
-        self._unity_exec(self.make.opts.work, bin_dir, build_flags)
+        with self._phase('unity'):
+            if self.make.opts.worker and self.make.opts.unity_func == 'Editor.UnityCI.Build.Compile':
+                self._unity_worker(self.make.opts.work, bin_dir, build_flags)
+            else:
+                self._unity_exec(self.make.opts.work, bin_dir, build_flags)
 
         success = False
         if os.path.isfile(report_fp):
             with open(report_fp) as file: report = json.load(file)
             size = report['totalSize']
-            time = report['totalTime']
-            self.log.info(f'built {size}b in {time}')
+            duration = report['totalTime']
+            self.log.info(f'built {size}b in {duration}')
+            self._metric('build_size_bytes', '', int(size))
+            self._metric('build_player_seconds', '', self._timespan_seconds(duration))
+            for step in report.get('steps', '').split('\n'):
+                if '\t' not in step: continue
+                (secs, step_name) = step.split('\t', 1)
+                self._metric('unity_step_seconds', step_name, float(secs))
             if report["errors"]:
                 for err in report["errors"].split('\n'):
                     if len(err) > 0:
@@ -132,25 +231,268 @@ class Unity(Maker):
             ios_dir = os.path.join(output, name)
             podfile = os.path.join(ios_dir, 'Podfile')
             if os.path.isfile(podfile):
-                self.log.info(f'Installing cocoapods...')
-                podlog = os.path.join(bin_dir, 'pod.log')
-                cmd = f'pod install --project-directory={ios_dir} > {podlog}'
-                if not self._exe(cmd):
-                    self.log.error(f'Failed to install {podfile}')
-                    exit(1)
+                self._pod_install(ios_dir, bin_dir)
             else:
                 self.log.info(f'No cocoapod installation required at {podfile}')
 
-        zf = f'{name}-{self.make.opts.platform}-{self.make.semver}.zip'
-        if not self._exe(f'cd {bin_dir} && zip -rq {zf} {name}'): exit(1)
+        self.log.info(f'Packaging {zf}...')
+        with self._phase('package'):
+            try:
+                manifest = Packager().package(self.make.opts.package, bin_dir, [name],
+                    os.path.join(bin_dir, zf), os.path.join(bin_dir, 'manifest.json'))
+            except Exception as e:
+                self.log.error(f'Failed to package {zf}: {e}')
+                exit(1)
+        self._metric('package_size_bytes', '', manifest['size'])
+        if self.make.opts.artifact_store:
+            build_id = zf[:-len(self.make.opts.package) - 1]
+            with self._phase('artifact_store'):
+                stats = ArtifactStore(self.make.opts.artifact_store).put(build_id, output)
+            self.log.info(f'Stored {build_id} in {self.make.opts.artifact_store}: '
+                f'{stats["new_bytes"]}b new, {stats["reused_bytes"]}b reused')
+            self._metric('artifact_bytes', 'new', stats['new_bytes'])
+            self._metric('artifact_bytes', 'reused', stats['reused_bytes'])
+        if cache:
+            files = [os.path.join(bin_dir, fn) for fn in [zf, 'build.json', 'manifest.json']]
+            with self._phase('build_cache_store'): cache.put(cache_key, files)
+        if self.make.opts.incremental:
+            with open(key_fp, 'w+') as fp: fp.write(key)
+            with self._phase('save_library'): self._save_library(fingerprint)
         self.log.info(f'Buld completed: {zf}')
 
+    # Install the Xcode project's pods. With a pod cache, Pods/ and the spec repos are restored first when the Podfile
+    # is unchanged, so `pod install` only has to integrate them; after a miss, the installed pods are stored.
+    def _pod_install(self, ios_dir, bin_dir):
+        podfile = os.path.join(ios_dir, 'Podfile')
+        cache = PodCache(self.make.opts.pod_cache, self.make.opts.pod_cache_size * 1e9) if self.make.opts.pod_cache else None
+        hit = False
+        if cache:
+            start = time.time()
+            with self._phase('pod_restore'):
+                res = subprocess.run('pod --version', shell=True, check=False, capture_output=True, text=True)
+                key = cache.key(ios_dir, res.stdout.strip())
+                try:
+                    hit = cache.restore(key, ios_dir)
+                    repos = cache.restore_repos(pod_repos_dir())
+                except subprocess.CalledProcessError as e:
+                    self.log.warning(f'Could not restore the pod cache: {e.stderr.decode().strip()}')
+                    (hit, repos) = (False, False)
+                    shutil.rmtree(os.path.join(ios_dir, 'Pods'), ignore_errors=True)
+            self.log.info(f'Pod cache {"hit" if hit else "miss"} ({key}): restored '
+                f'{"Pods/" if hit else "nothing"}{" and the spec repos" if repos else ""} in {time.time() - start:.1f}s')
+            self._metric('pod_cache', 'hit' if hit else 'miss', 1)
+
+        self.log.info(f'Installing cocoapods...')
+        podlog = os.path.join(bin_dir, 'pod.log')
+        start = time.time()
+        with self._phase('pod_install'): ok = self._exe(f'pod install --project-directory={ios_dir} > {podlog}')
+        if not ok:
+            self.log.error(f'Failed to install {podfile}')
+            exit(1)
+        self.log.info(f'Installed cocoapods in {time.time() - start:.1f}s')
+
+        if cache and not hit:
+            with self._phase('pod_store'):
+                try:
+                    cache.store(key, ios_dir)
+                    cache.store_repos(pod_repos_dir())
+                except subprocess.CalledProcessError as e:
+                    self.log.warning(f'Could not store the pod cache: {e.stderr.decode().strip()}')
+            stats = cache.stats()
+            self.log.info(f'Pod cache: {stats["installs"]} installs ({stats["bytes"]}b), '
+                f'spec repos {stats["repos_bytes"]}b')
+
+    # Build several platforms from one checkout. The first builds in the project itself (importing the Library);
+    # the rest either follow it in sequence, or build in parallel from copies of the imported project.
+    def _build_targets(self, platforms):
+        work = os.path.abspath(self.make.opts.work)
+        jobs = self._max_parallel(len(platforms) - 1)
+        # Each platform's build writes its own metrics; these are the parent's (e.g. how long each platform took).
+        self.metrics_dir = self.make.opts.unity_bin
+        self.metrics_labels = {'project': self.make.opts.name, 'platform': ','.join(platforms), 'version': self.make.semver}
+        self.log.info(f'Building {platforms} ({jobs} at a time after {platforms[0]})...')
+        results = {platforms[0]: self._build_target(platforms[0], work)}
+        if jobs <= 1:
+            for p in platforms[1:]: results[p] = self._build_target(p, work)
+        else:
+            # The copies go in the project's Temp, which is never copied itself and which `clean` removes too.
+            copies = os.path.join(work, 'Temp', 'platforms')
+            try:
+                with ThreadPoolExecutor(max_workers=jobs) as pool:
+                    futures = []
+                    for p in platforms[1:]:
+                        dst = self._copy_project(work, os.path.join(copies, p))
+                        futures.append((p, pool.submit(self._build_target, p, dst)))
+                    for (p, f) in futures: results[p] = f.result()
+            finally:
+                # The copies hold a whole project (and Library) each.
+                shutil.rmtree(copies, ignore_errors=True)
+
+        # Combine the per-platform reports into a summary.
+        summary = {}
+        for p in platforms:
+            report_fp = os.path.join(self.make.opts.unity_bin, p, 'build.json')
+            report = {}
+            if os.path.isfile(report_fp):
+                with open(report_fp) as file: report = json.load(file)
+            summary[p] = {
+                'success': results[p][0],
+                'seconds': results[p][1],
+                'result': report.get('result', ''),
+                'totalSize': report.get('totalSize', ''),
+                'totalTime': report.get('totalTime', '')
+            }
+            self.log.info(f'{p:<24} {"ok" if results[p][0] else "FAILED":<8} {results[p][1]:>8.1f}s {summary[p]["totalSize"]}b')
+        os.makedirs(self.make.opts.unity_bin, exist_ok=True)
+        with open(os.path.join(self.make.opts.unity_bin, 'summary.json'), 'w+') as fp: json.dump(summary, fp, indent=2)
+        if not all(ok for (ok, secs) in results.values()): exit(1)
+
+    # Build a single platform by running make.py for it, in the given project directory.
+    # Returns whether it succeeded, and how many seconds it took.
+    def _build_target(self, platform, work):
+        opts = self.make.opts
+        args = list(sys.argv[3:])
+        args[args.index(opts.platform)] = platform
+        args += ['--work', work, '--unity_bin', os.path.abspath(opts.unity_bin)]
+        # The copies have no .git, so pass on the version this build resolved rather than let them resolve their own.
+        args += ['--version', opts.version, '--commit', opts.commit, '--prerelease', opts.prerelease, '--build', opts.build]
+        start = time.time()
+        with self._phase(platform):
+            cmd = [sys.executable, os.path.abspath(self.make.fp), 'unity', 'build'] + args
+            proc = subprocess.Popen(cmd, cwd=work,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors='replace')
+            for line in proc.stdout:
+                with print_lock: print(f'[{platform}] {line.rstrip()}', flush=True)
+            ok = proc.wait() == 0
+        return (ok, time.time() - start)
+
+    # Copy the project (with its Library, but without outputs) to dst, for a platform to build from in parallel.
+    def _copy_project(self, work, dst):
+        self.log.info(f'Copying the project to {dst}...')
+        if os.path.isdir(dst): shutil.rmtree(dst)
+        shutil.copytree(work, dst, symlinks=True, ignore=shutil.ignore_patterns('bin', 'Temp', '.git'))
+        return dst
+
+    # How many Unity builds can run at once, given the cores and memory available.
+    def _max_parallel(self, count):
+        jobs = min(self.make.opts.jobs, count, max(1, (os.cpu_count() or 1) // 2))
+        if os.path.isfile('/proc/meminfo'):
+            with open('/proc/meminfo') as f: meminfo = f.read()
+            m = re.search(r'MemAvailable:\s+(\d+) kB', meminfo)
+            if m: jobs = min(jobs, max(1, int(int(m.group(1)) * 1024 / (self.make.opts.job_memory * 1e9))))
+        return jobs
+
     # Remove all build files.
     def clean(self):
         self._clean_unity('Library')
         self._clean_unity('Temp')
         self._clean_unity('bin/**')
 
+    # Hash the contents of the project inputs (ignoring the files the build itself writes).
+    def _fingerprint(self):
+        work = self.make.opts.work
+        h = hashlib.sha1()
+        for d in ['Assets', 'Packages', 'ProjectSettings']:
+            for (root, dirs, files) in os.walk(os.path.join(work, d)):
+                dirs.sort()
+                for fn in sorted(files):
+                    fp = os.path.join(root, fn)
+                    rel = os.path.relpath(fp, work)
+                    if rel in volatile_files: continue
+                    h.update(rel.encode())
+                    self._hash_file(h, fp)
+        return h.hexdigest()
+
+    # The key for a build: the project fingerprint plus all the flags which do not depend on the commit.
+    def _build_key(self, fingerprint, flags):
+        flags = dict([(k, v) for (k, v) in flags.items() if k != 'Commit'])
+        flags['unity_exe'] = self.make.opts.unity_exe
+        h = hashlib.sha1(fingerprint.encode())
+        h.update(json.dumps(flags, sort_keys=True).encode())
+        return h.hexdigest()
+
+    # The key for the build cache: the tracked project files, the flags (except for local paths) and the Unity version.
+    # Unlike the incremental key, this includes the commit, as it is written into the player.
+    def _cache_key(self, flags):
+        flags = dict([(k, v) for (k, v) in flags.items() if not k in ['OutputDir', 'ReportFile', 'Incremental']])
+        flags['package'] = self.make.opts.package
+        flags['unity'] = os.getenv('UNITY_VERSION', self.make.opts.unity_exe)
+        h = hashlib.sha1(self._tracked_fingerprint().encode())
+        h.update(json.dumps(flags, sort_keys=True).encode())
+        return h.hexdigest()
+
+    # Hash the project files git tracks (by their blob IDs, so nothing is read), plus any modified or untracked ones.
+    # Falls back to hashing every file when the project is not a git checkout.
+    def _tracked_fingerprint(self):
+        work = self.make.opts.work
+        paths = 'Assets Packages ProjectSettings'
+        res = subprocess.run(f'git ls-files -s -- {paths}', cwd=work, shell=True, check=False, capture_output=True, text=True)
+        if res.returncode != 0: return self._fingerprint()
+        h = hashlib.sha1(res.stdout.encode())
+        res = subprocess.run(f'git ls-files -m -o --exclude-standard -- {paths}',
+            cwd=work, shell=True, check=False, capture_output=True, text=True)
+        for rel in sorted(set(res.stdout.split('\n'))):
+            fp = os.path.join(work, rel)
+            if len(rel) <= 0 or rel in volatile_files or not os.path.isfile(fp): continue
+            h.update(rel.encode())
+            self._hash_file(h, fp)
+        return h.hexdigest()
+
+    def _hash_file(self, h, fp):
+        with open(fp, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''): h.update(chunk)
+
+    # Log (and record) a build cache lookup, with the cache's running totals.
+    def _log_cache(self, cache, key, hit):
+        stats = cache.stats()
+        self.log.info(f'Build cache {"hit" if hit else "miss"} ({key}): {stats["hits"]} hits, {stats["misses"]} misses, '
+            f'{stats["evictions"]} evictions, {stats["builds"]} builds ({stats["bytes"]}b)')
+        self._metric('build_cache', 'hit' if hit else 'miss', 1)
+        for k in ['hits', 'misses', 'evictions', 'bytes']: self._metric('build_cache_total', k, stats[k])
+
+    # The Library snapshot path for a branch (without extension).
+    def _library_snapshot(self, branch):
+        branch = re.sub(r'[^\w.-]', '_', branch if branch else 'master')
+        return os.path.join(self.make.opts.cache_dir, 'library', branch)
+
+    # Restore the Library from this branch's snapshot (or master's, for new branches).
+    def _restore_library(self):
+        lib = os.path.join(self.make.opts.work, 'Library')
+        if os.path.isdir(lib):
+            self.log.info(f'Using the existing {lib}')
+            return
+        for branch in [self.make.opts.prerelease, 'master']:
+            snap = self._library_snapshot(branch) + '.tar'
+            if not os.path.isfile(snap): continue
+            self.log.info(f'Restoring Library from {snap}...')
+            # The snapshot's mtime is its last use, for the disk GC.
+            os.utime(snap)
+            if self._exe(f'tar -xf {snap} -C {self.make.opts.work}'): return
+        self.log.info('No Library snapshot found; Unity will import all assets.')
+
+    # Snapshot the Library for this branch, unless the snapshot was already taken of the same inputs.
+    def _save_library(self, fingerprint):
+        if not os.path.isdir(os.path.join(self.make.opts.work, 'Library')):
+            self.log.info('No Library to snapshot.')
+            return
+        snap = self._library_snapshot(self.make.opts.prerelease)
+        if self._read(snap + '.sha1') == fingerprint: return
+        os.makedirs(os.path.dirname(snap), exist_ok=True)
+        self.log.info(f'Saving Library snapshot to {snap}.tar...')
+        tmp = f'{snap}.{os.getpid()}.tmp'
+        try:
+            if not self._exe(f'tar -cf {tmp} -C {self.make.opts.work} Library'): return
+            os.replace(tmp, snap + '.tar')
+        finally:
+            # A partial archive (e.g. the disk filled up) would otherwise be left behind.
+            if os.path.exists(tmp): os.remove(tmp)
+        with open(snap + '.sha1', 'w+') as fp: fp.write(fingerprint)
+
+    # Read a small text file (or an empty string, if it does not exist).
+    def _read(self, fp):
+        if not os.path.isfile(fp): return ''
+        with open(fp) as f: return f.read().strip()
+
     # Remove a directory within the Unity folder.
     def _clean_unity(self, directory):
         directory = f'{self.make.opts.work}/{directory}'
@@ -177,38 +519,121 @@ class Unity(Maker):
             cmd += [f'-{key}', value]
         cmd = ' '.join(cmd)
         self.log.info(f'Running unity command: \n{cmd}')
-        res = subprocess.run(cmd, shell=True, check=False, capture_output=True, text=True)
-        with open(out_file, 'w+') as fp: fp.write(res.stdout.strip())
-        with open(err_file, 'w+') as fp: fp.write(res.stderr.strip())
-        if os.path.isfile(log_file):
-            with open(log_file, 'r') as stream: logs = stream.read().split('\n')
-            for line in logs:
-                if line.startswith('[Build]'):
-                    self.log.info(line)
-        if res.returncode != 0:
-            self.log.error(self._get_unity_exception(log_file, err_file, out_file))
+        if os.path.isfile(log_file): os.remove(log_file)
+
+        # Stream the pipes to their files and index the log while Unity runs, so nothing is buffered.
+        index = self._log_index()
+        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, errors='replace')
+        threads = [
+            threading.Thread(target=self._copy_pipe, args=(proc.stdout, out_file)),
+            threading.Thread(target=self._copy_pipe, args=(proc.stderr, err_file)),
+            threading.Thread(target=self._tail_log, args=(log_file, proc, index))
+        ]
+        for t in threads: t.start()
+        proc.wait()
+        for t in threads: t.join()
+        self._write_log_index(index, log_dir)
+        if proc.returncode != 0:
+            if index.errors() <= 0: self.log.error(self._get_unity_exception(log_file, err_file, out_file))
+            return False
+        return True
+
+    # Build on a resident editor of the worker pool, tailing its log as _unity_exec does.
+    # Falls back to starting Unity when there is no pool running.
+    def _unity_worker(self, project_path, log_dir, flags):
+        sock = os.path.join(self.make.opts.worker, 'worker.sock')
+        if not os.path.exists(sock):
+            self.log.warning(f'No worker pool at {sock}; starting Unity instead')
+            return self._unity_exec(project_path, log_dir, flags)
+        log_file = os.path.join(log_dir, 'unity.log')
+        if os.path.isfile(log_file): os.remove(log_file)
+        open(log_file, 'w+').close()
+        self.log.info(f'Building on the worker pool at {sock}...')
+        req = {'project': os.path.abspath(project_path), 'flags': flags, 'log_file': os.path.abspath(log_file)}
+        index = self._log_index()
+        build = WorkerBuild(self.make.opts.worker, req)
+        self._tail_log(log_file, build, index)
+        build.join()
+        self._write_log_index(index, log_dir)
+        self.log.info(f'{"Warm" if build.res.get("warm") else "Cold"} worker build took {build.res.get("seconds", 0):.1f}s')
+        self._metric('worker_builds', 'warm' if build.res.get('warm') else 'cold', 1)
+        if not build.res['ok']:
+            if index.errors() <= 0: self.log.error(build.res['error'])
             return False
         return True
 
-    # Look at a Unity output file and throw any exception found therein.
+    # An index for the Unity log, which logs [Build] markers and errors as they are found.
+    def _log_index(self):
+        def on_entry(kind, entry):
+            if kind == 'build_markers': self.log.info(entry['text'])
+            else: self.log.error(index.format(kind, entry))
+        index = LogIndex(on_entry=on_entry, max_stack=max_exception_lines)
+        return index
+
+    # Write the index next to the build report, and count what was found.
+    def _write_log_index(self, index, log_dir):
+        fp = os.path.join(log_dir, 'log-index.json')
+        index.write(fp)
+        for k in log_kinds: self._metric('unity_log_entries', k, index.counts[k])
+        if index.errors() > 0:
+            counts = ', '.join([f'{index.counts[k]} {k.replace("_", " ")}' for k in log_kinds if k != 'build_markers'])
+            self.log.warning(f'The Unity log has {counts} (see {fp})')
+
+    # Write a process pipe to a file as it is produced.
+    def _copy_pipe(self, pipe, fp):
+        with open(fp, 'w+') as f:
+            for line in pipe:
+                f.write(line)
+                f.flush()
+
+    # Follow the Unity log until the process exits, indexing each line once as it appears (which also logs the
+    # [Build] markers and errors as they are found).
+    def _tail_log(self, fp, proc, index):
+        while not os.path.isfile(fp):
+            if proc.poll() is not None:
+                index.finish(0)
+                return
+            time.sleep(0.2)
+        partial = b''
+        start = 0
+        with open(fp, 'rb') as f:
+            while True:
+                running = proc.poll() is None
+                if not partial: start = f.tell()
+                # Bounded, so a long run of output without a newline (e.g. a progress bar) is read in chunks.
+                line = f.readline(max_line_length)
+                if not line.endswith(b'\n') and (running or len(line) >= max_line_length):
+                    partial = (partial + line)[-max_line_length:]
+                    if not line: time.sleep(0.2)
+                    continue
+                if not line and not partial: break
+                line = (partial + line)[-max_line_length:].decode('utf-8', 'replace').rstrip('\r\n')
+                partial = b''
+                index.add(line, start)
+                for (metric, text, pattern, scale) in log_timings:
+                    if not text in line: continue
+                    m = pattern.search(line)
+                    if m: self._metric('unity_log_seconds', metric, float(m.group(1)) * scale)
+            index.finish(f.tell())
+
+    # Look at a Unity output file and return the first exception found therein (or the end of the log), in one pass.
     def _get_unity_exception(self, fp, fp_err, fp_out):
         if not os.path.isfile(fp):
             with open(fp_err) as file: ret = file.read()
             if ret and len(ret) > 0: return ret
             with open(fp_out) as file: return file.read()
-        with open(fp) as file: contents = file.read()
-        lines = contents.split('\n')
-        while len(lines) > 0 and not 'Exception:' in lines[0]: del(lines[0])
-        if len(lines) <= 0: return contents
-        i = 0
-        while i < len(lines) and len(lines[i].strip()) > 0: i += 1
-        if i < len(lines): lines = lines[0:i]
-        return '\n'.join(lines)
+        index = LogIndex.scan(fp, max_stack=max_exception_lines)
+        if len(index.entries['exceptions']) > 0: return index.format('exceptions', index.entries['exceptions'][0])
+        return '\n'.join(index.tail)
+
+    # Convert a .NET TimeSpan string ([d.]hh:mm:ss[.fffffff]) to seconds.
+    def _timespan_seconds(self, ts):
+        days = 0
+        if '.' in ts.split(':')[0]: (days, ts) = ts.split('.', 1)
+        (h, m, sec) = ts.split(':')
+        return int(days) * 86400 + int(h) * 3600 + int(m) * 60 + float(sec)
 
     # Use the OS to determine where Unity should be located.
     def _get_default_unity_ci_path(self):
-      sys = platform.system()
-      path = 'xvfb-run --auto-servernum --server-args=\'-screen 0 640x480x24\' /opt/Unity/Editor/Unity'
-      if sys == 'Darwin':
-        path = '/Applications/Unity/Unity.app/Contents/MacOS/Unity'
-      return os.getenv('UNITY_CI', path)
\ No newline at end of file
+      return default_unity_exe()
\ No newline at end of file
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+import os, json, time, signal, socket, socketserver, subprocess, threading, hashlib, shutil
+from .maker import Maker
+
+# A batchmode editor kept resident for one project. It takes requests through files in its directory (see
+# UnityCI/Worker.cs), and writes a heartbeat while it is idle.
+class Editor():
+    def __init__(self, unity_exe, project, path):
+        self.unity_exe = unity_exe
+        self.project = project
+        self.path = path
+        self.log_fp = os.path.join(path, 'unity.log')
+        self.proc = None
+        self.builds = 0
+        self.last_used = time.time()
+
+    def start(self):
+        if os.path.isdir(self.path): shutil.rmtree(self.path)
+        os.makedirs(self.path)
+        cmd = f'{self.unity_exe} -nographics -batchmode -projectPath {self.project} ' + \
+            f'-executeMethod Editor.UnityCI.Worker.Serve -workerDir {self.path} -logFile {self.log_fp}'
+        with open(os.path.join(self.path, 'editor.out.log'), 'w+') as out:
+            # A session of its own, so the whole tree (e.g., xvfb-run and Unity) can be stopped together.
+            self.proc = subprocess.Popen(cmd, shell=True, stdout=out, stderr=subprocess.STDOUT, start_new_session=True)
+        self.started = time.time()
+        self.builds = 0
+
+    # Whether the editor is running and (once it has started up) its heartbeat is recent. The editor cannot beat while
+    # it builds, so the end of its last build counts as a beat too.
+    def healthy(self, health_timeout, startup_timeout):
+        if not self.proc or self.proc.poll() is not None: return False
+        hb = os.path.join(self.path, 'heartbeat')
+        if not os.path.isfile(hb): return time.time() - self.started < startup_timeout
+        return time.time() - max(os.path.getmtime(hb), self.last_used) < health_timeout
+
+    # Build the flags, copying the editor's log for this build to log_fp as it is written.
+    # Returns an error, or None on success.
+    def build(self, req_id, flags, log_fp, timeout):
+        self.last_used = time.time()
+        offset = os.path.getsize(self.log_fp) if os.path.isfile(self.log_fp) else 0
+        tmp = os.path.join(self.path, f'{req_id}.tmp')
+        with open(tmp, 'w+') as fp:
+            for (k, v) in flags.items(): fp.write(f'{k}={v}\n')
+        os.replace(tmp, os.path.join(self.path, f'{req_id}.req'))
+        res = os.path.join(self.path, f'{req_id}.res')
+        error = None
+        with open(log_fp, 'ab') as out:
+            while True:
+                offset = self._copy_log(offset, out)
+                if os.path.isfile(res):
+                    with open(res) as fp: error = fp.read().strip() or None
+                    os.remove(res)
+                    break
+                if self.proc.poll() is not None:
+                    error = f'The editor exited ({self.proc.returncode})'
+                    break
+                if time.time() - self.last_used > timeout:
+                    error = f'The build timed out after {timeout}s'
+                    self.stop(grace=0)
+                    break
+                time.sleep(0.2)
+            self._copy_log(offset, out)
+        self.builds += 1
+        self.last_used = time.time()
+        return error
+
+    def _copy_log(self, offset, out):
+        if not os.path.isfile(self.log_fp): return offset
+        with open(self.log_fp, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        out.write(data)
+        out.flush()
+        return offset + len(data)
+
+    # Ask the editor to quit, killing it if it does not.
+    def stop(self, grace = 30):
+        if not self.proc or self.proc.poll() is not None: return
+        open(os.path.join(self.path, 'stop'), 'w+').close()
+        try:
+            self.proc.wait(grace)
+        except subprocess.TimeoutExpired:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+            self.proc.wait()
+
+# The resident editors on an agent, one per project. Builds for a project run one at a time on its editor; editors
+# are restarted when unhealthy, recycled after a number of builds, and the least-recently-used idle one is stopped to
+# make room for a new project (which waits for one to become idle, if all are building).
+class WorkerPool():
+    def __init__(self, unity_exe, path, recycle_after = 20, max_editors = 2, health_timeout = 60,
+            startup_timeout = 600, build_timeout = 3600, log = None):
+        self.unity_exe = unity_exe
+        self.path = path
+        self.recycle_after = recycle_after
+        self.max_editors = max_editors
+        self.health_timeout = health_timeout
+        self.startup_timeout = startup_timeout
+        self.build_timeout = build_timeout
+        self.log = log
+        self.editors = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.next_id = 0
+
+    # Build on the project's editor (starting it, if need be). Returns the response for the client.
+    def build(self, project, flags, log_fp):
+        with self.lock:
+            lk = self.locks.setdefault(project, threading.Lock())
+            self.next_id += 1
+            req_id = f'{int(time.time())}-{self.next_id}'
+        start = time.time()
+        with lk:
+            ed = self._editor(project)
+            warm = ed.builds > 0
+            error = ed.build(req_id, flags, log_fp, self.build_timeout)
+            builds = ed.builds
+            if error and not ed.healthy(self.health_timeout, self.startup_timeout):
+                self.log.warning(f'Restarting the editor for {project}: {error}')
+                self._restart(ed)
+            elif ed.builds >= self.recycle_after:
+                self.log.info(f'Recycling the editor for {project} after {ed.builds} builds')
+                self._restart(ed)
+        with self.idle: self.idle.notify_all()
+        self.log.info(f'{req_id} {project}: {"ok" if not error else "failed"} in {time.time() - start:.1f}s '
+            f'({"warm" if warm else "cold"}, build #{builds})')
+        return {'ok': not error, 'error': error or '', 'seconds': time.time() - start, 'warm': warm, 'builds': builds}
+
+    # Restart any idle editor which has failed its health check.
+    def check(self):
+        with self.lock: editors = list(self.editors.values())
+        for ed in editors:
+            lk = self.locks[ed.project]
+            if not lk.acquire(blocking=False): continue
+            try:
+                if not ed.healthy(self.health_timeout, self.startup_timeout):
+                    self.log.warning(f'The editor for {ed.project} is unhealthy; restarting it')
+                    self._restart(ed)
+            finally:
+                lk.release()
+
+    def status(self):
+        # An editor which is still waiting for its slot has not started yet.
+        with self.lock: editors = [ed for ed in self.editors.values() if ed.proc]
+        return dict([(ed.project, {
+            'pid': ed.proc.pid,
+            'builds': ed.builds,
+            'healthy': ed.healthy(self.health_timeout, self.startup_timeout),
+            'uptime': time.time() - ed.started
+        }) for ed in editors])
+
+    def stop(self):
+        with self.lock: editors = list(self.editors.values())
+        for ed in editors: ed.stop()
+
+    # The project's editor, started once there is room for it: the least-recently-used idle editor is stopped when the
+    # pool is full, and if every editor is building, this waits for one of the builds to finish.
+    def _editor(self, project):
+        with self.idle:
+            ed = self.editors.get(project)
+            if ed: return ed
+            evicted = None
+            while len(self.editors) >= self.max_editors:
+                evicted = self._evict(project)
+                if evicted: break
+                self.log.info(f'All {len(self.editors)} editors are building; {project} is waiting for one')
+                self.idle.wait()
+            name = hashlib.sha1(project.encode()).hexdigest()[:12]
+            ed = Editor(self.unity_exe, project, os.path.join(self.path, 'editors', name))
+            self.editors[project] = ed
+        # The slot is taken, so the (slow) stop & start happen without holding up the rest of the pool.
+        if evicted:
+            (old, lk) = evicted
+            try:
+                old.stop()
+            finally:
+                lk.release()
+        self.log.info(f'Starting an editor for {project}...')
+        try:
+            ed.start()
+        except BaseException:
+            with self.idle:
+                del self.editors[project]
+                self.idle.notify_all()
+            raise
+        return ed
+
+    # Take the least-recently-used idle editor out of the pool, returning it with its lock held (so no build starts on
+    # it until it has been stopped). Returns None if every editor is building.
+    def _evict(self, project):
+        for e in sorted(self.editors.values(), key=lambda e: e.last_used):
+            lk = self.locks[e.project]
+            if not lk.acquire(blocking=False): continue
+            self.log.info(f'Stopping the editor for {e.project} to make room for {project}')
+            del self.editors[e.project]
+            return (e, lk)
+        return None
+
+    def _restart(self, ed):
+        ed.stop()
+        ed.start()
+
+# Send a request to the pool's socket, and return its response.
+def worker_request(path, req):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(os.path.join(path, 'worker.sock'))
+        sock.sendall((json.dumps(req) + '\n').encode())
+        with sock.makefile() as f: return json.loads(f.readline())
+
+# A request to the pool, in the background. Like a process, it can be polled, so the log can be tailed meanwhile.
+class WorkerBuild(threading.Thread):
+    def __init__(self, path, req):
+        super().__init__()
+        self.path = path
+        self.req = req
+        self.res = None
+        self.returncode = None
+        self.start()
+
+    def run(self):
+        try:
+            self.res = worker_request(self.path, self.req)
+        except Exception as e:
+            self.res = {'ok': False, 'error': f'The worker pool failed: {e}'}
+        self.returncode = 0 if self.res['ok'] else 1
+
+    def poll(self):
+        return self.returncode
+
+class Worker(Maker):
+    # Add arguments.
+    def _parse_args(self, parser, method):
+        parser.add_argument('--worker_dir', default=os.getenv('UNITY_WORKER', os.path.expanduser('~/.cache/unity3d/worker')),
+            help='Where the pool keeps its socket and editors.')
+        if method == 'serve':
+            from .unity import default_unity_exe
+            parser.add_argument('--unity_exe', default=default_unity_exe(), help='The Unity executable.')
+            parser.add_argument('--recycle_after', type=int, default=20,
+                help='Restart an editor after this many builds.')
+            parser.add_argument('--max_editors', type=int, default=2,
+                help='How many projects may have a resident editor at once.')
+            parser.add_argument('--health_timeout', type=float, default=60,
+                help='Restart an idle editor whose heartbeat is older than this (seconds).')
+            parser.add_argument('--startup_timeout', type=float, default=600,
+                help='How long (seconds) an editor may take to start.')
+            parser.add_argument('--build_timeout', type=float, default=3600,
+                help='How long (seconds) a build may take.')
+        return super()._parse_args(parser, method)
+
+    # Run the pool, serving build requests on {worker_dir}/worker.sock until stopped.
+    def serve(self):
+        opts = self.make.opts
+        os.makedirs(opts.worker_dir, exist_ok=True)
+        sock = os.path.join(opts.worker_dir, 'worker.sock')
+        if os.path.exists(sock): os.remove(sock)
+        pool = WorkerPool(opts.unity_exe, opts.worker_dir, opts.recycle_after, opts.max_editors,
+            opts.health_timeout, opts.startup_timeout, opts.build_timeout, self.log)
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                req = json.loads(self.rfile.readline())
+                if req.get('status'): res = pool.status()
+                else: res = pool.build(req['project'], req['flags'], req['log_file'])
+                self.wfile.write((json.dumps(res) + '\n').encode())
+
+        server = socketserver.ThreadingUnixStreamServer(sock, Handler)
+        server.daemon_threads = True
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.log.info(f'Serving builds on {sock}')
+        try:
+            while not stopping.wait(5): pool.check()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.log.info('Stopping the editors...')
+            server.shutdown()
+            server.server_close()
+            pool.stop()
+            if os.path.exists(sock): os.remove(sock)
+
+    # Print the pool's editors.
+    def status(self):
+        try:
+            status = worker_request(self.make.opts.worker_dir, {'status': True})
+        except OSError as e:
+            self.log.error(f'No worker pool at {self.make.opts.worker_dir}: {e}')
+            exit(1)
+        for (project, s) in status.items():
+            print(f'{project}: pid {s["pid"]}, {s["builds"]} builds, {"healthy" if s["healthy"] else "UNHEALTHY"}, '
+                f'up {s["uptime"]:.0f}s')
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+import os, ssl, json, time, base64, socket, argparse, datetime, threading, http.client, http.server, urllib.parse, \
+    urllib.request
+
+# An HTTP connection to the Docker Engine API, over its Unix socket
+class _Conn(http.client.HTTPConnection):
+    def __init__(self, sock_fp, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self.sock_fp = sock_fp
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.sock_fp)
+
+# The node's Docker daemon (the same one the agents build with, and which the kubelet pulls their images into)
+class Docker():
+    def __init__(self, sock_fp = '/var/run/docker.sock', auths = {}):
+        self.sock_fp = sock_fp
+        self.auths = auths
+
+    def images(self):
+        return self._json('GET', '/images/json')
+
+    def containers(self):
+        return self._json('GET', '/containers/json?all=1')
+
+    # The image's details, or None if it is not on the node.
+    def inspect(self, image):
+        (status, body) = self._request('GET', f'/images/{image}/json')
+        if status == 404: return None
+        if status >= 300: raise Exception(f'Failed to inspect {image}: {body.decode().strip()}')
+        return json.loads(body)
+
+    # Pull an image, reading the progress stream until the pull has finished.
+    def pull(self, image, timeout = 3600):
+        (repo, tag) = image.rsplit(':', 1)
+        path = '/images/create?' + urllib.parse.urlencode({'fromImage': repo, 'tag': tag})
+        headers = {}
+        auth = self.auths.get(_registry(repo))
+        if auth: headers['X-Registry-Auth'] = auth
+        conn = _Conn(self.sock_fp, timeout)
+        try:
+            conn.request('POST', path, headers=headers)
+            res = conn.getresponse()
+            if res.status >= 300: raise Exception(f'Failed to pull {image}: {res.read().decode().strip()}')
+            for line in res:
+                if len(line.strip()) <= 0: continue
+                msg = json.loads(line)
+                if 'error' in msg: raise Exception(f'Failed to pull {image}: {msg["error"]}')
+        finally:
+            conn.close()
+
+    def remove(self, image_id):
+        (status, body) = self._request('DELETE', f'/images/{image_id}')
+        if status >= 300: raise Exception(f'Failed to remove {image_id}: {body.decode().strip()}')
+
+    def _json(self, method, path):
+        (status, body) = self._request(method, path)
+        if status >= 300: raise Exception(f'{method} {path} failed: {body.decode().strip()}')
+        return json.loads(body)
+
+    def _request(self, method, path):
+        conn = _Conn(self.sock_fp, 60)
+        try:
+            conn.request(method, path)
+            res = conn.getresponse()
+            return (res.status, res.read())
+        finally:
+            conn.close()
+
+sa_dir = '/var/run/secrets/kubernetes.io/serviceaccount'
+
+# This pod, through the in-cluster Kubernetes API
+def read_pod(name, namespace = None):
+    with open(os.path.join(sa_dir, 'token')) as f: token = f.read().strip()
+    if not namespace:
+        with open(os.path.join(sa_dir, 'namespace')) as f: namespace = f.read().strip()
+    url = f'https://{os.environ["KUBERNETES_SERVICE_HOST"]}:{os.environ["KUBERNETES_SERVICE_PORT"]}' + \
+        f'/api/v1/namespaces/{namespace}/pods/{name}'
+    req = urllib.request.Request(url, headers={'Authorization': f'Bearer {token}', 'Accept': 'application/json'})
+    context = ssl.create_default_context(cafile=os.path.join(sa_dir, 'ca.crt'))
+    with urllib.request.urlopen(req, timeout=30, context=context) as res: return json.loads(res.read())
+
+def _timestamp(s):
+    return datetime.datetime.strptime(s, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=datetime.timezone.utc).timestamp()
+
+# The seconds the kubelet took to pull the image of each of a pod's init containers, which run one after another: the
+# time from the end of the previous one (or the pod's start) until the container started. An image which was already
+# on the node takes (almost) no time.
+def init_pulls(pod):
+    images = [c['image'] for c in pod['spec'].get('initContainers', [])]
+    statuses = dict([(s['name'], s) for s in pod['status'].get('initContainerStatuses', [])])
+    pulls = []
+    prev = _timestamp(pod['status']['startTime'])
+    for c in pod['spec'].get('initContainers', []):
+        state = statuses.get(c['name'], {}).get('state', {}).get('terminated')
+        if not state: break
+        pulls.append((c['image'], max(0, _timestamp(state['startedAt']) - prev)))
+        prev = _timestamp(state['finishedAt'])
+    return pulls
+
+# The registry host of a repository (Docker Hub's, if it has none)
+def _registry(repo):
+    host = repo.split('/')[0]
+    if '/' in repo and ('.' in host or ':' in host or host == 'localhost'): return host
+    return 'docker.io'
+
+# The X-Registry-Auth header for each registry in a docker config.json (e.g. a mounted imagePullSecret)
+def read_auths(fp):
+    with open(fp) as f: auths = json.load(f).get('auths', {})
+    ret = {}
+    for (registry, a) in auths.items():
+        if 'auth' not in a: continue
+        (username, password) = base64.b64decode(a['auth']).decode().split(':', 1)
+        host = urllib.parse.urlparse(registry).netloc or registry
+        if 'docker.io' in host: host = 'docker.io'
+        auth = {'username': username, 'password': password, 'serveraddress': registry}
+        ret[host] = base64.urlsafe_b64encode(json.dumps(auth).encode()).decode()
+    return ret
+
+# The tags to keep warm: a JSON list, or one per line (e.g. as written by build.py --tags-file)
+def read_tags(fp):
+    with open(fp) as f: data = f.read()
+    if data.strip().startswith('['): return json.loads(data)
+    return [l.strip() for l in data.split('\n') if len(l.strip()) > 0 and not l.startswith('#')]
+
+# Keeps the active agent images pulled on this node, so that an agent landing here does not wait for a multi-GB
+# pull, and removes the images of the repository which are no longer active (unless a container still uses them).
+# The time spent pulling ahead of the agents is recorded (per node, across restarts) as the pull time saved.
+class Prepuller():
+    def __init__(self, docker, repository, tags, node, state_fp = None, gc = True):
+        self.docker = docker
+        self.repository = repository
+        self.tags = [t if ':' in t else f'{repository}:{t}' for t in tags]
+        self.node = node
+        self.state_fp = state_fp
+        self.gc_enabled = gc
+        self.state = {'saved_seconds': 0, 'pulled_bytes': 0, 'reclaimed_bytes': 0, 'pulls': {}}
+        if state_fp and os.path.isfile(state_fp):
+            with open(state_fp) as f: self.state.update(json.load(f))
+        self.warm = {}
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    # Pull any active tag which is missing (or has moved), then collect the stale images.
+    def step(self):
+        (pulled, warm) = ([], [])
+        for tag in self.tags:
+            before = self.docker.inspect(tag)
+            start = time.time()
+            self.docker.pull(tag)
+            secs = time.time() - start
+            after = self.docker.inspect(tag)
+            if before and after and before['Id'] == after['Id']:
+                warm.append(tag)
+            else:
+                # A job would have waited for this pull.
+                pulled.append(tag)
+                size = after.get('Size', 0) if after else 0
+                with self.lock:
+                    self.state['saved_seconds'] += secs
+                    self.state['pulled_bytes'] += size
+                    self.state['pulls'][tag] = {'seconds': secs, 'bytes': size, 'at': time.time()}
+                print(f'[{self.node}] pulled {tag} ({size / 1e9:.2f}GB) in {secs:.0f}s', flush=True)
+            with self.lock: self.warm[tag] = True
+        removed = self.gc() if self.gc_enabled else []
+        self._save()
+        print(f'[{self.node}] {len(warm)} warm, {len(pulled)} pulled, {len(removed)} stale removed; '
+            f'{self.state["saved_seconds"]:.0f}s of pulls saved, {self.state["reclaimed_bytes"] / 1e9:.2f}GB reclaimed '
+            f'on this node so far', flush=True)
+
+    # Record the pulls of the pod's init containers, which the kubelet made before this started (so that step() finds
+    # those images warm), once per pod. Pulls shorter than min_seconds found the image already on the node.
+    def record_init_pulls(self, pod, min_seconds = 2):
+        uid = pod['metadata']['uid']
+        if uid in self.state.setdefault('pods', []): return
+        for (image, secs) in init_pulls(pod):
+            if secs < min_seconds: continue
+            tag = image if ':' in image.split('/')[-1] else f'{image}:latest'
+            info = self.docker.inspect(tag)
+            size = info.get('Size', 0) if info else 0
+            with self.lock:
+                self.state['saved_seconds'] += secs
+                self.state['pulled_bytes'] += size
+                self.state['pulls'][tag] = {'seconds': secs, 'bytes': size, 'at': time.time()}
+            print(f'[{self.node}] the kubelet pulled {tag} ({size / 1e9:.2f}GB) in {secs:.0f}s', flush=True)
+        # Only the last few pods are kept, so the state stays small.
+        with self.lock: self.state['pods'] = (self.state['pods'] + [uid])[-10:]
+        self._save()
+
+    # Remove the repository's images which have no active tag and no container. Returns the removed tags.
+    def gc(self):
+        active = set(self.tags)
+        used = set(c['ImageID'] for c in self.docker.containers())
+        removed = []
+        for img in self.docker.images():
+            tags = [t for t in (img.get('RepoTags') or []) if t.rsplit(':', 1)[0] == self.repository]
+            # An image left without tags, once a tag it had (e.g. latest) moved on, is stale as well.
+            if len(tags) <= 0 and len([t for t in (img.get('RepoTags') or []) if t != '<none>:<none>']) <= 0:
+                tags = [d for d in (img.get('RepoDigests') or []) if d.split('@')[0] == self.repository][:1]
+            if len(tags) <= 0 or any(t in active for t in tags) or img['Id'] in used: continue
+            try:
+                self.docker.remove(img['Id'])
+            except Exception as e:
+                print(f'[{self.node}] could not remove {", ".join(tags)}: {e}', flush=True)
+                continue
+            removed += tags
+            with self.lock: self.state['reclaimed_bytes'] += img.get('Size', 0)
+            print(f'[{self.node}] removed stale {", ".join(tags)} ({img.get("Size", 0) / 1e9:.2f}GB)', flush=True)
+        return removed
+
+    # The warm images & the time saved, in the Prometheus text format.
+    def prometheus(self):
+        node = f'node="{self.node}"'
+        with self.lock:
+            lines = ['# TYPE unity_prepull_warm gauge']
+            for tag in self.tags: lines.append(f'unity_prepull_warm{{{node},image="{tag}"}} {int(self.warm.get(tag, False))}')
+            lines.append('# TYPE unity_prepull_pull_seconds gauge')
+            for (tag, p) in sorted(self.state['pulls'].items()):
+                lines.append(f'unity_prepull_pull_seconds{{{node},image="{tag}"}} {p["seconds"]:.1f}')
+            for name in ['saved_seconds', 'pulled_bytes', 'reclaimed_bytes']:
+                lines.append(f'# TYPE unity_prepull_{name}_total counter')
+                lines.append(f'unity_prepull_{name}_total{{{node}}} {self.state[name]:.0f}')
+            lines.append('# TYPE unity_prepull_errors_total counter')
+            lines.append(f'unity_prepull_errors_total{{{node}}} {self.errors}')
+        return '\n'.join(lines) + '\n'
+
+    def _save(self):
+        if not self.state_fp: return
+        with self.lock: data = json.dumps(self.state, indent=2)
+        tmp = self.state_fp + '.tmp'
+        with open(tmp, 'w') as f: f.write(data)
+        os.replace(tmp, self.state_fp)
+
+# Serve the metrics on /metrics
+def serve(prepuller, port):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args): pass
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = prepuller.prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+    server = http.server.ThreadingHTTPServer(('', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repository', default='inzania/unity3d-buildkite', help='The repository of the agent images')
+    parser.add_argument('--tags', default='', help='Comma-separated tags (or images) to keep warm')
+    parser.add_argument('--tags_file', help='A file of tags to keep warm (a JSON list, or one per line)')
+    parser.add_argument('--docker_sock', default='/var/run/docker.sock', help='The Docker daemon\'s socket')
+    parser.add_argument('--docker_config', help='A docker config.json with the credentials of the registry')
+    parser.add_argument('--state', help='Where the pull time saved on this node is kept across restarts')
+    parser.add_argument('--node', default=os.getenv('NODE_NAME', socket.gethostname()), help='This node\'s name')
+    parser.add_argument('--pod', default=os.getenv('POD_NAME'),
+        help='This pod\'s name, to record the pulls of its init containers (needs get on pods)')
+    parser.add_argument('--namespace', default=os.getenv('POD_NAMESPACE'), help='This pod\'s namespace')
+    parser.add_argument('--no_gc', action='store_true', help='Keep the images which are no longer active')
+    parser.add_argument('--interval', type=float, default=600, help='Seconds between checks for moved tags')
+    parser.add_argument('--port', type=int, default=9091, help='The port to serve /metrics on (0 to disable)')
+    parser.add_argument('--once', action='store_true', help='Pull once, then exit')
+    opts = parser.parse_args()
+
+    tags = [t for t in opts.tags.split(',') if len(t) > 0]
+    if opts.tags_file: tags += read_tags(opts.tags_file)
+    auths = read_auths(opts.docker_config) if opts.docker_config and os.path.isfile(opts.docker_config) else {}
+    prepuller = Prepuller(Docker(opts.docker_sock, auths), opts.repository, tags, opts.node, opts.state,
+        not opts.no_gc)
+    if opts.port: serve(prepuller, opts.port)
+    print(f'[{opts.node}] keeping {len(prepuller.tags)} images warm: {", ".join(prepuller.tags)}', flush=True)
+    if opts.pod:
+        try:
+            prepuller.record_init_pulls(read_pod(opts.pod, opts.namespace))
+        except Exception as e:
+            prepuller.errors += 1
+            print(f'[{opts.node}] could not read the init containers\' pulls: {e}', flush=True)
+    while True:
+        try:
+            prepuller.step()
+        except Exception as e:
+            prepuller.errors += 1
+            print(f'[{opts.node}] failed to pre-pull: {e}', flush=True)
+            if opts.once: exit(1)
+        if opts.once: break
+        time.sleep(opts.interval)
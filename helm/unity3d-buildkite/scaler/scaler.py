@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+import os, ssl, json, time, argparse, threading, urllib.request, http.server
+
+metrics_url = 'https://agent.buildkite.com/v3/metrics'
+sa_dir = '/var/run/secrets/kubernetes.io/serviceaccount'
+
+# Read JSON from a URL (or from a local file path, e.g. a mock of the metrics API)
+def _get_json(url, headers = {}, context = None):
+    if os.path.isfile(url):
+        with open(url) as f: return json.load(f)
+    req = urllib.request.Request(url, headers=headers)
+    with urllib.request.urlopen(req, timeout=30, context=context) as res: return json.loads(res.read())
+
+# The replica counts of Deployments, through the in-cluster Kubernetes API
+class Kube():
+    def __init__(self, namespace = None):
+        self.url = f'https://{os.environ["KUBERNETES_SERVICE_HOST"]}:{os.environ["KUBERNETES_SERVICE_PORT"]}'
+        with open(os.path.join(sa_dir, 'token')) as f: self.token = f.read().strip()
+        if not namespace:
+            with open(os.path.join(sa_dir, 'namespace')) as f: namespace = f.read().strip()
+        self.namespace = namespace
+        self.context = ssl.create_default_context(cafile=os.path.join(sa_dir, 'ca.crt'))
+
+    def replicas(self, deployment):
+        return _get_json(self._scale_url(deployment), self._headers(), self.context)['spec'].get('replicas', 0)
+
+    def scale(self, deployment, replicas):
+        data = json.dumps({'spec': {'replicas': replicas}}).encode()
+        headers = self._headers()
+        headers['Content-Type'] = 'application/merge-patch+json'
+        req = urllib.request.Request(self._scale_url(deployment), data=data, headers=headers, method='PATCH')
+        with urllib.request.urlopen(req, timeout=30, context=self.context) as res: res.read()
+
+    def _scale_url(self, deployment):
+        return f'{self.url}/apis/apps/v1/namespaces/{self.namespace}/deployments/{deployment}/scale'
+
+    def _headers(self):
+        return {'Authorization': f'Bearer {self.token}', 'Accept': 'application/json'}
+
+# Replica counts kept in memory, for a dry run
+class DryRunKube():
+    def __init__(self):
+        self.counts = {}
+
+    def replicas(self, deployment):
+        return self.counts.get(deployment, 0)
+
+    def scale(self, deployment, replicas):
+        self.counts[deployment] = replicas
+
+# Scales the agent Deployment of each module to the jobs in its Buildkite queue (one job per agent), within its
+# min/max bounds. Scaling up waits scale_up_cooldown after the last change; scaling down waits until the queue has
+# wanted fewer agents for scale_down_cooldown, so agents are not torn down between the jobs of a build.
+class Scaler():
+    def __init__(self, config, kube, token, url = metrics_url):
+        self.modules = config['modules']
+        self.up_cooldown = config.get('scaleUpCooldown', 60)
+        self.down_cooldown = config.get('scaleDownCooldown', 600)
+        self.kube = kube
+        self.token = token
+        self.url = url
+        self.last_scaled = {}
+        self.below_since = {}
+        self.gauges = {}
+        self.events = {}
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    # Poll the queues once, and scale any module which needs it.
+    def step(self, now = None):
+        now = now if now else time.time()
+        metrics = _get_json(self.url, {'Authorization': f'Token {self.token}'})
+        queues = metrics.get('jobs', {}).get('queues', {})
+        for (module, m) in self.modules.items():
+            jobs = queues.get(m['queue'], {})
+            (scheduled, running) = (jobs.get('scheduled', 0), jobs.get('running', 0))
+            current = self.kube.replicas(m['deployment'])
+            desired = min(m['max'], max(m['min'], scheduled + running))
+            replicas = self._decide(module, current, desired, m, now)
+            if replicas != current:
+                direction = 'up' if replicas > current else 'down'
+                print(f'[{module}] scaling {m["deployment"]} {direction} from {current} to {replicas} '
+                    f'({scheduled} scheduled, {running} running)', flush=True)
+                self.kube.scale(m['deployment'], replicas)
+                self.last_scaled[module] = now
+                self.below_since.pop(module, None)
+                with self.lock: self.events[(module, direction)] = self.events.get((module, direction), 0) + 1
+            with self.lock:
+                self.gauges[module] = {'scheduled': scheduled, 'running': running, 'waiting': jobs.get('waiting', 0),
+                    'replicas': replicas, 'desired': desired}
+        with self.lock: self.gauges['_poll'] = now
+
+    def _decide(self, module, current, desired, m, now):
+        # Out of bounds (e.g. after the bounds were changed) is corrected straight away.
+        if current < m['min'] or current > m['max']: return min(m['max'], max(m['min'], current))
+        if desired > current:
+            self.below_since.pop(module, None)
+            if now - self.last_scaled.get(module, 0) < self.up_cooldown: return current
+            return desired
+        if desired < current:
+            since = self.below_since.setdefault(module, now)
+            if now - since < self.down_cooldown: return current
+            if now - self.last_scaled.get(module, 0) < self.down_cooldown: return current
+            return desired
+        self.below_since.pop(module, None)
+        return current
+
+    # The queue depths and scaling decisions, in the Prometheus text format.
+    def prometheus(self):
+        with self.lock:
+            lines = ['# TYPE unity_scaler_jobs gauge']
+            for (module, g) in self.gauges.items():
+                if module == '_poll': continue
+                for state in ['scheduled', 'running', 'waiting']:
+                    lines.append(f'unity_scaler_jobs{{module="{module}",state="{state}"}} {g[state]}')
+            for (name, key) in [('replicas', 'replicas'), ('desired_replicas', 'desired')]:
+                lines.append(f'# TYPE unity_scaler_{name} gauge')
+                for (module, g) in self.gauges.items():
+                    if module != '_poll': lines.append(f'unity_scaler_{name}{{module="{module}"}} {g[key]}')
+            lines.append('# TYPE unity_scaler_scale_events_total counter')
+            for ((module, direction), n) in sorted(self.events.items()):
+                lines.append(f'unity_scaler_scale_events_total{{module="{module}",direction="{direction}"}} {n}')
+            lines.append('# TYPE unity_scaler_errors_total counter')
+            lines.append(f'unity_scaler_errors_total {self.errors}')
+            lines.append('# TYPE unity_scaler_last_poll_timestamp_seconds gauge')
+            lines.append(f'unity_scaler_last_poll_timestamp_seconds {self.gauges.get("_poll", 0)}')
+        return '\n'.join(lines) + '\n'
+
+# Serve the scaler's metrics on /metrics
+def serve(scaler, port):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args): pass
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = scaler.prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+    server = http.server.ThreadingHTTPServer(('', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', default='/etc/scaler/config.json', help='The modules to scale, and the cooldowns')
+    parser.add_argument('--metrics_url', default=os.getenv('BUILDKITE_METRICS_URL', metrics_url),
+        help='The Buildkite agent metrics API (or a local JSON file to use instead)')
+    parser.add_argument('--interval', type=float, default=30, help='Seconds between polls')
+    parser.add_argument('--port', type=int, default=9090, help='The port to serve /metrics on (0 to disable)')
+    parser.add_argument('--namespace', help='The namespace of the Deployments (default: the pod\'s own)')
+    parser.add_argument('--dry_run', action='store_true', help='Log decisions without scaling anything')
+    parser.add_argument('--once', action='store_true', help='Poll once, then exit')
+    opts = parser.parse_args()
+
+    with open(opts.config) as f: config = json.load(f)
+    kube = DryRunKube() if opts.dry_run else Kube(opts.namespace)
+    scaler = Scaler(config, kube, os.getenv('BUILDKITE_AGENT_TOKEN', ''), opts.metrics_url)
+    if opts.port: serve(scaler, opts.port)
+    print(f'Scaling {", ".join(config["modules"])} every {opts.interval}s', flush=True)
+    while True:
+        try:
+            scaler.step()
+        except Exception as e:
+            scaler.errors += 1
+            print(f'Failed to scale: {e}', flush=True)
+            if opts.once: exit(1)
+        if opts.once: break
+        time.sleep(opts.interval)
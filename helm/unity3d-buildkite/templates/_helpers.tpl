@@ -61,3 +61,53 @@ Create the name of the service account to use
     {{ default "default" .Values.serviceAccount.name }}
 {{- end -}}
 {{- end -}}
+
+{{/*
+The agent container for a module. Expects (dict "root" $ "module" $module).
+*/}}
+{{- define "unity3d-buildkite.agent" -}}
+{{- $root := .root -}}
+{{- if .module -}}
+- name: "unity-{{ .module }}"
+{{- else -}}
+- name: unity
+{{- end }}
+  securityContext:
+    {{- toYaml $root.Values.securityContext | nindent 4 }}
+  {{- if .module }}
+  image: "{{ $root.Values.image.repository }}:{{ $root.Values.unity.version }}-{{ .module }}"
+  {{- else }}
+  image: "{{ $root.Values.image.repository }}:{{ $root.Values.unity.version }}"
+  {{- end }}
+  imagePullPolicy: {{ $root.Values.image.pullPolicy }}
+  volumeMounts:
+  - name: dockersock
+    mountPath: "/var/run/docker.sock"
+  env:
+  - name: BUILDKITE_AGENT_NAME
+    valueFrom:
+      fieldRef:
+        fieldPath: metadata.name
+  - name: BUILDKITE_AGENT_TAGS
+    {{- if $root.Values.autoscaler.enabled }}
+    value: "unity_module={{ .module }},queue={{ include "unity3d-buildkite.queue" . }}"
+    {{- else }}
+    value: "unity_module={{ .module }}"
+    {{- end }}
+  {{- range $key, $val := $root.Values.env }}
+  - name: {{ $key }}
+    valueFrom:
+      secretKeyRef:
+        name: {{ include "unity3d-buildkite.fullname" $root }}
+        key: {{ $key }}
+  {{- end }}
+  resources:
+    {{- toYaml $root.Values.resources | nindent 4 }}
+{{- end -}}
+
+{{/*
+The Buildkite queue of a module's agents, when they are autoscaled. Expects (dict "root" $ "module" $module).
+*/}}
+{{- define "unity3d-buildkite.queue" -}}
+{{- printf "%s%s" .root.Values.autoscaler.queuePrefix (default "unity" .module) -}}
+{{- end -}}
@@ -0,0 +1,7 @@
+import os, sys
+
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'docker/bin/ci'))
+sys.path.insert(0, os.path.join(root, 'helm/unity3d-buildkite/prepull'))
+sys.path.insert(0, os.path.join(root, 'helm/unity3d-buildkite/scaler'))
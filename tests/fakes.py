@@ -0,0 +1,48 @@
+import os, json, stat, threading, functools, http.server
+
+# Write an executable stand-in for a tool (e.g. docker or pod) into bin_dir, which the test puts first on $PATH.
+def fake_exe(bin_dir, name, script):
+    os.makedirs(bin_dir, exist_ok=True)
+    fp = os.path.join(bin_dir, name)
+    with open(fp, 'w') as f: f.write(script)
+    os.chmod(fp, os.stat(fp).st_mode | stat.S_IEXEC)
+    return fp
+
+# Serves a releases feed, and the installer it points at, counting the installer downloads.
+class FakeFeed():
+    def __init__(self, root, version):
+        self.downloads = 0
+        feed = self
+        class Handler(http.server.SimpleHTTPRequestHandler):
+            def log_message(self, *args): pass
+            def do_GET(self):
+                if 'UnitySetup' in self.path: feed.downloads += 1
+                super().do_GET()
+        with open(os.path.join(root, f'UnitySetup-{version}'), 'w') as f: f.write('#!/bin/sh\n')
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(Handler, directory=root))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self.releases = os.path.join(root, 'releases.json')
+        with open(self.releases, 'w') as f:
+            json.dump({'official': [{'version': version, 'downloadUrl': f'{self.url}/LinuxEditorInstaller/Unity.tar.xz'}]}, f)
+
+# A registry (v2 API) whose tags are the lines of tags_fp, e.g. as appended to by a fake `docker push`.
+class FakeRegistry():
+    def __init__(self, tags_fp):
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args): pass
+            def do_HEAD(self):
+                self.send_response(404)
+                self.end_headers()
+            def do_GET(self):
+                if not self.path.split('?')[0].endswith('/tags/list'): return self.send_error(404)
+                with open(tags_fp) as f: tags = [t for t in f.read().split('\n') if len(t) > 0]
+                body = json.dumps({'tags': tags}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.host = f'localhost:{self.server.server_port}'
@@ -0,0 +1,82 @@
+import os, types, random, unittest, tempfile
+from unittest import mock
+from maker import artifacts
+from maker.artifacts import ArtifactStore, Artifacts
+
+class ArtifactStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store_dir = os.path.join(self.tmp.name, 'store')
+        self.src = os.path.join(self.tmp.name, 'src')
+        os.makedirs(os.path.join(self.src, 'Data', 'Empty'))
+        rnd = random.Random(1)
+        self.files = {
+            'game.apk': b'apk' * 1000,
+            'Data/level.bundle': bytes([rnd.randrange(256) for _ in range(2560)]),
+            'Data/empty.txt': b'',
+            'run.sh': b'#!/bin/sh\necho ok\n',
+        }
+        self.write(self.src, self.files)
+        os.chmod(os.path.join(self.src, 'run.sh'), 0o755)
+        os.symlink('game.apk', os.path.join(self.src, 'latest.apk'))
+        # Small chunks, so files span several and builds share some.
+        self.chunk_size = mock.patch.object(artifacts, 'chunk_size', 1024)
+        self.chunk_size.start()
+
+    def tearDown(self):
+        self.chunk_size.stop()
+        self.tmp.cleanup()
+
+    def write(self, root, files):
+        for (name, data) in files.items():
+            with open(os.path.join(root, name), 'wb') as f: f.write(data)
+
+    def read(self, root):
+        ret = {}
+        for (d, dirs, files) in os.walk(root):
+            for fn in files:
+                fp = os.path.join(d, fn)
+                if os.path.islink(fp): continue
+                with open(fp, 'rb') as f: ret[os.path.relpath(fp, root)] = f.read()
+        return ret
+
+    def test_store_and_restore(self):
+        store = ArtifactStore(self.store_dir, jobs = 4)
+        size = sum([len(data) for data in self.files.values()])
+        self.assertEqual(store.put('game-1', self.src), {'files': 4, 'bytes': size, 'new_bytes': size, 'reused_bytes': 0})
+        # Only the changed chunk of the second build is new.
+        self.write(self.src, {'game.apk': b'apk' * 1000 + b'!'})
+        stats = store.put('game-2', self.src)
+        self.assertEqual((stats['bytes'], stats['new_bytes']), (size + 1, 3000 - 2048 + 1))
+        self.assertEqual(store.builds(), ['game-1', 'game-2'])
+
+        dst = os.path.join(self.tmp.name, 'dst')
+        self.assertEqual(store.get('game-1', dst), size)
+        self.assertEqual(self.read(dst), dict([(os.path.normpath(n), d) for (n, d) in self.files.items()]))
+        self.assertTrue(os.path.isdir(os.path.join(dst, 'Data', 'Empty')))
+        self.assertEqual(os.stat(os.path.join(dst, 'run.sh')).st_mode & 0o777, 0o755)
+        self.assertEqual(os.readlink(os.path.join(dst, 'latest.apk')), 'game.apk')
+        # Restoring over an older tree replaces its files and links.
+        store.get('game-2', dst)
+        self.assertEqual(self.read(dst)['game.apk'], b'apk' * 1000 + b'!')
+        self.assertEqual(os.readlink(os.path.join(dst, 'latest.apk')), 'game.apk')
+
+    def test_corrupt_chunk(self):
+        store = ArtifactStore(self.store_dir)
+        store.put('game-1', self.src)
+        (d, _, files) = next(os.walk(os.path.join(self.store_dir, 'chunks', os.listdir(os.path.join(self.store_dir, 'chunks'))[0])))
+        with open(os.path.join(d, files[0]), 'wb') as f: f.write(b'corrupt')
+        with self.assertRaisesRegex(Exception, 'is corrupt'):
+            store.get('game-1', os.path.join(self.tmp.name, 'dst'))
+
+    def test_missing_build(self):
+        store = ArtifactStore(self.store_dir)
+        store.put('game-1', self.src)
+        dst = os.path.join(self.tmp.name, 'dst')
+        with self.assertRaises(FileNotFoundError): store.get('game-2', dst)
+        opts = types.SimpleNamespace(store=self.store_dir, build_id='game-2', dst=dst)
+        with self.assertRaises(SystemExit) as e, self.assertLogs('Artifacts', 'ERROR') as logs:
+            Artifacts(make=types.SimpleNamespace(opts=opts)).restore()
+        self.assertEqual(e.exception.code, 1)
+        self.assertIn(f'game-2 is not in {self.store_dir}', logs.output[0])
+        self.assertFalse(os.path.exists(dst))
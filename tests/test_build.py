@@ -0,0 +1,26 @@
+import os, unittest, tempfile
+import build
+from fakes import fake_exe
+
+# `docker push` names layers by the DiffIDs of the local image; the manifest lists the compressed blobs.
+fake_docker = '''#!/bin/sh
+if [ "$1" = image ]; then echo '["sha256:1111111111110000","sha256:2222222222220000","sha256:3333333333330000"]'; fi
+if [ "$1" = manifest ]; then echo '{"layers":[{"digest":"sha256:aaaaaaaaaaaa0000","size":100},{"digest":"sha256:bbbbbbbbbbbb0000","size":20},{"digest":"sha256:cccccccccccc0000","size":3}]}'; fi
+if [ "$1" = push ]; then echo "111111111111: Layer already exists"; echo "222222222222: Pushed"; echo "333333333333: Pushed"; fi
+'''
+
+class PushTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        fake_exe(self.tmp.name, 'docker', fake_docker)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = f'{self.tmp.name}:{self.path}'
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        self.tmp.cleanup()
+
+    def test_pushed_bytes_match_diff_ids_to_blobs(self):
+        r = build._push('localhost:5000/unity3d-buildkite:2019.2.18f1', 0)
+        self.assertTrue(r['ok'])
+        self.assertEqual((r['pushed'], r['existing'], r['bytes']), (2, 1, 23))
@@ -0,0 +1,92 @@
+import io, os, socket, unittest, tempfile, contextlib
+import build
+from fakes import fake_exe, FakeFeed
+
+# Records the arguments of every docker command (one per line), and succeeds. The ios image was (as if) built
+# without the base, while the others sit on its layers.
+fake_docker = '''#!/bin/sh
+echo "$@" >> "$DOCKER_LOG"
+if [ "$1" = image ]; then
+  case "$4$5" in
+  *Size*) echo 2000000000;;
+  *-base) echo '["sha256:b1","sha256:b2"]';;
+  *-ios) echo '["sha256:o1","sha256:o2","sha256:o3"]';;
+  *) echo '["sha256:b1","sha256:b2","sha256:c1"]';;
+  esac
+fi
+'''
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+class BaseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        fake_exe(os.path.join(self.tmp.name, 'bin'), 'docker', fake_docker)
+        self.docker_log = os.path.join(self.tmp.name, 'docker.log')
+        self.env = dict(os.environ)
+        os.environ['PATH'] = f'{os.path.join(self.tmp.name, "bin")}:{os.environ["PATH"]}'
+        os.environ['DOCKER_LOG'] = self.docker_log
+        os.makedirs(os.path.join(self.tmp.name, 'feed'))
+        self.feed = FakeFeed(os.path.join(self.tmp.name, 'feed'), '2019.2.18f1')
+        self.cwd = os.getcwd()
+        os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        os.environ.clear()
+        os.environ.update(self.env)
+        self.feed.server.shutdown()
+        self.tmp.cleanup()
+
+    def _base_build_args(self):
+        with open(self.docker_log) as f: lines = f.read().split('\n')
+        os.remove(self.docker_log)
+        return [l for l in lines if l.startswith('build') and 'base.Dockerfile' in l]
+
+    def test_installer_url_is_stable_across_runs(self):
+        cache = build.InstallerCache(os.path.join(self.tmp.name, 'cache'), 1e9, 3600, free_port())
+        runs = []
+        for i in range(3):
+            self.assertTrue(build.build('2019.2.18f1', [None], 'localhost:5000/unity3d-buildkite', False, True,
+                cache=cache, releases_url=self.feed.releases))
+            runs.append(self._base_build_args())
+        self.assertEqual(len(runs[0]), 1)
+        self.assertIn(f'DOWNLOAD_URL=http://127.0.0.1:{cache.port}/installers/UnitySetup-2019.2.18f1-', runs[0][0])
+        self.assertEqual(runs[0], runs[1])
+        self.assertEqual(runs[1], runs[2])
+        # The second run found the installer in the cache.
+        self.assertEqual(self.feed.downloads, 1)
+
+    # The components download the installer from the cache too, which is served until they have all been built.
+    def test_components_download_the_installer_from_the_cache(self):
+        cache = build.InstallerCache(os.path.join(self.tmp.name, 'cache'), 1e9, 3600, free_port())
+        self.assertTrue(build.build('2019.2.18f1', ['linux', 'android'], 'localhost:5000/unity3d-buildkite', False, True,
+            cache=cache, releases_url=self.feed.releases))
+        with open(self.docker_log) as f: builds = [l for l in f.read().split('\n') if l.startswith('build')]
+        self.assertEqual(len(builds), 3)
+        url = f'DOWNLOAD_URL=http://127.0.0.1:{cache.port}/installers/UnitySetup-2019.2.18f1-'
+        for b in builds: self.assertIn(url, b)
+
+    # No image keeps the installer: every layer which downloads it removes it again.
+    def test_the_installer_is_removed_in_the_layer_which_uses_it(self):
+        for df in ['docker/base.Dockerfile', 'docker/unity.Dockerfile']:
+            # Instructions span continued lines, between which Docker drops comment lines.
+            with open(df) as f: lines = [l for l in f.read().split('\n') if not l.strip().startswith('#')]
+            runs = [r for r in '\n'.join(lines).replace('\\\n', ' ').split('\n') if r.startswith('RUN')]
+            runs = [r for r in runs if 'UnitySetup' in r]
+            self.assertEqual(len(runs), 1, df)
+            self.assertLess(runs[0].index('wget'), runs[0].index('rm -f /opt/UnitySetup'))
+
+    def test_os_layer_precedes_the_installer_args(self):
+        with open('docker/base.Dockerfile') as f: df = f.read()
+        self.assertLess(df.index('apt-get install'), df.index('ARG DOWNLOAD_URL'))
+
+    def test_summary_measures_the_shared_base(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertTrue(build.build('2019.2.18f1', ['linux', 'android', 'ios'], 'localhost:5000/unity3d-buildkite',
+                False, True, releases_url=self.feed.releases))
+        self.assertIn("2 of 3 images share the base's 2 layers (2.00GB): 2.00GB not stored again", out.getvalue())
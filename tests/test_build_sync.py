@@ -0,0 +1,51 @@
+import os, json, unittest, tempfile
+import build
+from fakes import fake_exe, FakeFeed, FakeRegistry
+
+# Records every docker command, and "pushes" a tag by adding it to the fake registry's tags.
+fake_docker = '''#!/bin/sh
+echo "$@" >> "$DOCKER_LOG"
+if [ "$1" = push ]; then echo "111111111111: Pushed"; echo "${2##*:}" >> "$REGISTRY_TAGS"; fi
+'''
+
+class SyncTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        fake_exe(os.path.join(self.tmp.name, 'bin'), 'docker', fake_docker)
+        self.env = dict(os.environ)
+        os.environ['PATH'] = f'{os.path.join(self.tmp.name, "bin")}:{os.environ["PATH"]}'
+        os.environ['DOCKER_LOG'] = os.path.join(self.tmp.name, 'docker.log')
+        os.environ['REGISTRY_TAGS'] = os.path.join(self.tmp.name, 'tags')
+        with open(os.environ['REGISTRY_TAGS'], 'w') as f: f.write('2019.2.18f1-ios\n')
+        self.registry = FakeRegistry(os.environ['REGISTRY_TAGS'])
+        os.makedirs(os.path.join(self.tmp.name, 'feed'))
+        self.feed = FakeFeed(os.path.join(self.tmp.name, 'feed'), '2019.2.18f1')
+        self.cwd = os.getcwd()
+        os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        os.environ.clear()
+        os.environ.update(self.env)
+        self.registry.server.shutdown()
+        self.feed.server.shutdown()
+        self.tmp.cleanup()
+
+    def test_parse_components(self):
+        self.assertEqual(build.parse_components(',ios,android'), [None, 'ios', 'android'])
+        self.assertEqual(build.parse_components('linux'), ['linux'])
+        self.assertEqual(build.parse_components(None), list(build.component_map))
+
+    def test_sync_builds_only_the_missing_plain_image(self):
+        repo = f'{self.registry.host}/unity3d-buildkite'
+        tags_file = os.path.join(self.tmp.name, 'synced.json')
+        self.assertTrue(build.sync(repo, build.parse_components(',ios'), True, releases_url=self.feed.releases,
+            push_retries=0, tags_file=tags_file))
+        with open(os.environ['DOCKER_LOG']) as f: cmds = f.read().strip().split('\n')
+        builds = [c for c in cmds if c.startswith('build ')]
+        self.assertEqual(len(builds), 2)
+        self.assertIn(f'-t {repo}:2019.2.18f1-base', builds[0])
+        self.assertIn(f'--build-arg COMPONENTS=Unity --build-arg UNITY_VERSION=2019.2.18f1', builds[1])
+        self.assertIn(f'-t {repo}:2019.2.18f1 ', builds[1] + ' ')
+        with open(tags_file) as f: synced = json.load(f)
+        self.assertEqual(sorted(synced), sorted(f'{repo}:{t}' for t in ['2019.2.18f1', 'latest', 'latest-ios', '2019', '2019-ios']))
@@ -0,0 +1,62 @@
+import io, os, types, unittest, tempfile, contextlib
+from maker.cache import BuildCache, Cache
+
+class BuildCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'cache')
+        self.cache = BuildCache(self.path, 250)
+        self.mtime = 1000000
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    # Store a build of one 100 byte file, then date it after the builds stored before it.
+    def put(self, key):
+        fp = os.path.join(self.tmp.name, f'{key}.apk')
+        with open(fp, 'wb') as f: f.write(key.encode() * 100)
+        self.cache.put(key, [fp])
+        d = os.path.join(self.path, 'builds', key)
+        if os.path.isdir(d):
+            self.mtime += 10
+            os.utime(d, (self.mtime, self.mtime))
+
+    def keys(self):
+        return sorted([fn for fn in os.listdir(os.path.join(self.path, 'builds')) if not fn.startswith('.')])
+
+    def test_least_recently_used_builds_are_evicted(self):
+        dst = os.path.join(self.tmp.name, 'dst')
+        self.assertIsNone(self.cache.get('a', dst))
+        self.put('a')
+        self.put('b')
+        self.assertEqual(self.cache.stats(), {'hits': 0, 'misses': 1, 'evictions': 0, 'builds': 2, 'bytes': 200})
+        # Over the limit: the oldest build goes.
+        self.put('c')
+        self.assertEqual(self.keys(), ['b', 'c'])
+        self.assertEqual(self.cache.stats(), {'hits': 0, 'misses': 1, 'evictions': 1, 'builds': 2, 'bytes': 200})
+        # A hit makes b the most recently used, so c goes next.
+        self.assertEqual(self.cache.get('b', dst), ['b.apk'])
+        with open(os.path.join(dst, 'b.apk'), 'rb') as f: self.assertEqual(f.read(), b'b' * 100)
+        self.assertIsNone(self.cache.get('a', dst))
+        self.put('d')
+        self.assertEqual(self.keys(), ['b', 'd'])
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 2, 'evictions': 2, 'builds': 2, 'bytes': 200})
+        # Storing a key again changes nothing.
+        self.put('d')
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 2, 'evictions': 2, 'builds': 2, 'bytes': 200})
+
+    # A build bigger than the whole cache is still kept (alone), as the build which was just stored.
+    def test_the_new_build_is_never_evicted(self):
+        self.cache = BuildCache(self.path, 50)
+        self.put('a')
+        self.put('b')
+        self.assertEqual(self.keys(), ['b'])
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_stats_are_shared_and_printed(self):
+        self.put('a')
+        self.cache.get('a', os.path.join(self.tmp.name, 'dst'))
+        out = io.StringIO()
+        opts = types.SimpleNamespace(build_cache=self.path)
+        with contextlib.redirect_stdout(out): Cache(make=types.SimpleNamespace(opts=opts)).stats()
+        self.assertEqual(out.getvalue(), 'hits: 1\nmisses: 0\nevictions: 0\nbuilds: 1\nbytes: 100\n')
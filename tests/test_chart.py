@@ -0,0 +1,11 @@
+import os, unittest, yaml
+
+chart = os.path.join(os.path.dirname(__file__), '..', 'helm', 'unity3d-buildkite')
+
+class ValuesTest(unittest.TestCase):
+    def test_each_component_has_only_its_own_keys(self):
+        with open(os.path.join(chart, 'values.yaml')) as f: values = yaml.safe_load(f)
+        for k in ['pullPolicy', 'pauseImage', 'docker']:
+            self.assertIn(k, values['prepull'])
+            self.assertNotIn(k, values['autoscaler'])
+        self.assertEqual(values['autoscaler']['image'], 'python:3.7-slim')
@@ -0,0 +1,119 @@
+import os, json, logging, unittest, tempfile, datetime, collections
+from unittest import mock
+from maker.disk import DiskGC
+from fakes import fake_exe
+
+# `docker system df -v` of an image with two tags (as a layered build leaves it), an image a stopped container
+# still uses, and an untagged image. `docker rmi` records what it was asked to remove, refusing an image ID which
+# has several tags, as Docker does (and any command can be made to fail with $DOCKER_FAIL).
+df = {
+    'Images': [
+        {'ID': 'sha256:app', 'Repository': 'registry/game', 'Tag': 'v1', 'CreatedAt': '2020-01-02 00:00:00 +0000 UTC',
+            'Containers': '0', 'UniqueSize': '300MB', 'Size': '1GB', 'SharedSize': '700MB'},
+        {'ID': 'sha256:app', 'Repository': 'registry/game', 'Tag': 'cache-master',
+            'CreatedAt': '2020-01-02 00:00:00 +0000 UTC', 'Containers': '0', 'UniqueSize': '300MB', 'Size': '1GB',
+            'SharedSize': '700MB'},
+        {'ID': 'sha256:used', 'Repository': 'registry/game', 'Tag': 'v0', 'CreatedAt': '2020-01-01 00:00:00 +0000 UTC',
+            'Containers': '1', 'UniqueSize': '200MB'},
+        {'ID': 'sha256:none', 'Repository': '<none>', 'Tag': '<none>', 'CreatedAt': '2020-01-01 00:00:00 +0000 UTC',
+            'Containers': '0', 'UniqueSize': '50MB'},
+    ],
+    'Containers': [{'ID': 'c1', 'Names': 'old', 'Image': 'registry/game:v0', 'State': 'exited', 'Size': '1MB (virtual 1GB)',
+        'CreatedAt': '2020-01-01 00:00:00 +0000 UTC'}],
+    'BuildCache': [],
+}
+
+fake_docker = '''#!/bin/sh
+if [ "$1" = system ]; then cat "$DOCKER_DF"; exit 0; fi
+if [ "$1" = rmi ] && [ "$2" = sha256:app ]; then echo "image is referenced in multiple repositories" >&2; exit 1; fi
+if [ "$*" = "$DOCKER_FAIL" ]; then exit 1; fi
+echo "$@" >> "$DOCKER_LOG"
+'''
+
+usage = collections.namedtuple('usage', ['total', 'used', 'free'])
+
+def timestamp(s):
+    return datetime.datetime.strptime(s, '%Y-%m-%d').replace(tzinfo=datetime.timezone.utc).timestamp()
+
+class DiskGCTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        bin_dir = os.path.join(self.tmp.name, 'bin')
+        fake_exe(bin_dir, 'docker', fake_docker)
+        self.env = dict(os.environ)
+        os.environ['PATH'] = f'{bin_dir}:{os.environ["PATH"]}'
+        os.environ['DOCKER_DF'] = os.path.join(self.tmp.name, 'df.json')
+        os.environ['DOCKER_LOG'] = os.path.join(self.tmp.name, 'docker.log')
+        with open(os.environ['DOCKER_DF'], 'w') as f: json.dump(df, f)
+        self.gc = DiskGC(logging.getLogger('DiskGC'), ['container', 'dangling', 'image'])
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.env)
+        self.tmp.cleanup()
+
+    def _removed(self):
+        if not os.path.isfile(os.environ['DOCKER_LOG']): return []
+        with open(os.environ['DOCKER_LOG']) as f: return f.read().strip().split('\n')
+
+    def test_an_image_with_several_tags_is_one_item(self):
+        images = [i for i in self.gc.collect() if i['kind'] == 'image']
+        self.assertEqual([(i['name'], i['bytes']) for i in images], [('registry/game:v1, registry/game:cache-master', 300e6)])
+        self.assertTrue(images[0]['remove']())
+        self.assertEqual(self._removed(), ['rmi registry/game:v1 registry/game:cache-master'])
+
+    # A disk of 1GB with 900MB used.
+    def _run(self, watermark, budget = 0, dry_run = False):
+        with mock.patch('shutil.disk_usage', return_value=usage(1e9, 900e6, 100e6)):
+            return self.gc.run(self.tmp.name, watermark, budget, dry_run)
+
+    # 31MB over the budget: the items which cost nothing to lose go first (the biggest of them first), and only
+    # until the budget is met. The image a container still uses is never an item.
+    def test_budget(self):
+        summary = self._run(1, 320e6)
+        self.assertEqual(self._removed(), ['rmi sha256:none'])
+        self.assertEqual(summary, {
+            'reclaimed': {'dangling': {'items': 1, 'bytes': 50e6}},
+            'kept': {'container': {'items': 1, 'bytes': 1e6}, 'image': {'items': 1, 'bytes': 300e6}},
+            'reclaimed_bytes': 50e6, 'kept_bytes': 301e6, 'disk_used': 850e6, 'disk_total': 1e9})
+
+    # Down to 60% of the disk, 300MB must go: the image's bytes are counted once, though it has two tags.
+    def test_watermark(self):
+        summary = self._run(0.6)
+        self.assertEqual(self._removed(), ['rmi sha256:none', 'rm c1', 'rmi registry/game:v1 registry/game:cache-master'])
+        self.assertEqual((summary['reclaimed_bytes'], summary['kept_bytes'], summary['disk_used']), (351e6, 0, 549e6))
+        self.assertEqual(summary['reclaimed']['image'], {'items': 1, 'bytes': 300e6})
+
+    def test_under_the_watermark_nothing_is_evicted(self):
+        summary = self._run(0.95)
+        self.assertEqual(self._removed(), [])
+        self.assertEqual((summary['reclaimed_bytes'], summary['kept_bytes'], summary['disk_used']), (0, 351e6, 900e6))
+
+    # An item which cannot be removed is kept (and not counted), and the next one is evicted instead.
+    def test_failed_removal(self):
+        os.environ['DOCKER_FAIL'] = 'rmi sha256:none'
+        with self.assertLogs('DiskGC', 'WARNING'): summary = self._run(0.6)
+        self.assertEqual(self._removed(), ['rm c1', 'rmi registry/game:v1 registry/game:cache-master'])
+        self.assertEqual(summary['kept'], {'dangling': {'items': 1, 'bytes': 50e6}})
+        self.assertEqual((summary['reclaimed_bytes'], summary['disk_used']), (301e6, 599e6))
+
+    def test_dry_run(self):
+        summary = self._run(0.6, dry_run=True)
+        self.assertEqual(self._removed(), [])
+        self.assertEqual((summary['reclaimed_bytes'], summary['disk_used']), (351e6, 900e6))
+
+    # Staleness is weighed against cost: an artifact a month older than the image goes before it, a fresh one after.
+    def test_rank(self):
+        work = os.path.join(self.tmp.name, 'work')
+        for (fn, day) in [('old', '2019-12-01'), ('new', '2020-02-29')]:
+            os.makedirs(os.path.join(work, 'bin', fn))
+            with open(os.path.join(work, 'bin', fn, 'game.apk'), 'wb') as f: f.write(b'apk')
+            os.utime(os.path.join(work, 'bin', fn), (timestamp(day), timestamp(day)))
+        gc = DiskGC(logging.getLogger('DiskGC'), ['container', 'dangling', 'image', 'artifact'], work)
+        now = timestamp('2020-03-01')
+        self.assertEqual([(i['kind'], i['name'], i['bytes']) for i in gc.rank(gc.collect(now), now)], [
+            ('dangling', 'sha256:none', 50e6),
+            ('container', 'old', 1e6),
+            ('artifact', 'bin/old', 3),
+            ('image', 'registry/game:v1, registry/game:cache-master', 300e6),
+            ('artifact', 'bin/new', 3)])
@@ -0,0 +1,56 @@
+import os, types, logging, unittest, tempfile
+from maker.docker import Docker, player_layer
+from fakes import fake_exe
+
+# A BuildKit build which reuses the engine & data layers, and a push of only the managed layer. The push output
+# names layers by their DiffIDs (of the local image), while the manifest has the digests of the compressed blobs.
+fake_docker = '''#!/bin/sh
+case "$1" in
+build)
+  echo "#6 [3/5] COPY layers/engine/ /usr/local/bin/"; echo "#6 CACHED"
+  echo "#7 [4/5] COPY layers/data/ /usr/local/bin/"; echo "#7 CACHED"
+  echo "#8 [5/5] COPY layers/managed/ /usr/local/bin/"; echo "#8 DONE 0.4s";;
+push)
+  echo "000000000000: Layer already exists"; echo "111111111111: Layer already exists"
+  echo "222222222222: Layer already exists"
+  case "$2" in *cache-*) echo "333333333333: Layer already exists";; *) echo "333333333333: Pushed";; esac;;
+image) echo '["sha256:0000000000000000","sha256:1111111111110000","sha256:2222222222220000","sha256:3333333333330000"]';;
+manifest) echo '{"layers":[{"digest":"sha256:aaaa","size":1000},{"digest":"sha256:bbbb","size":120000000},{"digest":"sha256:cccc","size":400000000},{"digest":"sha256:dddd","size":9000000}]}';;
+esac
+'''
+
+class LayeredBuildTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        fake_exe(os.path.join(self.tmp.name, 'bin'), 'docker', fake_docker)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = f'{os.path.join(self.tmp.name, "bin")}:{self.path}'
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        player = os.path.join('bin', 'StandaloneLinux64', 'game')
+        for rel in ['game', 'UnityPlayer.so', 'game_Data/Managed/Assembly-CSharp.dll', 'game_Data/data.unity3d']:
+            os.makedirs(os.path.dirname(os.path.join(player, rel)), exist_ok=True)
+            with open(os.path.join(player, rel), 'w') as f: f.write(rel)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        os.environ['PATH'] = self.path
+        self.tmp.cleanup()
+
+    def test_player_layers(self):
+        self.assertEqual(player_layer('UnityPlayer.so'), 'engine')
+        self.assertEqual(player_layer('game_Data/Plugins/lib.so'), 'engine')
+        self.assertEqual(player_layer('game_Data/StreamingAssets/a.bundle'), 'data')
+        self.assertEqual(player_layer('game_Data/Managed/Assembly-CSharp.dll'), 'managed')
+        self.assertEqual(player_layer('GameAssembly.so'), 'managed')
+
+    def test_report_shows_pushed_layer_and_bytes(self):
+        opts = types.SimpleNamespace(name='game', platform='StandaloneLinux64', registry='localhost:5000', tag='v1',
+            layered=True, cache_from='', prerelease='master')
+        d = Docker(make=types.SimpleNamespace(opts=opts, release='1.0.0', bin=os.path.join(self.tmp.name, 'ci/bin/')))
+        with self.assertLogs('Docker', level=logging.INFO) as logs: d.build()
+        out = '\n'.join(logs.output)
+        self.assertIn('layer engine       120.0MB  reused, already in the registry', out)
+        self.assertIn('layer managed        9.0MB  rebuilt, pushed', out)
+        self.assertEqual(d.metrics['docker_pushed_bytes'][''], 9000000)
+        self.assertFalse(os.path.isdir(os.path.join('bin', 'StandaloneLinux64', '.docker-layers')))
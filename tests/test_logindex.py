@@ -0,0 +1,76 @@
+import os, json, unittest, tempfile
+from maker.logindex import LogIndex
+
+fixture = os.path.join(os.path.dirname(__file__), 'fixtures', 'unity.log')
+
+class LogIndexTest(unittest.TestCase):
+    def setUp(self):
+        with open(fixture, 'rb') as f: self.data = f.read()
+        self.lines = self.data.split(b'\n')
+
+    # The line number & byte offset (in the fixture) of the line which starts with text.
+    def at(self, text):
+        n = [i for (i, l) in enumerate(self.lines) if l.startswith(text.encode())][0]
+        return (n + 1, len(b''.join([l + b'\n' for l in self.lines[:n]])))
+
+    def check_offsets(self, entries):
+        for e in entries:
+            end = self.data.index(b'\n', e['offset'])
+            self.assertTrue(self.data[e['offset']:end].decode().endswith(e['text']), e)
+            self.assertEqual(self.data[:e['offset']].count(b'\n') + 1, e['line'])
+
+    def test_scan(self):
+        seen = []
+        index = LogIndex.scan(fixture, on_entry=lambda kind, e: seen.append((kind, e['line'])))
+        self.assertEqual((index.lines, index.bytes), (len(self.lines) - 1, len(self.data)))
+        self.assertEqual(index.counts, {'compiler_errors': 2, 'shader_errors': 2, 'exceptions': 3, 'build_markers': 2})
+        self.assertEqual(index.errors(), 7)
+
+        # Repeated compiler errors are one entry, counted.
+        (player, enemy) = index.entries['compiler_errors']
+        self.assertEqual((player['line'], player['offset']), self.at('Assets/Scripts/Player.cs'))
+        self.assertEqual((player['file'], player['source_line'], player['column'], player['code'], player['count']),
+            ('Assets/Scripts/Player.cs', 12, 5, 'CS0103', 3))
+        self.assertEqual(index.format('compiler_errors', player), f'{player["text"]} (x3)')
+        self.assertEqual((enemy['line'], enemy['message'], enemy['count']), (5, '; expected', 1))
+        self.assertEqual(index.format('compiler_errors', enemy), enemy['text'])
+
+        # Offsets are in bytes, past the multi-byte characters before them.
+        (water, fog) = index.entries['shader_errors']
+        self.assertEqual((water['shader'], water['source_line'], water['file'], water['platform']),
+            ('Custom/Wåter', 37, '', 'gles3'))
+        self.assertEqual((fog['line'], fog['offset']), self.at("Shader error in 'Custom/Fog'"))
+        self.assertEqual((fog['file'], fog['source_line'], fog['platform']), ('Assets/Shaders/Fog.cginc', 8, 'vulkan'))
+
+        # Stack traces end at a blank line, a [Build] marker, or the end of the log.
+        (null, missing, build) = index.entries['exceptions']
+        self.assertEqual((null['line'], null['offset']), self.at('NullReferenceException'))
+        self.assertEqual(len(null['stack']), 2)
+        self.assertEqual(index.format('exceptions', null).split('\n'), [null['text']] + null['stack'])
+        self.assertEqual((missing['type'], missing['line'], missing['stack']),
+            ('System.IO.FileNotFoundException', 13, ['  at System.IO.File.Open ()']))
+        self.assertEqual((build['type'], build['message'], build['line'], len(build['stack'])),
+            ('BuildMethodException', '3 errors', 16, 1))
+
+        self.assertEqual([(m['line'], m['text']) for m in index.entries['build_markers']],
+            [(2, '[Build] Starting build for Android'), (15, '[Build] Build failed')])
+        for kind in index.entries: self.check_offsets(index.entries[kind])
+        self.assertEqual(sorted(seen), sorted([(k, e['line']) for k in index.entries for e in index.entries[k]]))
+        self.assertEqual(list(index.tail)[-1], '  at UnityEditor.BuildPlayerWindow+DefaultBuildMethods.BuildPlayer ()')
+
+    # Past max_entries, entries are only counted.
+    def test_max_entries(self):
+        index = LogIndex.scan(fixture, max_entries=1, max_stack=1, max_tail=2)
+        self.assertEqual(dict([(k, len(v)) for (k, v) in index.entries.items()]),
+            {'compiler_errors': 1, 'shader_errors': 1, 'exceptions': 1, 'build_markers': 1})
+        self.assertEqual(index.counts, {'compiler_errors': 2, 'shader_errors': 2, 'exceptions': 3, 'build_markers': 2})
+        self.assertEqual(len(index.entries['exceptions'][0]['stack']), 1)
+        self.assertEqual(len(index.tail), 2)
+
+    def test_write(self):
+        index = LogIndex.scan(fixture)
+        with tempfile.TemporaryDirectory() as tmp:
+            index.write(os.path.join(tmp, 'index.json'))
+            with open(os.path.join(tmp, 'index.json')) as f: data = json.load(f)
+        self.assertEqual(data, json.loads(json.dumps(index.to_json())))
+        self.assertEqual((data['lines'], data['bytes']), (index.lines, index.bytes))
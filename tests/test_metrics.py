@@ -0,0 +1,24 @@
+import os, sys, json, unittest, tempfile, subprocess
+
+make_py = os.path.join(os.path.dirname(__file__), '..', 'docker', 'bin', 'ci', 'make.py')
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp.name, 'bin', 'Android'))
+        with open(os.path.join(self.tmp.name, 'bin', 'Android', 'game.apk'), 'w') as f: f.write('apk')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    # Any maker's metrics are written, by default under bin/metrics/{maker}-{method}.
+    def test_metrics_of_a_maker_without_a_metrics_dir(self):
+        subprocess.run([sys.executable, make_py, 'disk', 'gc', '--kinds', 'artifact', '--dry_run', '--watermark', '0',
+            '--work', self.tmp.name, '--version', '1.0.0', '--commit', 'abc'], check=True, capture_output=True)
+        d = os.path.join(self.tmp.name, 'bin', 'metrics', 'disk-gc')
+        with open(os.path.join(d, 'metrics.json')) as f: data = json.load(f)
+        self.assertEqual(data['labels'], {'maker': 'disk', 'method': 'gc'})
+        self.assertEqual(data['metrics']['disk_reclaimed_bytes']['artifact'], 3)
+        self.assertIn('gc', data['metrics']['phase_seconds'])
+        with open(os.path.join(d, 'metrics.prom')) as f: prom = f.read()
+        self.assertIn('make_disk_reclaimed_bytes{maker="disk",method="gc",name="artifact"} 3', prom)
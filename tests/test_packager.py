@@ -0,0 +1,64 @@
+import os, json, random, hashlib, zipfile, unittest, tempfile
+from maker.packager import Packager
+
+class PackagerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, 'bin')
+        os.makedirs(os.path.join(self.root, 'Android', 'Data', 'Empty'))
+        rnd = random.Random(1)
+        # A compressible file spanning many chunks, an incompressible stored one, an empty one and an executable.
+        self.files = {
+            'Android/game.txt': b''.join([b'line %d of the build log\n' % i for i in range(20000)]),
+            'Android/Data/icon.png': bytes([rnd.randrange(256) for _ in range(100000)]),
+            'Android/Data/empty.txt': b'',
+            'Android/run.sh': b'#!/bin/sh\necho ok\n',
+        }
+        for (name, data) in self.files.items():
+            with open(os.path.join(self.root, name), 'wb') as f: f.write(data)
+        os.chmod(os.path.join(self.root, 'Android', 'run.sh'), 0o755)
+        # Small chunks, so each file is deflated in parallel pieces.
+        self.packager = Packager(jobs = 4, chunk_size = 4096)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def round_trip(self, fmt):
+        dst = os.path.join(self.tmp.name, f'game.{fmt}')
+        manifest_fp = os.path.join(self.tmp.name, 'manifest.json')
+        manifest = self.packager.package(fmt, self.root, ['Android'], dst, manifest_fp)
+        with open(manifest_fp) as f: self.assertEqual(json.load(f), manifest)
+        self.assertEqual(manifest['size'], os.path.getsize(dst))
+        self.assertEqual(manifest['files'], dict([(name, {'size': len(data),
+            'sha256': hashlib.sha256(data).hexdigest(), 'stored': name.endswith('.png')})
+            for (name, data) in self.files.items()]))
+        out = os.path.join(self.tmp.name, 'out')
+        self.packager.extract(fmt, dst, out)
+        for (name, data) in self.files.items():
+            with open(os.path.join(out, name), 'rb') as f: self.assertEqual(f.read(), data)
+        self.assertTrue(os.path.isdir(os.path.join(out, 'Android', 'Data', 'Empty')))
+        self.assertEqual(os.stat(os.path.join(out, 'Android', 'run.sh')).st_mode & 0o777, 0o755)
+        return dst
+
+    def test_zip(self):
+        dst = self.round_trip('zip')
+        with zipfile.ZipFile(dst) as z:
+            self.assertIsNone(z.testzip())
+            infos = dict([(i.filename, i) for i in z.infolist()])
+        self.assertEqual(infos['Android/game.txt'].compress_type, zipfile.ZIP_DEFLATED)
+        self.assertLess(infos['Android/game.txt'].compress_size, len(self.files['Android/game.txt']) // 4)
+        self.assertEqual(infos['Android/Data/icon.png'].compress_type, zipfile.ZIP_STORED)
+
+    def test_tar_zst(self):
+        self.round_trip('tar.zst')
+
+    # More entries than the zip's end of central directory can count need its zip64 form.
+    def test_zip64_entry_count(self):
+        d = os.path.join(self.root, 'Many')
+        os.makedirs(d)
+        for i in range(0xFFFF): open(os.path.join(d, f'{i}.txt'), 'w').close()
+        dst = os.path.join(self.tmp.name, 'many.zip')
+        Packager(jobs = 4).package('zip', self.root, ['Many'], dst)
+        with zipfile.ZipFile(dst) as z:
+            self.assertIsNone(z.testzip())
+            self.assertEqual(len(z.infolist()), 0xFFFF + 1)
@@ -0,0 +1,74 @@
+import os, types, shutil, unittest, tempfile
+from maker.unity import Unity
+from maker.pods import PodCache
+from fakes import fake_exe
+
+# A stand-in for CocoaPods which only installs (and counts the install in $POD_INSTALLS) when Pods/ does not already
+# match the Podfile.lock, as `pod install` does; an install fetches the spec repos, if they are missing.
+fake_pod = '''#!/bin/sh
+if [ "$1" = "--version" ]; then echo 1.9.1; exit 0; fi
+dir=$(echo "$2" | sed 's/--project-directory=//')
+repos=${CP_HOME_DIR}/repos
+if [ -f "$dir/Pods/Manifest.lock" ] && cmp -s "$dir/Pods/Manifest.lock" "$dir/Podfile.lock"; then
+  echo "Pod installation complete (cached)"; exit 0
+fi
+echo install >> "$POD_INSTALLS"
+[ -d "$repos/trunk" ] || { mkdir -p "$repos/trunk"; echo specs > "$repos/trunk/Specs"; echo repos >> "$POD_INSTALLS"; }
+mkdir -p "$dir/Pods/Firebase"; echo lib > "$dir/Pods/Firebase/lib.a"
+[ -f "$dir/Podfile.lock" ] || cksum "$dir/Podfile" > "$dir/Podfile.lock"
+cp "$dir/Podfile.lock" "$dir/Pods/Manifest.lock"
+echo "Pod installation complete"
+'''
+
+class PodCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        bin_dir = os.path.join(self.tmp.name, 'bin')
+        fake_exe(bin_dir, 'pod', fake_pod)
+        self.env = dict(os.environ)
+        os.environ['PATH'] = f'{bin_dir}:{os.environ["PATH"]}'
+        os.environ['CP_HOME_DIR'] = os.path.join(self.tmp.name, 'cocoapods')
+        os.environ['POD_INSTALLS'] = os.path.join(self.tmp.name, 'installs')
+        self.cache_dir = os.path.join(self.tmp.name, 'cache')
+        opts = types.SimpleNamespace(pod_cache=self.cache_dir, pod_cache_size=1)
+        self.unity = Unity(make=types.SimpleNamespace(opts=opts))
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.env)
+        self.tmp.cleanup()
+
+    # A fresh checkout of the Xcode project (on a fresh agent, without the spec repos), and pod install in it.
+    def _install(self, name, podfile, lock = None):
+        shutil.rmtree(os.environ['CP_HOME_DIR'], ignore_errors=True)
+        ios_dir = os.path.join(self.tmp.name, name)
+        os.makedirs(ios_dir)
+        with open(os.path.join(ios_dir, 'Podfile'), 'w') as f: f.write(podfile)
+        if lock:
+            with open(os.path.join(ios_dir, 'Podfile.lock'), 'w') as f: f.write(lock)
+        with self.assertLogs('Unity', level='INFO') as logs: self.unity._pod_install(ios_dir, self.tmp.name)
+        self.assertTrue(os.path.isfile(os.path.join(ios_dir, 'Pods', 'Firebase', 'lib.a')))
+        with open(os.environ['POD_INSTALLS']) as f: installs = f.read().split()
+        os.remove(os.environ['POD_INSTALLS'])
+        return ([l for l in logs.output if 'Pod cache hit' in l or 'Pod cache miss' in l], installs)
+
+    def test_miss_then_hit_then_lockfile_change(self):
+        open(os.environ['POD_INSTALLS'], 'w').close()
+        (logs, installs) = self._install('a', "pod 'Firebase'\n")
+        self.assertIn('Pod cache miss', logs[0])
+        self.assertEqual(installs, ['install', 'repos'])
+        self.assertEqual(PodCache(self.cache_dir, 1e9).stats()['installs'], 1)
+
+        # The same Podfile restores Pods/ (and the spec repos), so pod has nothing to install.
+        open(os.environ['POD_INSTALLS'], 'w').close()
+        (logs, installs) = self._install('b', "pod 'Firebase'\n")
+        self.assertIn('Pod cache hit', logs[0])
+        self.assertIn('and the spec repos', logs[0])
+        self.assertEqual(installs, [])
+
+        # A changed Podfile.lock is another key: pods are installed (with the restored spec repos) and stored again.
+        open(os.environ['POD_INSTALLS'], 'w').close()
+        (logs, installs) = self._install('c', "pod 'Firebase'\n", 'PODS:\n  - Firebase (6.0.0)\n')
+        self.assertIn('Pod cache miss', logs[0])
+        self.assertEqual(installs, ['install'])
+        self.assertEqual(PodCache(self.cache_dir, 1e9).stats()['installs'], 2)
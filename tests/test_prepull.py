@@ -0,0 +1,123 @@
+import os, json, tempfile, threading, unittest, urllib.parse, http.server, socketserver
+from prepull import Docker, Prepuller, read_tags, init_pulls
+
+repo = 'inzania/unity3d-buildkite'
+
+# The Docker Engine API on a Unix socket, with a few images: a stale one, a stale one a container still uses, one
+# left untagged when its tag moved, one of another repository, and one which is kept warm. A pull of a missing tag
+# adds it; a pull of a tag with "bad" in it fails mid-stream.
+class FakeDocker():
+    def __init__(self, sock_fp):
+        self.images = dict([(i['Id'], i) for i in [
+            {'Id': 'sha256:old', 'RepoTags': [f'{repo}:2019.1.0f1-ios'], 'Size': 5e9},
+            {'Id': 'sha256:busy', 'RepoTags': [f'{repo}:2019.1.0f1'], 'Size': 4e9},
+            {'Id': 'sha256:moved', 'RepoTags': ['<none>:<none>'], 'RepoDigests': [f'{repo}@sha256:x'], 'Size': 3e9},
+            {'Id': 'sha256:other', 'RepoTags': ['python:3.7-slim'], 'Size': 1e8},
+            {'Id': 'sha256:warm', 'RepoTags': [f'{repo}:2019.2.18f1-android'], 'Size': 6e9}]])
+        self.pulls = []
+        fake = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args): pass
+            def _send(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            def do_GET(self):
+                path = urllib.parse.urlparse(self.path).path
+                if path == '/images/json': return self._send(200, list(fake.images.values()))
+                if path == '/containers/json': return self._send(200, [{'ImageID': 'sha256:busy'}])
+                name = path[len('/images/'):-len('/json')]
+                for i in fake.images.values():
+                    if name in i['RepoTags']: return self._send(200, i)
+                self._send(404, {'message': 'no such image'})
+            def do_POST(self):
+                q = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+                tag = f'{q["fromImage"][0]}:{q["tag"][0]}'
+                fake.pulls.append(tag)
+                self.send_response(200)
+                self.end_headers()
+                if 'bad' in tag:
+                    self.wfile.write(b'{"status":"Pulling"}\n{"error":"manifest unknown"}\n')
+                    return
+                if not any(tag in i['RepoTags'] for i in fake.images.values()):
+                    fake.images[f'sha256:{tag}'] = {'Id': f'sha256:{tag}', 'RepoTags': [tag], 'Size': 7e9}
+                self.wfile.write(b'{"status":"Pulling"}\n{"status":"Done"}\n')
+            def do_DELETE(self):
+                fake.images.pop(self.path[len('/images/'):])
+                self._send(200, [])
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+            def get_request(self):
+                (req, addr) = super().get_request()
+                return (req, ('local', 0))
+        self.server = Server(sock_fp, Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+class PrepullerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        sock = os.path.join(self.tmp.name, 'docker.sock')
+        self.fake = FakeDocker(sock)
+        self.docker = Docker(sock)
+        self.state = os.path.join(self.tmp.name, 'state.json')
+
+    def tearDown(self):
+        self.fake.server.shutdown()
+        self.fake.server.server_close()
+        self.tmp.cleanup()
+
+    def test_pulls_missing_keeps_warm_and_removes_stale(self):
+        p = Prepuller(self.docker, repo, ['2019.2.18f1-android', '2019.2.18f1-ios'], 'node-1', self.state)
+        p.step()
+        self.assertEqual(self.fake.pulls, [f'{repo}:2019.2.18f1-android', f'{repo}:2019.2.18f1-ios'])
+        self.assertEqual(sorted(self.fake.images), sorted(['sha256:busy', 'sha256:other', 'sha256:warm',
+            f'sha256:{repo}:2019.2.18f1-ios']))
+        with open(self.state) as f: state = json.load(f)
+        self.assertEqual(list(state['pulls']), [f'{repo}:2019.2.18f1-ios'])
+        self.assertEqual((state['pulled_bytes'], state['reclaimed_bytes']), (7e9, 8e9))
+        metrics = p.prometheus()
+        self.assertIn(f'unity_prepull_warm{{node="node-1",image="{repo}:2019.2.18f1-ios"}} 1', metrics)
+        self.assertIn('unity_prepull_reclaimed_bytes_total{node="node-1"} 8000000000', metrics)
+
+        # The totals carry across restarts, and a second pass pulls nothing new.
+        p = Prepuller(self.docker, repo, ['2019.2.18f1-android', '2019.2.18f1-ios'], 'node-1', self.state)
+        p.step()
+        self.assertEqual(p.state['pulled_bytes'], 7e9)
+
+    def test_failed_pull_raises(self):
+        p = Prepuller(self.docker, repo, ['bad'], 'node-1', gc=False)
+        with self.assertRaisesRegex(Exception, 'manifest unknown'): p.step()
+        self.assertEqual(len(self.fake.images), 5)
+
+    def test_read_tags(self):
+        fp = os.path.join(self.tmp.name, 'tags')
+        with open(fp, 'w') as f: f.write('# pushed\n2019.2.18f1\n\nlatest-ios\n')
+        self.assertEqual(read_tags(fp), ['2019.2.18f1', 'latest-ios'])
+        with open(fp, 'w') as f: json.dump([f'{repo}:latest'], f)
+        self.assertEqual(read_tags(fp), [f'{repo}:latest'])
+
+    def test_records_the_init_containers_pulls_once_per_pod(self):
+        images = [f'{repo}:2019.2.18f1-android', f'{repo}:2019.2.18f1-ios']
+        for i in images: self.fake.images[f'sha256:{i}'] = {'Id': f'sha256:{i}', 'RepoTags': [i], 'Size': 7e9}
+        # The android image was already on the node; the ios one took 200s to pull.
+        pod = {
+            'metadata': {'uid': 'pod-1'},
+            'spec': {'initContainers': [{'name': 'pull-0', 'image': images[0]}, {'name': 'pull-1', 'image': images[1]}]},
+            'status': {'startTime': '2020-01-01T00:00:00Z', 'initContainerStatuses': [
+                {'name': 'pull-0', 'state': {'terminated': {'startedAt': '2020-01-01T00:00:01Z', 'finishedAt': '2020-01-01T00:00:01Z'}}},
+                {'name': 'pull-1', 'state': {'terminated': {'startedAt': '2020-01-01T00:03:21Z', 'finishedAt': '2020-01-01T00:03:22Z'}}}]}
+        }
+        self.assertEqual(init_pulls(pod), [(images[0], 1), (images[1], 200)])
+        p = Prepuller(self.docker, repo, ['2019.2.18f1-android', '2019.2.18f1-ios'], 'node-1', self.state)
+        p.record_init_pulls(pod)
+        p.step()
+        self.assertEqual(self.fake.pulls, images)
+        self.assertEqual((p.state['saved_seconds'], p.state['pulled_bytes']), (200, 7e9))
+        self.assertEqual(list(p.state['pulls']), [images[1]])
+
+        # A restarted sidecar in the same pod does not count them again.
+        p = Prepuller(self.docker, repo, ['2019.2.18f1-android', '2019.2.18f1-ios'], 'node-1', self.state)
+        p.record_init_pulls(pod)
+        self.assertEqual(p.state['saved_seconds'], 200)
@@ -0,0 +1,57 @@
+import os, io, json, unittest, tempfile, contextlib
+from scaler import Scaler, DryRunKube
+
+config = {
+    'scaleUpCooldown': 60,
+    'scaleDownCooldown': 600,
+    'modules': {
+        'linux': {'deployment': 'agent-linux', 'queue': 'unity', 'min': 1, 'max': 4},
+        'ios': {'deployment': 'agent-ios', 'queue': 'unity-ios', 'min': 0, 'max': 2}
+    }
+}
+
+# Drives the scaler with canned payloads of the Buildkite metrics API (its jobs.queues), as a local file.
+class ScalerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.metrics = os.path.join(self.tmp.name, 'metrics.json')
+        self.kube = DryRunKube()
+        self.scaler = Scaler(config, self.kube, 'token', self.metrics)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    # Poll the given queues at time now, and return the replicas of each deployment.
+    def _step(self, now, queues):
+        with open(self.metrics, 'w') as f: json.dump({'jobs': {'queues': queues}}, f)
+        with contextlib.redirect_stdout(io.StringIO()): self.scaler.step(now)
+        return (self.kube.replicas('agent-linux'), self.kube.replicas('agent-ios'))
+
+    def test_scale_up_and_clamp(self):
+        # Raised to min straight away, which starts the cooldown.
+        self.assertEqual(self._step(1000, {}), (1, 0))
+        # Up to the jobs (clamped to max), once the cooldown since the module's last change has passed.
+        self.assertEqual(self._step(1010, {'unity': {'scheduled': 2, 'running': 1}, 'unity-ios': {'scheduled': 5}}), (1, 2))
+        self.assertEqual(self._step(1060, {'unity': {'scheduled': 2, 'running': 1}, 'unity-ios': {'scheduled': 5}}), (3, 2))
+        self.assertEqual(self._step(1200, {'unity': {'scheduled': 9, 'running': 3}, 'unity-ios': {'running': 2}}), (4, 2))
+        g = self.scaler.gauges['linux']
+        self.assertEqual((g['scheduled'], g['running'], g['desired'], g['replicas']), (9, 3, 4, 4))
+
+    def test_scale_down_after_cooldown(self):
+        self.kube.counts = {'agent-linux': 4, 'agent-ios': 2}
+        self.assertEqual(self._step(1000, {}), (4, 2))
+        self.assertEqual(self._step(1300, {'unity': {'running': 2}}), (4, 2))
+        # A job arriving resets the wait.
+        self.assertEqual(self._step(1400, {'unity': {'running': 4}, 'unity-ios': {'running': 2}}), (4, 2))
+        self.assertEqual(self._step(1700, {'unity': {'running': 2}}), (4, 2))
+        self.assertEqual(self._step(2300, {'unity': {'running': 2}}), (2, 0))
+        # Never below min.
+        self.assertEqual(self._step(3000, {}), (2, 0))
+        self.assertEqual(self._step(3000 + 600, {}), (1, 0))
+        self.assertIn('unity_scaler_scale_events_total{module="linux",direction="down"} 2', self.scaler.prometheus())
+
+    def test_out_of_bounds_is_corrected_at_once(self):
+        self.kube.counts = {'agent-linux': 9, 'agent-ios': 0}
+        self.assertEqual(self._step(1000, {'unity': {'scheduled': 9}}), (4, 0))
+        self.kube.counts['agent-linux'] = 0
+        self.assertEqual(self._step(1001, {}), (1, 0))
@@ -0,0 +1,120 @@
+import os, sys, json, types, shutil, unittest, tempfile
+from maker.unity import Unity
+from maker.logindex import LogIndex, max_line_length
+from fakes import fake_exe
+
+# A make.py which records the arguments each platform's build was run with (and where), and succeeds.
+fake_make = '''#!/usr/bin/env python3
+import os, sys, json
+with open(os.path.join(os.environ['ARGS_DIR'], sys.argv[3] + '.json'), 'w') as f:
+    json.dump({'args': sys.argv[1:], 'cwd': os.getcwd(), 'git': os.path.isdir('.git')}, f)
+'''
+
+class BuildTargetsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.work = os.path.join(self.tmp.name, 'project')
+        os.makedirs(os.path.join(self.work, '.git'))
+        os.makedirs(os.path.join(self.work, 'Library'))
+        os.makedirs(os.path.join(self.tmp.name, 'args'))
+        os.environ['ARGS_DIR'] = os.path.join(self.tmp.name, 'args')
+        self.argv = sys.argv
+        sys.argv = ['make.py', 'unity', 'build', 'StandaloneLinux64,Android,iOS', '--jobs', '2']
+
+    def tearDown(self):
+        sys.argv = self.argv
+        del os.environ['ARGS_DIR']
+        self.tmp.cleanup()
+
+    def test_children_get_the_resolved_version_and_copies_are_removed(self):
+        opts = types.SimpleNamespace(platform='StandaloneLinux64,Android,iOS', work=self.work, jobs=2, job_memory=8,
+            unity_bin=os.path.join(self.tmp.name, 'bin'), version='1.2.3', commit='abc123', prerelease='feature',
+            build='42', name='game')
+        fp = fake_exe(self.tmp.name, 'make.py', fake_make)
+        u = Unity(make=types.SimpleNamespace(opts=opts, fp=fp, semver='1.2.3-feature+42'))
+        # Build in parallel whatever the cores & memory of the machine running the test.
+        u._max_parallel = lambda count: count
+        u._build_targets(['StandaloneLinux64', 'Android', 'iOS'])
+        for p in ['StandaloneLinux64', 'Android', 'iOS']:
+            with open(os.path.join(self.tmp.name, 'args', f'{p}.json')) as f: run = json.load(f)
+            args = run['args']
+            # The last of a repeated option wins.
+            for (opt, v) in [('--version', '1.2.3'), ('--commit', 'abc123'), ('--prerelease', 'feature'), ('--build', '42')]:
+                self.assertEqual(args[len(args) - 1 - args[::-1].index(opt) + 1], v)
+            self.assertEqual(run['cwd'], self.work if p == 'StandaloneLinux64' else os.path.join(self.work, 'Temp', 'platforms', p))
+            if p != 'StandaloneLinux64': self.assertFalse(run['git'])
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ['args', 'bin', 'make.py', 'project'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.work, 'Temp'))), [])
+
+class LibrarySnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.work = os.path.join(self.tmp.name, 'project')
+        self.cache = os.path.join(self.tmp.name, 'cache')
+        os.makedirs(self.work)
+        opts = types.SimpleNamespace(work=self.work, cache_dir=self.cache, prerelease='feature/x')
+        self.unity = Unity(make=types.SimpleNamespace(opts=opts))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _snapshots(self):
+        d = os.path.join(self.cache, 'library')
+        return sorted(os.listdir(d)) if os.path.isdir(d) else []
+
+    def test_no_library_no_snapshot(self):
+        self.unity._save_library('abc')
+        self.assertEqual(self._snapshots(), [])
+
+    def test_snapshot_and_restore(self):
+        os.makedirs(os.path.join(self.work, 'Library'))
+        with open(os.path.join(self.work, 'Library', 'ArtifactDB'), 'w') as f: f.write('db')
+        self.unity._save_library('abc')
+        self.assertEqual(self._snapshots(), ['feature_x.sha1', 'feature_x.tar'])
+        shutil.rmtree(os.path.join(self.work, 'Library'))
+        self.unity._restore_library()
+        self.assertTrue(os.path.isfile(os.path.join(self.work, 'Library', 'ArtifactDB')))
+
+    def test_failed_snapshot_leaves_no_partial_archive(self):
+        os.makedirs(os.path.join(self.work, 'Library'))
+        with open(os.path.join(self.work, 'Library', 'ArtifactDB'), 'w') as f: f.write('db')
+        # A tar which writes part of the archive, then fails (as when the disk fills up).
+        bin_dir = os.path.join(self.tmp.name, 'bin')
+        fake_exe(bin_dir, 'tar', '#!/bin/sh\necho partial > "$2"\necho "No space left on device" >&2\nexit 2\n')
+        path = os.environ['PATH']
+        os.environ['PATH'] = f'{bin_dir}:{path}'
+        try:
+            with self.assertLogs('Unity', level='ERROR'): self.unity._save_library('abc')
+        finally:
+            os.environ['PATH'] = path
+        self.assertEqual(self._snapshots(), [])
+
+class LogTailTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log = os.path.join(self.tmp.name, 'unity.log')
+        # A progress bar which never ends its line, then an exception and a timing.
+        self.bar = b'#' * (5 * max_line_length + 10)
+        with open(self.log, 'wb') as f:
+            f.write(self.bar + b'\nNullReferenceException: boom\n  at Game.Build ()\n\nRefresh completed in 1.5 seconds\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _check(self, index):
+        self.assertEqual(index.lines, 5)
+        # Only the end of the progress bar is kept.
+        self.assertEqual(index.tail[0], '#' * (max_line_length - 1))
+        e = index.entries['exceptions'][0]
+        self.assertEqual((e['line'], e['offset'], e['stack']), (2, len(self.bar) + 1, ['  at Game.Build ()']))
+        self.assertEqual(index.bytes, os.path.getsize(self.log))
+
+    def test_long_lines_are_read_in_bounded_chunks(self):
+        u = Unity(make=types.SimpleNamespace(opts=types.SimpleNamespace()))
+        index = LogIndex()
+        u._tail_log(self.log, types.SimpleNamespace(poll=lambda: 0), index)
+        self._check(index)
+        self.assertEqual(u.metrics['unity_log_seconds']['asset_refresh'], 1.5)
+
+    def test_scan_reads_long_lines_in_bounded_chunks(self):
+        self._check(LogIndex.scan(self.log))
@@ -0,0 +1,98 @@
+import os, time, logging, threading, unittest, tempfile
+from maker.worker import WorkerPool
+from fakes import fake_exe
+
+# An editor which speaks the protocol of UnityCI/Worker.cs: it beats every 0.1s while idle (but not while building),
+# builds each {id}.req by sleeping for its "seconds" and answering with its "error", and quits on "stop" (taking
+# $STOP_DELAY seconds to). It records when it comes up & goes down in $EDITOR_EVENTS.
+fake_unity = '''#!/usr/bin/env python3
+import os, sys, time
+d = sys.argv[sys.argv.index('-workerDir') + 1]
+def event(e):
+    with open(os.environ['EDITOR_EVENTS'], 'a') as f: f.write(f'{e} {d} {time.time()}\\n')
+def beat():
+    with open(os.path.join(d, 'heartbeat'), 'w') as f: f.write(str(time.time()))
+event('up')
+while not os.path.isfile(os.path.join(d, 'stop')):
+    beat()
+    for fn in sorted(fn for fn in os.listdir(d) if fn.endswith('.req')):
+        with open(os.path.join(d, fn)) as f: args = dict(l.strip().split('=', 1) for l in f if '=' in l)
+        os.remove(os.path.join(d, fn))
+        time.sleep(float(args.get('seconds', '0')))
+        beat()
+        with open(os.path.join(d, 'res.tmp'), 'w') as f: f.write(args.get('error', ''))
+        os.replace(os.path.join(d, 'res.tmp'), os.path.join(d, fn[:-4] + '.res'))
+    time.sleep(0.1)
+time.sleep(float(os.environ.get('STOP_DELAY', '0')))
+event('down')
+'''
+
+class WorkerPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.unity = fake_exe(self.tmp.name, 'Unity', fake_unity)
+        self.events = os.path.join(self.tmp.name, 'events')
+        os.environ['EDITOR_EVENTS'] = self.events
+        self.pools = []
+
+    def tearDown(self):
+        for pool in self.pools: pool.stop()
+        del os.environ['EDITOR_EVENTS']
+        os.environ.pop('STOP_DELAY', None)
+        self.tmp.cleanup()
+
+    def _pool(self, **kwargs):
+        pool = WorkerPool(self.unity, os.path.join(self.tmp.name, 'pool'), log=logging.getLogger('WorkerPool'), **kwargs)
+        self.pools.append(pool)
+        return pool
+
+    def _build(self, pool, project, seconds = 0, error = ''):
+        return pool.build(project, {'seconds': seconds, 'error': error}, os.path.join(self.tmp.name, 'build.log'))
+
+    def test_warm_builds_reuse_the_editor(self):
+        pool = self._pool()
+        self.assertFalse(self._build(pool, '/a')['warm'])
+        res = self._build(pool, '/a')
+        self.assertTrue(res['ok'] and res['warm'])
+        self.assertEqual(res['builds'], 2)
+
+    def test_a_long_failed_build_keeps_its_editor(self):
+        pool = self._pool(health_timeout=0.5)
+        self._build(pool, '/a')
+        pid = pool.editors['/a'].proc.pid
+        res = self._build(pool, '/a', seconds=1.5, error='compile errors')
+        self.assertEqual((res['ok'], res['error']), (False, 'compile errors'))
+        self.assertEqual(pool.editors['/a'].proc.pid, pid)
+        self.assertEqual(pool.editors['/a'].builds, 2)
+
+    def test_a_full_pool_waits_for_an_idle_editor(self):
+        pool = self._pool(max_editors=1)
+        results = {}
+        def run(project, seconds):
+            results[project] = self._build(pool, project, seconds)
+        threads = [threading.Thread(target=run, args=('/a', 1))]
+        threads[0].start()
+        time.sleep(0.5)
+        threads.append(threading.Thread(target=run, args=('/b', 0)))
+        threads[1].start()
+        for t in threads: t.join()
+        self.assertTrue(results['/a']['ok'] and results['/b']['ok'])
+        self.assertEqual(list(pool.editors), ['/b'])
+        # The editor for /b only came up once the one for /a had gone down.
+        with open(self.events) as f: events = [l.split(' ')[0] for l in f.read().strip().split('\n')]
+        self.assertEqual(events, ['up', 'down', 'up'])
+
+    def test_the_pool_answers_while_an_editor_is_stopped(self):
+        os.environ['STOP_DELAY'] = '1.5'
+        pool = self._pool(max_editors=1)
+        self._build(pool, '/a')
+        t = threading.Thread(target=self._build, args=(pool, '/b'))
+        t.start()
+        time.sleep(0.5)
+        # /a is being stopped to make room for /b; the pool's status does not wait for it.
+        start = time.time()
+        status = pool.status()
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(list(status), [])
+        t.join()
+        self.assertEqual(list(pool.status()), ['/b'])